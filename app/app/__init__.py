@@ -7,6 +7,7 @@ import flask_sqlalchemy as fs
 
 from app import config
 from app import encoder
+from app import pool
 
 
 app = flask.Flask(__name__)
@@ -14,8 +15,12 @@ app.config.from_object(config.ProdConfig)
 app.json_encoder = encoder.CustomJSONEncoder
 
 blueprint = flask.Blueprint('common', __name__)
-db = fs.SQLAlchemy(app)
+db = fs.SQLAlchemy(app, engine_options=dict(
+    poolclass=pool.MeteredQueuePool,
+    connect_args=dict(cursor_factory=pool.CountingCursor),
+))
 
+from app import instrumentation
 from app import handlers
 
 app.register_blueprint(blueprint)
@@ -0,0 +1,459 @@
+"""
+Price difference analytics backends. Calculate 'open', 'high', 'low' and 'close' price differences
+for all the pairs of dates within a date window. The pairs may be restricted to the ones with the difference
+of at least 'min_diff' and the dates at most 'max_span_days' apart, and to 'top' largest differences per price type.
+The restrictions are applied while the pairs are generated so the full pair set is never built.
+The SQL backend reads the price series from 'quote_price' materialized view refreshed by the data fetcher
+(see :py:func:`refresh_price_view`).
+"""
+
+import collections
+import datetime
+import itertools
+import textwrap
+
+import numpy as np
+import sqlalchemy
+
+from app import app
+from app import db
+from app import models
+from app import prepared
+from app import store
+from app import timeout
+
+
+PRICE_TYPES = ('open', 'close', 'high', 'low')
+
+QUANTILES = (0.25, 0.5, 0.75)
+
+# the span of the whole date range, larger spans don't restrict the pairs and overflow the date ordinals
+MAX_SPAN_DAYS = datetime.date.max.toordinal() - datetime.date.min.toordinal()
+
+AnalyticsRow = collections.namedtuple(
+    'AnalyticsRow', ('start_date', 'end_date', 'start_price', 'end_price', 'price_type', 'price_diff')
+)
+
+SummaryRow = collections.namedtuple(
+    'SummaryRow', ('price_type', 'count', 'min_diff', 'max_diff', 'mean_diff', 'q25_diff', 'median_diff', 'q75_diff')
+)
+
+PRICE_COLUMNS = [getattr(models.Quote, price_type + '_price') for price_type in PRICE_TYPES]
+
+WINDOW_QUERY = prepared.PreparedQuery(
+    'analytics_window',
+    sqlalchemy.select([models.Quote.date, *PRICE_COLUMNS]).
+    where(models.Quote.stock_id == sqlalchemy.bindparam('stock_id')).
+    where(models.Quote.date.between(sqlalchemy.bindparam('date_from'), sqlalchemy.bindparam('date_to'))).
+    order_by(models.Quote.date)
+)
+
+
+def load_window(stock_id, date_from, date_to):
+    """
+    Loads the stock prices within the date window into arrays. The prices are taken from the quote store
+    if it is enabled.
+
+    :param stock_id: stock identifier
+    :param date_from: window start date (inclusive)
+    :param date_to: window end date (inclusive)
+    :return: tuple of dates list and dict of price arrays by price type
+    """
+
+    stock_quotes = store.quotes.get(stock_id)
+    if stock_quotes is not None:
+        start, stop = stock_quotes.find_range(date_from, date_to)
+        return stock_quotes.dates(start, stop), {
+            price_type: stock_quotes.columns[price_type + '_price'][start:stop] for price_type in PRICE_TYPES
+        }
+
+    rows = WINDOW_QUERY.execute(stock_id=stock_id, date_from=date_from, date_to=date_to).fetchall()
+
+    dates = [row[0] for row in rows]
+    prices = np.array([row[1:] for row in rows], dtype=np.float64).reshape(len(rows), len(PRICE_TYPES))
+
+    return dates, {price_type: prices[:, idx] for idx, price_type in enumerate(PRICE_TYPES)}
+
+
+def get_ordinals(dates):
+    """
+    :return: int32 array of the date ordinals
+    """
+
+    return np.fromiter((date.toordinal() for date in dates), dtype=np.int32, count=len(dates))
+
+
+def count_pairs(size, ordinals=None, max_span_days=None):
+    """
+    Counts the ordered pairs (start < end) of the window dates without building them.
+
+    :param size: number of the window dates
+    :param ordinals: date ordinals array (required if 'max_span_days' is set)
+    :param max_span_days: maximum number of days between the pair dates (unlimited if None)
+    :return: number of pairs per price type
+    """
+
+    if max_span_days is None:
+        return size * (size - 1) // 2
+
+    ends_stop = np.searchsorted(ordinals, ordinals.astype(np.int64) + max_span_days, 'right')
+
+    return int((ends_stop - np.arange(1, size + 1)).sum())
+
+
+def check_pairs_limit(dates, ordinals=None, max_span_days=None):
+    """
+    Checks the number of window pairs against 'ANALYTICS_MAX_PAIRS' configuration parameter.
+
+    :raises ComputeLimitExceeded: if there are too many pairs
+    """
+
+    timeout.check_compute_limit('ANALYTICS_MAX_PAIRS', count_pairs(len(dates), ordinals, max_span_days))
+
+
+def iter_pair_blocks(prices, ordinals=None, min_diff=None, max_span_days=None, block_size=256):
+    """
+    Iterates over the ordered pairs (start < end) of the price array by blocks of start indices
+    computing the differences with broadcasting. If 'max_span_days' is set only the end indices
+    within the span of the block starts are considered.
+
+    :param prices: price array
+    :param ordinals: date ordinals array (required if 'max_span_days' is set)
+    :param min_diff: minimum price difference of a pair (unlimited if None)
+    :param max_span_days: maximum number of days between the pair dates (unlimited if None)
+    :param block_size: number of start indices processed at once
+    :return: generator of (start indices, end indices, price differences) arrays
+    """
+
+    size = len(prices)
+    for block_start in range(0, size, block_size):
+        block_stop = min(block_start + block_size, size)
+        ends_stop = size
+        if max_span_days is not None:
+            ends_stop = int(np.searchsorted(ordinals, ordinals[block_stop - 1] + max_span_days, 'right'))
+
+        starts = np.arange(block_start, block_stop)
+        ends = np.arange(block_start + 1, ends_stop)
+        mask = starts[:, np.newaxis] < ends[np.newaxis, :]
+        diffs = np.abs(prices[starts][:, np.newaxis] - prices[ends][np.newaxis, :])
+
+        if max_span_days is not None:
+            mask &= ordinals[ends][np.newaxis, :] - ordinals[starts][:, np.newaxis] <= max_span_days
+        if min_diff is not None:
+            mask &= diffs >= min_diff
+
+        start_idx, end_idx = np.nonzero(mask)
+        yield starts[start_idx], ends[end_idx], diffs[start_idx, end_idx]
+
+
+def select_top(blocks, top):
+    """
+    Selects the pairs with the largest differences. At most 'top' pairs and a block are kept in memory:
+    the block pairs which are not less than the current selection minimum are merged with the selection
+    which is then cut down to 'top' pairs.
+
+    :param blocks: iterable of (start indices, end indices, price differences) arrays
+    :param top: number of pairs to be selected
+    :return: tuple of start indices, end indices and price differences arrays ordered by the difference
+        (descending), start and end indices
+    """
+
+    starts, ends, diffs = np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0)
+
+    for block in blocks:
+        if len(diffs) == top:
+            selected = block[2] >= diffs.min()
+            block = tuple(array[selected] for array in block)
+
+        starts, ends, diffs = (np.concatenate(arrays) for arrays in zip((starts, ends, diffs), block))
+        if len(diffs) <= top:
+            continue
+
+        threshold = np.partition(diffs, len(diffs) - top)[len(diffs) - top]
+        selected = np.nonzero(diffs >= threshold)[0]
+        selected = selected[np.lexsort((ends[selected], starts[selected], -diffs[selected]))[:top]]
+        starts, ends, diffs = starts[selected], ends[selected], diffs[selected]
+
+    order = np.lexsort((ends, starts, -diffs))
+
+    return starts[order], ends[order], diffs[order]
+
+
+def get_analytics_numpy(stock_id, date_from, date_to, limit=None, top=None, min_diff=None, max_span_days=None):
+    """
+    Returns price differences calculated using NumPy. The rows are built lazily block by block.
+    The number of the window pairs is limited by 'ANALYTICS_MAX_PAIRS' configuration parameter.
+
+    :param stock_id: stock identifier
+    :param date_from: window start date
+    :param date_to: window end date
+    :param limit: maximum number of rows to be returned (unlimited if None)
+    :param top: number of the largest differences per price type to be returned (all if None)
+    :param min_diff: minimum price difference (unlimited if None)
+    :param max_span_days: maximum number of days between the dates (unlimited if None)
+    :return: iterator of :py:class:`AnalyticsRow`
+    :raises ComputeLimitExceeded: if there are too many pairs
+    """
+
+    dates, prices_by_type = load_window(stock_id, date_from, date_to)
+    ordinals = get_ordinals(dates) if max_span_days is not None else None
+    check_pairs_limit(dates, ordinals, max_span_days)
+
+    def iter_blocks(prices):
+        blocks = iter_pair_blocks(prices, ordinals, min_diff, max_span_days)
+        return blocks if top is None else [select_top(blocks, top)]
+
+    rows = (
+        AnalyticsRow(dates[start], dates[end], start_price, end_price, price_type, diff)
+        for price_type, prices in prices_by_type.items()
+        for starts, ends, diffs in iter_blocks(prices)
+        for start, end, start_price, end_price, diff in zip(
+            starts.tolist(), ends.tolist(), prices[starts].tolist(), prices[ends].tolist(), diffs.tolist()
+        )
+    )
+
+    return itertools.islice(rows, limit)
+
+
+def get_summary_numpy(stock_id, date_from, date_to, min_diff=None, max_span_days=None):
+    """
+    Returns price difference statistics per price type calculated using NumPy. The count, minimum, maximum
+    and mean are accumulated block by block. The quantiles are exact if the number of pairs doesn't exceed
+    'ANALYTICS_SUMMARY_SAMPLE_SIZE' configuration parameter, otherwise they are estimated on a uniform sample
+    of about that size taken on the second pass over the pairs, so the pair differences are never kept whole.
+    The number of the window pairs is limited by 'ANALYTICS_MAX_PAIRS' configuration parameter.
+
+    :param stock_id: stock identifier
+    :param date_from: window start date
+    :param date_to: window end date
+    :param min_diff: minimum price difference (unlimited if None)
+    :param max_span_days: maximum number of days between the dates (unlimited if None)
+    :return: list of :py:class:`SummaryRow`
+    :raises ComputeLimitExceeded: if there are too many pairs
+    """
+
+    dates, prices_by_type = load_window(stock_id, date_from, date_to)
+    ordinals = get_ordinals(dates) if max_span_days is not None else None
+    check_pairs_limit(dates, ordinals, max_span_days)
+    sample_size = app.config['ANALYTICS_SUMMARY_SAMPLE_SIZE']
+    # the sample is seeded so that the same request always gets the same statistics
+    random_state = np.random.RandomState(0)
+    result = []
+
+    for price_type, prices in prices_by_type.items():
+        count, total, min_value, max_value = 0, 0.0, np.inf, -np.inf
+        samples = []
+        for _, _, diffs in iter_pair_blocks(prices, ordinals, min_diff, max_span_days):
+            if diffs.size == 0:
+                continue
+
+            count += diffs.size
+            total += diffs.sum().item()
+            min_value = min(min_value, diffs.min().item())
+            max_value = max(max_value, diffs.max().item())
+            if count <= sample_size:
+                samples.append(diffs)
+            else:
+                samples.clear()
+
+        if count == 0:
+            continue
+
+        if count > sample_size:
+            rate = sample_size / count
+            samples = [
+                diffs[random_state.random_sample(diffs.size) < rate]
+                for _, _, diffs in iter_pair_blocks(prices, ordinals, min_diff, max_span_days)
+            ]
+
+        quantiles = np.quantile(np.concatenate(samples), QUANTILES).tolist()
+        result.append(SummaryRow(price_type, count, min_value, max_value, total / count, *quantiles))
+
+    return result
+
+
+PAIRS_QUERY = '''
+    SELECT p1.date AS start_date,
+           p2.date AS end_date,
+           p1.price AS start_price,
+           p2.price AS end_price,
+           p1.price_type,
+           abs(p1.price - p2.price) AS price_diff
+    FROM quote_price p1 INNER JOIN quote_price p2
+      ON p2.stock_id = p1.stock_id AND p2.price_type = p1.price_type AND p1.date < p2.date
+    WHERE p1.stock_id = %(stock_id)s
+      AND p1.date BETWEEN %(date_from)s AND %(date_to)s
+      AND p2.date BETWEEN %(date_from)s AND %(date_to)s
+'''
+
+
+def get_pairs_query(min_diff=None, max_span_days=None):
+    """
+    Builds the query of the price pairs. The span condition bounds the range of the joined index scan.
+
+    :param min_diff: minimum price difference (unlimited if None)
+    :param max_span_days: maximum number of days between the dates (unlimited if None)
+    :return: query text
+    """
+
+    query = PAIRS_QUERY
+    if min_diff is not None:
+        query += '  AND abs(p1.price - p2.price) >= %(min_diff)s\n'
+    if max_span_days is not None:
+        query += '  AND p2.date <= p1.date + %(max_span_days)s\n'
+
+    return query
+
+
+def get_analytics_query(top=None, min_diff=None, max_span_days=None):
+    """
+    Builds the query of the price differences. The top differences are selected per price type
+    with 'ORDER BY ... LIMIT' so the database keeps only the bounded heap of the sorted rows.
+
+    :param top: number of the largest differences per price type to be selected (all if None)
+    :param min_diff: minimum price difference (unlimited if None)
+    :param max_span_days: maximum number of days between the dates (unlimited if None)
+    :return: query text
+    """
+
+    pairs_query = get_pairs_query(min_diff, max_span_days)
+
+    if top is None:
+        return pairs_query + 'LIMIT %(limit)s'
+
+    return textwrap.dedent('''
+
+        SELECT pairs.*
+        FROM unnest(%(price_types)s::text[]) WITH ORDINALITY AS types(price_type, position)
+        CROSS JOIN LATERAL ({pairs_query}  AND p1.price_type = types.price_type
+          ORDER BY price_diff DESC, start_date, end_date
+          LIMIT %(top)s
+        ) pairs
+        ORDER BY types.position, pairs.price_diff DESC, pairs.start_date, pairs.end_date
+        LIMIT %(limit)s
+
+    ''').format(pairs_query=pairs_query)
+
+
+def get_analytics_sql(stock_id, date_from, date_to, limit=None, top=None, min_diff=None, max_span_days=None):
+    """
+    Returns price differences calculated by the database (see :py:func:`get_analytics_query`).
+
+    :param stock_id: stock identifier
+    :param date_from: window start date
+    :param date_to: window end date
+    :param limit: maximum number of rows to be returned (unlimited if None)
+    :param top: number of the largest differences per price type to be returned (all if None)
+    :param min_diff: minimum price difference (unlimited if None)
+    :param max_span_days: maximum number of days between the dates (unlimited if None)
+    :return: iterator of :py:class:`AnalyticsRow`
+    """
+
+    query = get_analytics_query(top, min_diff, max_span_days)
+
+    data_proxy = db.session.connection().execution_options(stream_results=True).execute(
+        query, stock_id=stock_id, date_from=date_from, date_to=date_to, limit=limit,
+        top=top, min_diff=min_diff, max_span_days=max_span_days, price_types=list(PRICE_TYPES)
+    )
+
+    return (AnalyticsRow(*row) for row in data_proxy)
+
+
+def get_summary_query(min_diff=None, max_span_days=None):
+    """
+    Builds the query of the price difference statistics per price type.
+
+    :param min_diff: minimum price difference (unlimited if None)
+    :param max_span_days: maximum number of days between the dates (unlimited if None)
+    :return: query text
+    """
+
+    return textwrap.dedent('''
+
+        SELECT price_type,
+               count(*),
+               min(price_diff),
+               max(price_diff),
+               avg(price_diff),
+               percentile_cont(%(quantiles)s::float8[]) WITHIN GROUP (ORDER BY price_diff)
+        FROM ({pairs_query}) pairs
+        GROUP BY price_type
+
+    ''').format(pairs_query=get_pairs_query(min_diff, max_span_days))
+
+
+def get_summary_sql(stock_id, date_from, date_to, min_diff=None, max_span_days=None):
+    """
+    Returns price difference statistics per price type calculated by the database.
+
+    :param stock_id: stock identifier
+    :param date_from: window start date
+    :param date_to: window end date
+    :param min_diff: minimum price difference (unlimited if None)
+    :param max_span_days: maximum number of days between the dates (unlimited if None)
+    :return: list of :py:class:`SummaryRow`
+    """
+
+    query = get_summary_query(min_diff, max_span_days)
+
+    data_proxy = db.session.connection().execute(
+        query, stock_id=stock_id, date_from=date_from, date_to=date_to, quantiles=list(QUANTILES),
+        min_diff=min_diff, max_span_days=max_span_days
+    )
+    rows = {row[0]: SummaryRow(*row[:5], *row[5]) for row in data_proxy}
+
+    return [rows[price_type] for price_type in PRICE_TYPES if price_type in rows]
+
+
+def refresh_price_view():
+    """
+    Refreshes 'quote_price' materialized view. The view is refreshed concurrently so the readers are not blocked.
+    """
+
+    with db.engine.connect() as connection:
+        connection.execution_options(autocommit=True).execute('REFRESH MATERIALIZED VIEW CONCURRENTLY quote_price')
+
+
+BACKENDS = {
+    'numpy': (get_analytics_numpy, get_summary_numpy),
+    'sql': (get_analytics_sql, get_summary_sql),
+}
+
+
+def get_analytics(stock_id, date_from, date_to, top=None, min_diff=None, max_span_days=None):
+    """
+    Returns price differences using the backend set by 'ANALYTICS_BACKEND' configuration parameter.
+    The number of rows is limited by 'ANALYTICS_MAX_ROWS' configuration parameter.
+
+    :param stock_id: stock identifier
+    :param date_from: window start date
+    :param date_to: window end date
+    :param top: number of the largest differences per price type to be returned (all if None)
+    :param min_diff: minimum price difference (unlimited if None)
+    :param max_span_days: maximum number of days between the dates (unlimited if None)
+    :return: iterator of :py:class:`AnalyticsRow`
+    """
+
+    get_rows, _ = BACKENDS[app.config['ANALYTICS_BACKEND']]
+
+    return get_rows(
+        stock_id, date_from, date_to, limit=app.config['ANALYTICS_MAX_ROWS'],
+        top=top, min_diff=min_diff, max_span_days=max_span_days
+    )
+
+
+def get_summary(stock_id, date_from, date_to, min_diff=None, max_span_days=None):
+    """
+    Returns price difference statistics using the backend set by 'ANALYTICS_BACKEND' configuration parameter.
+
+    :param stock_id: stock identifier
+    :param date_from: window start date
+    :param date_to: window end date
+    :param min_diff: minimum price difference (unlimited if None)
+    :param max_span_days: maximum number of days between the dates (unlimited if None)
+    :return: list of :py:class:`SummaryRow`
+    """
+
+    _, get_rows = BACKENDS[app.config['ANALYTICS_BACKEND']]
+
+    return get_rows(stock_id, date_from, date_to, min_diff=min_diff, max_span_days=max_span_days)
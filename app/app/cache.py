@@ -0,0 +1,347 @@
+"""
+Response cache. Responses are cached by the request path, query parameters and response format in an in-process
+LRU tier and optionally in a file tier shared by all the worker processes ('RESPONSE_CACHE_DIR' configuration
+parameter, the directory must be private to the application user). Cached entries are bound to the data version
+(see :py:mod:`app.data_version`) so they expire as soon as the data fetcher writes new data. Responses carry 'ETag'
+and 'Last-Modified' headers derived from the data version so that conditional requests for the cached responses
+are answered with '304 Not Modified' without touching the database.
+"""
+
+import collections
+import functools
+import hashlib
+import json
+import os
+import shutil
+import stat
+import tempfile
+import threading
+
+import flask
+from werkzeug import http
+
+from app import app
+from app import data_version as dv
+from app import streaming
+
+
+CacheEntry = collections.namedtuple('CacheEntry', ('version', 'body', 'mimetype', 'headers'))
+
+# headers which are not stored with the entry: the content ones are derived from the body and the mimetype
+UNCACHED_HEADERS = frozenset(('content-type', 'content-length', 'set-cookie'))
+
+
+class MemoryCache:
+    """
+    Thread-safe in-process LRU cache limited by the total size of the cached bodies.
+    Entries of other data versions are dropped as soon as a newer version is requested.
+    """
+
+    def __init__(self, max_size):
+        """
+        :param max_size: maximum total size of the cached bodies in bytes
+        """
+
+        self._max_size = max_size
+        self._size = 0
+        self._version = None
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, version):
+        """
+        Returns the cached entry.
+
+        :param key: cache key
+        :param version: data version
+        :return: :py:class:`CacheEntry` or None if not found
+        """
+
+        with self._lock:
+            self._expire(version)
+
+            entry = self._entries.get(key)
+            if entry is None or entry.version != version:
+                return None
+
+            self._entries.move_to_end(key)
+
+            return entry
+
+    def set(self, key, entry):
+        """
+        Caches the entry evicting the least recently used ones if the cache size exceeded.
+
+        :param key: cache key
+        :param entry: :py:class:`CacheEntry`
+        """
+
+        if len(entry.body) > self._max_size:
+            return
+
+        with self._lock:
+            self._expire(entry.version)
+            if self._version != entry.version:
+                return
+
+            old_entry = self._entries.pop(key, None)
+            if old_entry is not None:
+                self._size -= len(old_entry.body)
+
+            self._entries[key] = entry
+            self._size += len(entry.body)
+
+            while self._size > self._max_size:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted.body)
+
+    def _expire(self, version):
+        if self._version is None or self._version < version:
+            self._entries.clear()
+            self._size = 0
+            self._version = version
+
+
+class FileCache:
+    """
+    File cache shared by several processes. Entries are stored to '<directory>/<data version>/<key hash>' files
+    which are written atomically. A file consists of a json line with the entry version, mimetype and headers
+    followed by the body. Directories of the previous data versions are removed when a newer version
+    directory is created.
+    """
+
+    def __init__(self, directory):
+        """
+        :param directory: cache directory (created with 0700 mode if it doesn't exist)
+        :raises OSError if the directory is not owned by the current user or is accessible by others
+        """
+
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+
+        directory_stat = os.lstat(directory)
+        if not stat.S_ISDIR(directory_stat.st_mode) or directory_stat.st_uid != os.getuid():
+            raise OSError(f"'{directory}' is not a directory owned by the current user")
+        if directory_stat.st_mode & 0o077:
+            os.chmod(directory, 0o700)
+
+        self._directory = directory
+
+    def get(self, key, version):
+        """
+        Returns the cached entry.
+
+        :param key: cache key
+        :param version: data version
+        :return: :py:class:`CacheEntry` or None if not found
+        """
+
+        try:
+            with open(self._entry_path(key, version), 'rb') as file:
+                meta = json.loads(file.readline())
+                body = file.read()
+
+            if meta['version'] != version:
+                return None
+
+            return CacheEntry(version, body, meta['mimetype'], tuple(map(tuple, meta['headers'])))
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def set(self, key, entry):
+        """
+        Caches the entry.
+
+        :param key: cache key
+        :param entry: :py:class:`CacheEntry`
+        """
+
+        version_directory = os.path.join(self._directory, str(entry.version))
+        if not os.path.isdir(version_directory):
+            os.makedirs(version_directory, mode=0o700, exist_ok=True)
+            self._remove_stale(entry.version)
+
+        fd, tmp_path = tempfile.mkstemp(dir=version_directory, prefix='.')
+        try:
+            meta = dict(version=entry.version, mimetype=entry.mimetype, headers=entry.headers)
+            with os.fdopen(fd, 'wb') as file:
+                file.write(json.dumps(meta).encode() + b'\n')
+                file.write(entry.body)
+            os.replace(tmp_path, self._entry_path(key, entry.version))
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+
+    def _entry_path(self, key, version):
+        return os.path.join(self._directory, str(version), hashlib.sha1(repr(key).encode()).hexdigest())
+
+    def _remove_stale(self, version):
+        for name in os.listdir(self._directory):
+            if name.isdigit() and int(name) < version:
+                shutil.rmtree(os.path.join(self._directory, name), ignore_errors=True)
+
+
+def make_file_cache(directory):
+    """
+    :param directory: cache directory
+    :return: :py:class:`FileCache` or None if the directory can't be used
+    """
+
+    try:
+        return FileCache(directory)
+    except OSError as e:
+        app.logger.warning(f"Response file cache is disabled: {e}")
+        return None
+
+
+_memory_cache = MemoryCache(app.config['RESPONSE_CACHE_MEMORY_SIZE']) \
+    if app.config['RESPONSE_CACHE_MEMORY_SIZE'] else None
+_file_cache = make_file_cache(app.config['RESPONSE_CACHE_DIR']) if app.config['RESPONSE_CACHE_DIR'] else None
+
+
+def get_entry(key, version):
+    """
+    Looks up the entry in the memory tier and then in the file tier.
+
+    :param key: cache key
+    :param version: data version
+    :return: :py:class:`CacheEntry` or None if not found
+    """
+
+    entry = _memory_cache.get(key, version) if _memory_cache else None
+    if entry is None and _file_cache:
+        entry = _file_cache.get(key, version)
+        if entry is not None and _memory_cache:
+            _memory_cache.set(key, entry)
+
+    return entry
+
+
+def set_entry(key, entry):
+    """
+    Stores the entry to all the cache tiers.
+
+    :param key: cache key
+    :param entry: :py:class:`CacheEntry`
+    """
+
+    if _memory_cache:
+        _memory_cache.set(key, entry)
+    if _file_cache:
+        try:
+            _file_cache.set(key, entry)
+        except OSError as e:
+            app.logger.warning(f"Response cache entry storing failed: {e}")
+
+
+def make_key():
+    """
+    Builds the current request cache key.
+
+    :return: cache key
+    """
+
+    return (
+        flask.request.path,
+        tuple(sorted(flask.request.args.items(multi=True))),
+        streaming.get_response_format(),
+    )
+
+
+def make_etag(key, version):
+    """
+    Builds the entity tag of the response. The response is fully determined by the key and the data version.
+
+    :param key: cache key
+    :param version: data version
+    :return: entity tag
+    """
+
+    return hashlib.sha1(f'{version}:{key!r}'.encode()).hexdigest()
+
+
+def iter_stored(chunks, key, entry):
+    """
+    Passes the streamed response chunks through storing the whole body to the cache after the last one is sent.
+    The body is not stored if the response is too large or has not been sent completely.
+
+    :param chunks: response body chunks
+    :param key: cache key
+    :param entry: :py:class:`CacheEntry` with an empty body
+    :return: chunks generator
+    """
+
+    max_size = app.config['RESPONSE_CACHE_MAX_ENTRY_SIZE']
+    parts, size = [], 0
+
+    for chunk in chunks:
+        if parts is not None:
+            part = chunk.encode() if isinstance(chunk, str) else chunk
+            size += len(part)
+            if size > max_size:
+                parts = None
+            else:
+                parts.append(part)
+
+        yield chunk
+
+    if parts is not None:
+        set_entry(key, entry._replace(body=b''.join(parts)))
+
+
+def get_stored_headers(response):
+    """
+    :param response: view response
+    :return: tuple of the response (name, value) header pairs to be stored with the entry
+    """
+
+    return tuple((name, value) for name, value in response.headers.items() if name.lower() not in UNCACHED_HEADERS)
+
+
+def cached(view):
+    """
+    Caches the view responses along with the headers set by the view (e.g. 'Link').
+    Only successful responses of 'GET' requests are cached, 'RESPONSE_CACHE_ENABLED' configuration parameter
+    turns the caching off. A conditional request is answered with
+    '304 Not Modified' only if the response is cached, otherwise the view is called so that its errors
+    (e.g. '404 Not Found' for an unknown ticker) are not masked.
+
+    :param view: view function
+    :return: decorated view function
+    """
+
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if not app.config['RESPONSE_CACHE_ENABLED'] or (_memory_cache is None and _file_cache is None) or \
+                flask.request.method != 'GET':
+            return view(*args, **kwargs)
+
+        version, modified = dv.get()
+        key = make_key()
+        etag = make_etag(key, version)
+
+        entry = get_entry(key, version)
+        if entry is not None:
+            if not http.is_resource_modified(flask.request.environ, etag=etag, last_modified=modified):
+                response = flask.Response(status=304)
+            else:
+                response = flask.Response(entry.body, mimetype=entry.mimetype, headers=list(entry.headers))
+        else:
+            response = flask.make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+
+            entry = CacheEntry(version, b'', response.mimetype, get_stored_headers(response))
+            if response.is_streamed:
+                response.response = iter_stored(response.response, key, entry)
+            elif len(response.get_data()) <= app.config['RESPONSE_CACHE_MAX_ENTRY_SIZE']:
+                set_entry(key, entry._replace(body=response.get_data()))
+
+        response.set_etag(etag)
+        if modified is not None:
+            response.last_modified = modified
+        response.cache_control.no_cache = True
+        response.vary.add('Accept')
+
+        return response
+
+    return wrapper
@@ -32,8 +32,39 @@ class BaseConfig:
 
     SQLALCHEMY_DATABASE_URI = get_postgres_connection_string()
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SQLALCHEMY_ENGINE_OPTIONS = dict(
+        pool_size=int(os.environ.get('DB_POOL_SIZE', 5)),
+        max_overflow=int(os.environ.get('DB_POOL_MAX_OVERFLOW', 10)),
+        pool_timeout=int(os.environ.get('DB_POOL_TIMEOUT', 30)),
+        pool_recycle=int(os.environ.get('DB_POOL_RECYCLE', 3600)),
+        pool_pre_ping=os.environ.get('DB_POOL_PRE_PING', 'true').lower() == 'true',
+    )
+    REQUEST_STATEMENT_TIMEOUT = int(os.environ.get('REQUEST_STATEMENT_TIMEOUT', 30000))
+    SLOW_QUERY_THRESHOLD = int(os.environ.get('SLOW_QUERY_THRESHOLD', 1000))
     WTF_CSRF_ENABLED = False
 
+    STREAM_BATCH_SIZE = int(os.environ.get('STREAM_BATCH_SIZE', 1000))
+    STREAM_CHUNK_SIZE = int(os.environ.get('STREAM_CHUNK_SIZE', 64 * 1024))
+    HTML_PAGE_SIZE = int(os.environ.get('HTML_PAGE_SIZE', 100))
+    BATCH_MAX_TICKERS = int(os.environ.get('BATCH_MAX_TICKERS', 100))
+
+    DELTA_BACKEND = os.environ.get('DELTA_BACKEND', 'engine')
+    DELTA_MAX_ROWS = int(os.environ.get('DELTA_MAX_ROWS', 1000000))
+    ANALYTICS_BACKEND = os.environ.get('ANALYTICS_BACKEND', 'numpy')
+    ANALYTICS_MAX_ROWS = int(os.environ.get('ANALYTICS_MAX_ROWS', 0)) or None
+    ANALYTICS_MAX_TOP = int(os.environ.get('ANALYTICS_MAX_TOP', 10000))
+    ANALYTICS_MAX_PAIRS = int(os.environ.get('ANALYTICS_MAX_PAIRS', 50000000))
+    ANALYTICS_SUMMARY_SAMPLE_SIZE = int(os.environ.get('ANALYTICS_SUMMARY_SAMPLE_SIZE', 1000000))
+
+    DATA_VERSION_FILE = os.environ.get('DATA_VERSION_FILE', '/tmp/stocks-app/data_version')
+    RESPONSE_CACHE_ENABLED = os.environ.get('RESPONSE_CACHE_ENABLED', 'true').lower() == 'true'
+    RESPONSE_CACHE_MEMORY_SIZE = int(os.environ.get('RESPONSE_CACHE_MEMORY_SIZE', 64 * 1024 * 1024))
+    RESPONSE_CACHE_MAX_ENTRY_SIZE = int(os.environ.get('RESPONSE_CACHE_MAX_ENTRY_SIZE', 8 * 1024 * 1024))
+    RESPONSE_CACHE_DIR = os.environ.get('RESPONSE_CACHE_DIR') or None
+    QUOTE_STORE_ENABLED = os.environ.get('QUOTE_STORE_ENABLED', 'true').lower() == 'true'
+    QUOTE_STORE_SIZE = int(os.environ.get('QUOTE_STORE_SIZE', 64 * 1024 * 1024))
+    QUOTE_SNAPSHOT_DIR = os.environ.get('QUOTE_SNAPSHOT_DIR') or None
+
 
 class ProdConfig(BaseConfig):
     """
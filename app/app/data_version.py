@@ -0,0 +1,119 @@
+"""
+Stored data version. The version is a counter kept in a file ('DATA_VERSION_FILE' configuration parameter)
+that the data fetcher bumps after each committed write so that the application processes can find out
+that the data derived from the database (cached responses etc.) is stale.
+
+The data derived from the quotes only (the quote store and the snapshot files) is bound to the separate quotes
+version kept in '<DATA_VERSION_FILE>.quotes' file which is bumped only if the quotes have been written,
+so that trade writes don't make it stale.
+"""
+
+import collections
+import datetime
+import fcntl
+import os
+import tempfile
+import threading
+
+from app import app
+
+
+DataVersion = collections.namedtuple('DataVersion', ('version', 'modified'))
+
+QUOTES = 'quotes'
+
+_lock = threading.Lock()
+_cached = {}
+
+
+def _get_path(scope):
+    """
+    :param scope: version scope (the whole data if None)
+    :return: version file path
+    """
+
+    path = app.config['DATA_VERSION_FILE']
+
+    return path if scope is None else f'{path}.{scope}'
+
+
+def _read(path):
+    """
+    Reads the data version file.
+
+    :param path: data version file path
+    :return: stored version or 0 if the file doesn't exist
+    """
+
+    try:
+        with open(path) as file:
+            return int(file.read().strip() or 0)
+    except FileNotFoundError:
+        return 0
+
+
+def get(scope=None):
+    """
+    Returns the current data version. The file is re-read only if it has been replaced or modified.
+
+    :param scope: version scope (:py:data:`QUOTES` or None for the whole data)
+    :return: :py:class:`DataVersion` ('modified' is a naive utc datetime or None if the data has never been versioned)
+    """
+
+    path = _get_path(scope)
+
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return DataVersion(0, None)
+
+    with _lock:
+        file_id, data_version = _cached.get(path, (None, None))
+        if file_id != (stat.st_ino, stat.st_mtime_ns):
+            modified = datetime.datetime.utcfromtimestamp(stat.st_mtime)
+            data_version = DataVersion(_read(path), modified)
+            _cached[path] = ((stat.st_ino, stat.st_mtime_ns), data_version)
+
+    return data_version
+
+
+def bump(*scopes):
+    """
+    Increments the data version and the versions of the given scopes.
+
+    :param scopes: scopes of the written data (e.g. :py:data:`QUOTES`)
+    :return: new data version
+    """
+
+    for scope in scopes:
+        _increment(_get_path(scope))
+
+    return _increment(_get_path(None))
+
+
+def _increment(path):
+    """
+    Increments the version stored in the file. Concurrent increments (from several threads or processes)
+    are serialized using a lock file, the version file itself is replaced atomically.
+
+    :param path: version file path
+    :return: new version
+    """
+
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+
+    with _lock, open(path + '.lock', 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            version = _read(path) + 1
+
+            fd, tmp_path = tempfile.mkstemp(dir=directory)
+            with os.fdopen(fd, 'w') as file:
+                file.write(str(version))
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, path)
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    return version
@@ -0,0 +1,262 @@
+"""
+Price delta engine. Finds the minimal date intervals the price of a stock changed at least by a given value.
+"""
+
+import collections
+import textwrap
+
+import sqlalchemy
+
+from app import app
+from app import db
+from app import models
+from app import prepared
+from app import store
+from app import timeout
+
+
+DeltaRow = collections.namedtuple(
+    'DeltaRow', ('start_date', 'end_date', 'start_price', 'end_price', 'date_diff', 'price_diff')
+)
+
+SERIES_QUERIES = {
+    str(price_type): prepared.PreparedQuery(
+        f'delta_series_{price_type}',
+        sqlalchemy.select([models.Quote.date, getattr(models.Quote, f'{price_type}_price')]).
+        where(models.Quote.stock_id == sqlalchemy.bindparam('stock_id')).
+        order_by(models.Quote.date)
+    )
+    for price_type in models.PriceType
+}
+
+
+class _MaxIndexTree:
+    """
+    Fenwick tree returning the maximum stored value over a prefix of positions.
+    Used to find the latest quote index among the quotes with a price rank not greater than the given one.
+    """
+
+    def __init__(self, size):
+        self._tree = [-1] * (size + 1)
+
+    def update(self, pos, value):
+        """
+        Stores the value at the position.
+
+        :param pos: zero-based position
+        :param value: value to be stored
+        """
+
+        pos += 1
+        while pos < len(self._tree):
+            if self._tree[pos] < value:
+                self._tree[pos] = value
+            pos += pos & -pos
+
+    def query(self, pos):
+        """
+        Returns the maximum value stored at positions [0, pos].
+
+        :param pos: zero-based position (inclusive), negative position means an empty prefix
+        :return: maximum value or -1 if nothing is stored
+        """
+
+        result = -1
+        pos += 1
+        while pos > 0:
+            if result < self._tree[pos]:
+                result = self._tree[pos]
+            pos -= pos & -pos
+
+        return result
+
+
+def _last_rank_below(prices, price, value):
+    """
+    Returns the last rank of the sorted prices with 'price - prices[rank] >= value'.
+
+    :return: rank or -1 if there is no such price
+    """
+
+    lo, hi = 0, len(prices)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if price - prices[mid] >= value:
+            lo = mid + 1
+        else:
+            hi = mid
+
+    return lo - 1
+
+
+def _first_rank_above(prices, price, value):
+    """
+    Returns the first rank of the sorted prices with 'prices[rank] - price >= value'.
+
+    :return: rank or len(prices) if there is no such price
+    """
+
+    lo, hi = 0, len(prices)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if prices[mid] - price >= value:
+            hi = mid
+        else:
+            lo = mid + 1
+
+    return lo
+
+
+def find_min_deltas(dates, prices, value):
+    """
+    Finds all the pairs of dates the price changed at least by 'value' between and the dates interval is minimal.
+    The algorithm scans the series in the date order keeping the already seen prices in two Fenwick trees
+    (by ascending and descending price rank) to find the latest suitable start date for every end date
+    in O(n log n) time.
+
+    :param dates: quote dates sorted in ascending order (unique)
+    :param prices: quote prices corresponding to the dates
+    :param value: minimal price difference
+    :return: list of :py:class:`DeltaRow` sorted by start date
+    """
+
+    ranked = sorted(set(prices))
+    rank_of = {price: rank for rank, price in enumerate(ranked)}
+    size = len(ranked)
+
+    lower_tree = _MaxIndexTree(size)  # indexed by price rank
+    upper_tree = _MaxIndexTree(size)  # indexed by reversed price rank
+
+    ordinals = [date.toordinal() for date in dates]
+    candidates = []
+
+    for end, end_price in enumerate(prices):
+        start = max(
+            lower_tree.query(_last_rank_below(ranked, end_price, value)),
+            upper_tree.query(size - 1 - _first_rank_above(ranked, end_price, value)),
+        )
+        if start >= 0:
+            candidates.append((ordinals[end] - ordinals[start], start, end))
+
+        rank = rank_of[end_price]
+        lower_tree.update(rank, end)
+        upper_tree.update(size - 1 - rank, end)
+
+    if not candidates:
+        return []
+
+    min_diff = min(date_diff for date_diff, _, _ in candidates)
+
+    return sorted(
+        (
+            DeltaRow(
+                start_date=dates[start],
+                end_date=dates[end],
+                start_price=prices[start],
+                end_price=prices[end],
+                date_diff=date_diff,
+                price_diff=abs(prices[start] - prices[end]),
+            )
+            for date_diff, start, end in candidates if date_diff == min_diff
+        ),
+        key=lambda row: row.start_date,
+    )
+
+
+def load_series(stock_id, price_type):
+    """
+    Loads the stock price series ordered by date. The series is taken from the quote store if it is enabled.
+
+    :param stock_id: stock identifier
+    :param price_type: price type name ('open', 'close', 'high' or 'low')
+    :return: tuple of dates and prices lists
+    """
+
+    stock_quotes = store.quotes.get(stock_id)
+    if stock_quotes is not None:
+        return stock_quotes.dates(), stock_quotes.columns[f'{price_type}_price'].tolist()
+
+    rows = SERIES_QUERIES[price_type].execute(stock_id=stock_id).fetchall()
+
+    return [row[0] for row in rows], [row[1] for row in rows]
+
+
+def get_deltas_engine(stock_id, price_type, value):
+    """
+    Returns minimal interval price deltas using the in-process engine.
+    The series length is limited by 'DELTA_MAX_ROWS' configuration parameter.
+
+    :param stock_id: stock identifier
+    :param price_type: price type name
+    :param value: minimal price difference
+    :return: list of :py:class:`DeltaRow`
+    :raises ComputeLimitExceeded: if the series is too long
+    """
+
+    dates, prices = load_series(stock_id, price_type)
+    timeout.check_compute_limit('DELTA_MAX_ROWS', len(dates))
+
+    return find_min_deltas(dates, prices, value)
+
+
+def get_deltas_sql(stock_id, price_type, value):
+    """
+    Returns minimal interval price deltas calculated by the database.
+    Runs in O(n^2) time, kept as a reference implementation.
+
+    :param stock_id: stock identifier
+    :param price_type: price type name
+    :param value: minimal price difference
+    :return: list of :py:class:`DeltaRow`
+    """
+
+    query = textwrap.dedent('''
+
+        WITH diff_subquery AS (
+            SELECT q1.date AS start_date,
+                   q2.date AS end_date,
+                   q1.{price_type} AS start_price,
+                   q2.{price_type} AS end_price,
+                   q2.date - q1.date as date_diff,
+                   abs(q1.{price_type} - q2.{price_type}) AS price_diff
+            FROM quote q1 INNER JOIN quote q2 ON q1.date < q2.date
+            WHERE abs(q1.{price_type} - q2.{price_type}) >= %(value)s
+              AND q2.stock_id = q1.stock_id
+              AND q2.stock_id = %(stock_id)s
+        )
+        SELECT *
+        FROM diff_subquery
+        WHERE date_diff = (
+            SELECT MIN(date_diff)
+            FROM diff_subquery
+        )
+        ORDER BY start_date
+
+    ''')
+
+    column_name = price_type + '_price'
+
+    # to prevent sql injections quote the column name by the dialect identifier preparer
+    safe_query = query.format(price_type=db.engine.dialect.identifier_preparer.quote_identifier(column_name))
+    data_proxy = db.session.connection().execute(safe_query, stock_id=stock_id, value=value)
+
+    return [DeltaRow(*row) for row in data_proxy]
+
+
+BACKENDS = {
+    'engine': get_deltas_engine,
+    'sql': get_deltas_sql,
+}
+
+
+def get_deltas(stock_id, price_type, value):
+    """
+    Returns minimal interval price deltas using the backend set by 'DELTA_BACKEND' configuration parameter.
+
+    :param stock_id: stock identifier
+    :param price_type: price type name
+    :param value: minimal price difference
+    :return: list of :py:class:`DeltaRow`
+    """
+
+    return BACKENDS[app.config['DELTA_BACKEND']](stock_id, price_type, value)
@@ -6,6 +6,9 @@ import flask_wtf as wtf
 import wtforms
 from wtforms import validators as wtfv
 
+from app import analytics
+from app import app
+from app import id_cache
 from app import models
 
 
@@ -17,11 +20,22 @@ class AnalyticForm(wtf.FlaskForm):
     ticker = wtforms.StringField(validators=[wtfv.DataRequired()])
     date_from = wtforms.DateField(validators=[wtfv.DataRequired()])
     date_to = wtforms.DateField(validators=[wtfv.DataRequired()])
+    summary = wtforms.BooleanField()
+    top = wtforms.IntegerField(validators=[
+        wtfv.Optional(),
+        wtfv.NumberRange(min=1, max=app.config['ANALYTICS_MAX_TOP'], message="Значение вне допустимого диапазона"),
+    ])
+    min_diff = wtforms.FloatField(validators=[
+        wtfv.Optional(), wtfv.NumberRange(min=0, message="Значение должно быть положительным"),
+    ])
+    max_span_days = wtforms.IntegerField(validators=[
+        wtfv.Optional(),
+        wtfv.NumberRange(min=1, max=analytics.MAX_SPAN_DAYS, message="Значение вне допустимого диапазона"),
+    ])
     submit = wtforms.SubmitField()
 
     def validate_ticker(self, ticker):
-        stock = models.Stock.query.filter_by(ticker=ticker.data).first()
-        if stock is None:
+        if id_cache.stocks.get(ticker.data) is None:
             raise wtfv.ValidationError("Акция не найдена")
 
 
@@ -40,6 +54,5 @@ class DeltaForm(wtf.FlaskForm):
             raise wtfv.ValidationError("Значение должно быть положительным")
 
     def validate_ticker(self, ticker):
-        stock = models.Stock.query.filter_by(ticker=ticker.data).first()
-        if stock is None:
+        if id_cache.stocks.get(ticker.data) is None:
             raise wtfv.ValidationError("Акция не найдена")
@@ -2,21 +2,32 @@
 Flask application request handlers.
 """
 
-import textwrap
+import itertools
+import operator
 import urllib
 
 import flask
-import psycopg2.extensions
+import sqlalchemy
 import webargs
-from sqlalchemy import orm
 from webargs import flaskparser
+from werkzeug import exceptions
 
+from app import analytics
 from app import app
 from app import blueprint
+from app import cache
 from app import db
+from app import delta
 from app import forms
+from app import id_cache
+from app import metrics
 from app import models
+from app import pagination
 from app import serialization as sz
+from app import stats
+from app import store
+from app import streaming
+from app import timeout
 
 
 def is_api_request():
@@ -29,20 +40,58 @@ def is_api_request():
     return flask.request.path.startswith('/api')
 
 
-def build_response(json_data, template_name, **template_args):
+def build_response(json_data, template_name, next_url=None, **template_args):
     """
     Builds response (json or html) depending on the context ('/api' or '/').
 
-    :param json_data: json data to be sent in json response
+    :param json_data: iterable of json objects to be streamed in json response (evaluated lazily)
     :param template_name: template name to render the web page
+    :param next_url: next page url if the result is paginated and it is not the last page
+                     (sent in 'Link' header of json response)
     :param template_args: html template arguments
     :return: json or rendered html page response
     """
 
-    return flask.jsonify(json_data) if is_api_request() else flask.render_template(template_name, **template_args)
+    if is_api_request():
+        response = streaming.stream_response(json_data)
+        if next_url is not None:
+            response.headers['Link'] = f'<{next_url}>; rel="next"'
+
+        return response
+
+    return flask.render_template(template_name, next_url=next_url, **template_args)
+
+
+def get_page_size(args):
+    """
+    Returns the requested page size. Web pages are paginated by default.
+
+    :param args: query parameters
+    :return: page size or None if not limited
+    """
+
+    if args['limit'] is None and not is_api_request():
+        return app.config['HTML_PAGE_SIZE']
+
+    return args['limit']
+
+
+def get_fields(args):
+    """
+    Returns the fields requested by 'fields' query parameter. Web pages always contain all the fields.
+
+    :param args: query parameters
+    :return: tuple of field names or None if all the fields are requested
+    """
+
+    if args['fields'] is None or not is_api_request():
+        return None
+
+    return tuple(sorted(set(args['fields'])))
 
 
 @blueprint.route('/', strict_slashes=False)
+@cache.cached
 def get_tickers():
     """
     Returns stocks information for the ticker.
@@ -50,62 +99,289 @@ def get_tickers():
     :return: json or rendered html page response
     """
 
-    stocks = models.Stock.query.all()
+    serializer = sz.get_row_serializer(sz.StockApiSchema)
+    stocks = serializer.dump_iter(serializer.query().yield_per(app.config['STREAM_BATCH_SIZE']))
 
     return build_response(
-        json_data=sz.StockApiSchema(many=True).dump(stocks).data,
+        json_data=stocks,
         template_name='stocks.html',
         stocks=stocks
     )
 
 
+page_request_schema = {
+    'after': webargs.fields.Date(missing=None),
+    'limit': webargs.fields.Int(missing=None, validate=lambda val: val > 0),
+}
+
+date_range_request_schema = {
+    'date_from': webargs.fields.Date(missing=None),
+    'date_to': webargs.fields.Date(missing=None),
+}
+
+quotes_request_schema = dict(
+    page_request_schema,
+    **date_range_request_schema,
+    fields=webargs.fields.DelimitedList(
+        webargs.fields.Str(), missing=None, validate=webargs.validate.ContainsOnly(list(sz.QuoteApiSchema().fields))
+    ),
+)
+
+
+def filter_date_range(query, column, args):
+    """
+    Filters the query rows by 'date_from' and 'date_to' (both inclusive) query parameters.
+
+    :param query: sqlalchemy query
+    :param column: date column
+    :param args: query parameters
+    :return: filtered query
+    """
+
+    if args['date_from'] is not None:
+        query = query.filter(column >= args['date_from'])
+    if args['date_to'] is not None:
+        query = query.filter(column <= args['date_to'])
+
+    return query
+
+
+def build_quotes_query(serializer, stock_id, args):
+    """
+    Builds the query of the stock quotes filtered by the query parameters.
+
+    :param serializer: quote row serializer
+    :param stock_id: stock identifier
+    :param args: query parameters
+    :return: sqlalchemy query
+    """
+
+    query = serializer.query().filter(models.Quote.stock_id == stock_id)
+
+    return filter_date_range(query, models.Quote.date, args)
+
+
 @blueprint.route('/<ticker>', strict_slashes=False)
-def get_ticker(ticker):
+@cache.cached
+@flaskparser.use_args(quotes_request_schema)
+def get_ticker(args, ticker):
     """
-    Returns quotes information for the ticker.
+    Returns quotes information for the ticker ordered by date. The quotes are paginated
+    if 'limit' is set, 'after' is the date of the previous page last quote.
+    The quotes are filtered by 'date_from' and 'date_to' and only the fields listed in 'fields' are returned
+    if they are set. The quotes are served from the quote store if it is enabled.
 
+    :param args: query parameters
     :param ticker: ticker name
     :return: json or rendered html page response
     :raises HTTPException with 404 code if the stock not found
     """
 
-    stock = models.Stock.query.filter_by(ticker=ticker).first_or_404()
-    quotes = models.Quote.query.filter_by(stock_id=stock.id).all()
+    stock_id = id_cache.stocks.get_or_404(ticker)
+
+    stock_quotes = store.quotes.get(stock_id)
+    if stock_quotes is not None:
+        start, stop, next_date = stock_quotes.select(
+            args['date_from'], args['date_to'], after=args['after'], limit=get_page_size(args)
+        )
+        next_url = pagination.build_url(after=next_date) if next_date else None
+        quotes = stock_quotes.iter_dicts(start, stop, get_fields(args), app.config['STREAM_BATCH_SIZE'])
+    else:
+        serializer = sz.get_row_serializer(
+            sz.QuoteApiSchema, only=get_fields(args), extra_columns=(models.Quote.date,)
+        )
+        quotes, next_key = pagination.paginate(
+            build_quotes_query(serializer, stock_id, args),
+            key_columns=[models.Quote.date],
+            after=(args['after'],) if args['after'] is not None else None,
+            limit=get_page_size(args)
+        )
+        next_url = pagination.build_url(after=next_key[0]) if next_key else None
+        quotes = serializer.dump_iter(quotes)
 
     return build_response(
-        json_data=sz.QuoteApiSchema(many=True).dump(quotes).data,
+        json_data=quotes,
         template_name='quotes.html',
+        next_url=next_url,
         ticker=ticker,
         quotes=quotes
     )
 
 
+batch_quotes_request_schema = dict(
+    date_range_request_schema,
+    tickers=webargs.fields.DelimitedList(
+        webargs.fields.Str(),
+        required=True,
+        validate=webargs.validate.Length(min=1, max=app.config['BATCH_MAX_TICKERS'])
+    ),
+    fields=quotes_request_schema['fields'],
+)
+
+
+def build_batch_quotes_query(serializer, stock_ids, args):
+    """
+    Builds the query of the quotes of several stocks filtered by the query parameters ordered by stock and date.
+
+    :param serializer: quote row serializer
+    :param stock_ids: stock identifiers
+    :param args: query parameters
+    :return: sqlalchemy query
+    """
+
+    query = serializer.query().filter(models.Quote.stock_id.in_(list(stock_ids)))
+
+    return filter_date_range(query, models.Quote.date, args).order_by(models.Quote.stock_id, models.Quote.date)
+
+
+@app.route('/api/quotes', methods=['GET', 'POST'])
+@cache.cached
+@flaskparser.use_args(batch_quotes_request_schema)
+def get_batch_quotes(args):
+    """
+    Returns quotes information for several tickers grouped by ticker. The parameters are accepted
+    from the query string ('tickers=AAPL,GOOG') as well as from the form or json body of 'POST' request.
+    The stocks are resolved and the quotes are selected using a single query each. The quotes are filtered
+    by 'date_from' and 'date_to' and only the fields listed in 'fields' are returned if they are set.
+
+    :param args: request parameters
+    :return: json response, list of objects with 'ticker' and 'quotes' fields ordered by stock
+    :raises HTTPException with 404 code if any of the stocks not found
+    """
+
+    tickers = set(args['tickers'])
+    stock_ids = id_cache.stocks.get_many(tickers)
+
+    unknown_tickers = tickers - stock_ids.keys()
+    if unknown_tickers:
+        flask.abort(404, description=f"Unknown tickers: {', '.join(sorted(unknown_tickers))}")
+
+    serializer = sz.get_row_serializer(
+        sz.QuoteApiSchema, only=get_fields(args), extra_columns=(models.Quote.stock_id, models.Quote.date)
+    )
+    query = build_batch_quotes_query(serializer, stock_ids.values(), args).yield_per(app.config['STREAM_BATCH_SIZE'])
+
+    return streaming.stream_response(iter_quote_groups(stock_ids, serializer, query))
+
+
+def iter_quote_groups(stock_ids, serializer, rows):
+    """
+    Groups the quote rows ordered by stock by ticker.
+
+    :param stock_ids: dict of stock identifiers by ticker
+    :param serializer: quote row serializer
+    :param rows: quote rows ordered by stock identifier
+    :return: generator of objects with 'ticker' and 'quotes' fields (a group is built for every stock)
+    """
+
+    groups = itertools.groupby(rows, key=operator.attrgetter('stock_id'))
+    stock_id, group = next(groups, (None, None))
+
+    for ticker, ident in sorted(stock_ids.items(), key=operator.itemgetter(1)):
+        quotes = []
+        if stock_id == ident:
+            quotes = list(serializer.dump_iter(group))
+            stock_id, group = next(groups, (None, None))
+
+        yield dict(ticker=ticker, quotes=quotes)
+
+
+trades_request_schema = dict(
+    page_request_schema,
+    **date_range_request_schema,
+    after_id=webargs.fields.Int(missing=None),
+    transaction_type=webargs.fields.Str(missing=None),
+    fields=webargs.fields.DelimitedList(
+        webargs.fields.Str(), missing=None, validate=webargs.validate.ContainsOnly(list(sz.TradeApiSchema().fields))
+    ),
+)
+
+
+def build_trades_query(serializer, filters, args):
+    """
+    Builds the query of the trades filtered by the criteria and the query parameters.
+
+    :param serializer: trade row serializer
+    :param filters: trades filtering criteria
+    :param args: query parameters
+    :return: sqlalchemy query
+    """
+
+    query = serializer.query().filter(*filters)
+    query = filter_date_range(query, models.Trade.last_date, args)
+    if args['transaction_type'] is not None:
+        query = query.filter(models.Trade.transaction_type == args['transaction_type'])
+
+    return query
+
+
+def select_trades(filters, args):
+    """
+    Selects, filters and paginates the trades according to the query parameters.
+    The trades are ordered by date and id, 'after' and 'after_id' are the date and the id
+    of the previous page last trade.
+
+    :param filters: trades filtering criteria
+    :param args: query parameters
+    :return: tuple of serialized trades iterable and the next page url
+    :raises HTTPException with 422 code if only one of 'after' and 'after_id' is passed
+    """
+
+    serializer = sz.get_row_serializer(
+        sz.TradeApiSchema, only=get_fields(args), extra_columns=(models.Trade.last_date, models.Trade.id)
+    )
+
+    # several trades can share the date so the cursor is only valid along with the id
+    if (args['after'] is None) != (args['after_id'] is None):
+        flask.abort(422, description="'after' and 'after_id' should be passed together")
+
+    after = (args['after'], args['after_id']) if args['after'] is not None else None
+
+    trades, next_key = pagination.paginate(
+        build_trades_query(serializer, filters, args),
+        key_columns=[models.Trade.last_date, models.Trade.id],
+        after=after,
+        limit=get_page_size(args)
+    )
+    next_url = pagination.build_url(after=next_key[0], after_id=next_key[1]) if next_key else None
+
+    return serializer.dump_iter(trades), next_url
+
+
 @blueprint.route('/<ticker>/insider', strict_slashes=False)
-def get_insiders(ticker):
+@cache.cached
+@flaskparser.use_args(trades_request_schema)
+def get_insiders(args, ticker):
     """
-    Returns trade information for the ticker.
+    Returns trade information for the ticker. See :py:func:`select_trades` for the query parameters.
 
+    :param args: query parameters
     :param ticker: ticker name
     :return: json or rendered html page response
     :raises HTTPException with 404 code if the stock not found
     """
 
-    stock = models.Stock.query.filter_by(ticker=ticker).first_or_404()
-    trades = models.Trade.query.filter_by(stock_id=stock.id).options(orm.joinedload(models.Trade.insider)).all()
+    stock_id = id_cache.stocks.get_or_404(ticker)
+    trades, next_url = select_trades([models.Trade.stock_id == stock_id], args)
 
     return build_response(
-        json_data=sz.TradeApiSchema(many=True).dump(trades).data,
+        json_data=trades,
         template_name='insiders.html',
+        next_url=next_url,
         ticker=ticker,
         trades=trades
     )
 
 
 @blueprint.route('/<ticker>/insider/<name>', strict_slashes=False)
-def get_insider(ticker, name):
+@cache.cached
+@flaskparser.use_args(trades_request_schema)
+def get_insider(args, ticker, name):
     """
     Returns trade information for the ticker made by the particular insider.
+    See :py:func:`select_trades` for the query parameters.
 
+    :param args: query parameters
     :param ticker: ticker name
     :param name: insider name
     :return: json or rendered html page response
@@ -113,30 +389,101 @@ def get_insider(ticker, name):
     """
 
     name = urllib.parse.unquote(name)
-    stock = models.Stock.query.filter_by(ticker=ticker).first_or_404()
-    insider = models.Insider.query.filter_by(name=name).first_or_404()
-    trades = models.Trade.query.filter_by(stock_id=stock.id, insider_id=insider.id).all()
+    stock_id = id_cache.stocks.get_or_404(ticker)
+    insider_id = id_cache.insiders.get_or_404(name)
+    trades, next_url = select_trades([models.Trade.stock_id == stock_id, models.Trade.insider_id == insider_id], args)
 
     return build_response(
-        json_data=sz.TradeApiSchema(many=True).dump(trades).data,
+        json_data=trades,
         template_name='insider.html',
+        next_url=next_url,
         ticker=ticker,
         name=name,
         trades=trades
     )
 
 
+stats_request_schema = {
+    'date': webargs.fields.Date(missing=None),
+    'type': webargs.fields.Str(missing=None, validate=webargs.validate.OneOf(list(map(str, models.PriceType)))),
+}
+
+
+def build_stats_query(serializer, stock_id, args):
+    """
+    Builds the query of the stock statistics as of the latest quote date (not after 'date' query parameter).
+
+    :param serializer: statistics row serializer
+    :param stock_id: stock identifier
+    :param args: query parameters
+    :return: sqlalchemy query
+    """
+
+    last_date = db.session.query(sqlalchemy.func.max(models.QuoteStats.date)).\
+        filter(models.QuoteStats.stock_id == stock_id)
+    if args['date'] is not None:
+        last_date = last_date.filter(models.QuoteStats.date <= args['date'])
+
+    query = serializer.query().\
+        filter(models.QuoteStats.stock_id == stock_id, models.QuoteStats.date == last_date.as_scalar())
+    if args['type'] is not None:
+        query = query.filter(models.QuoteStats.price_type == models.PriceType[args['type']])
+
+    return query.order_by(models.QuoteStats.price_type)
+
+
+@blueprint.route('/<ticker>/stats', strict_slashes=False)
+@cache.cached
+@flaskparser.use_args(stats_request_schema)
+def get_stats(args, ticker):
+    """
+    Returns the precomputed price statistics (daily return, rolling mean and standard deviation,
+    running extremes, max drawdown and the biggest daily move) per price type as of the latest quote date
+    or the latest one not after 'date' if it is set.
+
+    :param args: query parameters
+    :param ticker: ticker name
+    :return: json or rendered html page response
+    :raises HTTPException with 404 code if the stock not found
+    """
+
+    stock_id = id_cache.stocks.get_or_404(ticker)
+    serializer = sz.get_row_serializer(sz.QuoteStatsApiSchema)
+    data = serializer.dump_iter(build_stats_query(serializer, stock_id, args))
+
+    return build_response(
+        json_data=data,
+        template_name='stats.html',
+        ticker=ticker,
+        window=stats.ROLLING_WINDOW,
+        data=data
+    )
+
+
 analytics_request_schema = {
     'date_from': webargs.fields.Date(required=True),
     'date_to': webargs.fields.Date(required=True),
+    'summary': webargs.fields.Bool(missing=False),
+    'top': webargs.fields.Int(
+        missing=None, validate=webargs.validate.Range(min=1, max=app.config['ANALYTICS_MAX_TOP'])
+    ),
+    'min_diff': webargs.fields.Float(missing=None, validate=lambda val: val >= 0),
+    'max_span_days': webargs.fields.Int(
+        missing=None, validate=webargs.validate.Range(min=1, max=analytics.MAX_SPAN_DAYS)
+    ),
 }
 
 
 @blueprint.route('/<ticker>/analytics')
+@cache.cached
 @flaskparser.use_args(analytics_request_schema)
 def get_analytics(args, ticker):
     """
     Returns 'open', 'high', 'low' and 'close' price difference for all the dates within 'date_from' and 'date_to'.
+    If 'summary' is set returns the price difference statistics per price type instead.
+    The pairs are restricted to the ones with the difference of at least 'min_diff' and the dates at most
+    'max_span_days' apart. If 'top' is set only the largest differences per price type are returned
+    ordered by the difference ('top' doesn't apply to the statistics).
 
     :param args: query parameters
     :param ticker: ticker name
@@ -144,47 +491,25 @@ def get_analytics(args, ticker):
     :raises HTTPException with 404 code if the stock not found
     """
 
-    stock = models.Stock.query.filter_by(ticker=ticker).first_or_404()
+    stock_id = id_cache.stocks.get_or_404(ticker)
 
-    query = textwrap.dedent('''
+    filters = dict(min_diff=args['min_diff'], max_span_days=args['max_span_days'])
 
-        WITH pivoted AS (
-            SELECT id, stock_id, date, volume, open_price AS price, 'open' AS price_type
-            FROM quote
-            UNION
-            SELECT id, stock_id, date, volume, close_price AS price, 'close' AS price_type
-            FROM quote
-            UNION
-            SELECT id, stock_id, date, volume, high_price AS price, 'high' AS price_type
-            FROM quote
-            UNION
-            SELECT id, stock_id, date, volume, low_price AS price, 'low' AS price_type
-            FROM quote
-        )
-        SELECT p1.date AS start_date,
-               p2.date AS end_date,
-               p1.price AS start_price,
-               p2.price AS end_price,
-               p1.price_type,
-               abs(p1.price - p2.price) AS price_diff
-        FROM pivoted p1 INNER JOIN pivoted p2 ON p1.date < p2.date
-        WHERE p1.price_type = p2.price_type
-          AND p1.date >= %(date_from)s
-          AND p2.date <= %(date_to)s
-          AND p2.stock_id = p1.stock_id
-          AND p2.stock_id = %(stock_id)s
-
-    ''')
-
-    data_proxy = db.engine.execute(query, stock_id=stock.id, date_from=args['date_from'], date_to=args['date_to'])
-    data = list(data_proxy)
+    if args['summary']:
+        data = analytics.get_summary(stock_id, args['date_from'], args['date_to'], **filters)
+    else:
+        data = analytics.get_analytics(stock_id, args['date_from'], args['date_to'], top=args['top'], **filters)
 
     return build_response(
-        json_data=[dict(zip(data_proxy.keys(), row)) for row in data],
+        json_data=(row._asdict() for row in data),
         template_name='analytics.html',
         ticker=ticker,
         date_from=args['date_from'],
         date_to=args['date_to'],
+        summary=args['summary'],
+        top=args['top'],
+        min_diff=args['min_diff'],
+        max_span_days=args['max_span_days'],
         data=data
     )
 
@@ -196,6 +521,7 @@ delta_request_schema = {
 
 
 @blueprint.route('/<ticker>/delta')
+@cache.cached
 @flaskparser.use_args(delta_request_schema)
 def get_delta(args, ticker):
     """
@@ -208,41 +534,11 @@ def get_delta(args, ticker):
     :raises HTTPException with 404 code if the stock not found
     """
 
-    stock = models.Stock.query.filter_by(ticker=ticker).first_or_404()
-
-    query = textwrap.dedent('''
-
-        WITH diff_subquery AS (
-            SELECT q1.date AS start_date,
-                   q2.date AS end_date,
-                   q1.{price_type} AS start_price,
-                   q2.{price_type} AS end_price,
-                   q2.date - q1.date as date_diff,
-                   abs(q1.{price_type} - q2.{price_type}) AS price_diff
-            FROM quote q1 INNER JOIN quote q2 ON q1.date < q2.date
-            WHERE abs(q1.{price_type} - q2.{price_type}) >= %(value)s
-              AND q2.stock_id = q1.stock_id
-              AND q2.stock_id = %(stock_id)s
-        )
-        SELECT *
-        FROM diff_subquery
-        WHERE date_diff = (
-            SELECT MIN(date_diff)
-            FROM diff_subquery
-        )
-
-    ''')
-
-    column_name = args['type'] + '_price'
-    cursor = db.engine.raw_connection().cursor()
-
-    # to prevent sql injections use quote_ident function of psycopg2
-    safe_query = query.format(price_type=psycopg2.extensions.quote_ident(column_name, cursor))
-    data_proxy = db.engine.execute(safe_query, stock_id=stock.id, value=args['value'])
-    data = list(data_proxy)
+    stock_id = id_cache.stocks.get_or_404(ticker)
+    data = delta.get_deltas(stock_id, args['type'], args['value'])
 
     return build_response(
-        json_data=[dict(zip(data_proxy.keys(), row)) for row in data],
+        json_data=(row._asdict() for row in data),
         template_name='delta.html',
         ticker=ticker,
         value=args['value'],
@@ -265,7 +561,11 @@ def analytics_form():
                 'common.get_analytics',
                 ticker=form.ticker.data,
                 date_from=form.date_from.data,
-                date_to=form.date_to.data
+                date_to=form.date_to.data,
+                summary=form.summary.data or None,
+                top=form.top.data,
+                min_diff=form.min_diff.data,
+                max_span_days=form.max_span_days.data
             )
         )
 
@@ -291,3 +591,38 @@ def delta_form():
         )
 
     return flask.render_template('delta_form.html', form=form)
+
+
+@app.errorhandler(sqlalchemy.exc.OperationalError)
+def handle_operational_error(error):
+    """
+    Responds with 503 code if the request statement is cancelled by the statement timeout.
+    Other database errors are handled as internal server errors.
+    """
+
+    if not timeout.is_timeout_error(error):
+        raise error
+
+    app.logger.warning(f"Request statement timeout: {flask.request.full_path}")
+
+    return exceptions.ServiceUnavailable(description="The request took too long, try to narrow it down.")
+
+
+@app.errorhandler(timeout.ComputeLimitExceeded)
+def handle_compute_limit_error(error):
+    """
+    Responds with 503 code if the request calculation input exceeds the compute limit.
+    """
+
+    app.logger.warning(f"Request compute limit: {flask.request.full_path} ({error})")
+
+    return exceptions.ServiceUnavailable(description="The request is too large, try to narrow it down.")
+
+
+@app.route('/metrics')
+def get_metrics():
+    """
+    Returns the worker process metrics in Prometheus text format.
+    """
+
+    return flask.Response(metrics.render(), mimetype='text/plain; version=0.0.4')
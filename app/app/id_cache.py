@@ -0,0 +1,131 @@
+"""
+Ticker and insider name to identifier caches. The mappings are kept in every worker process, loaded at the worker
+startup and reloaded as soon as the data version (see :py:mod:`app.data_version`) changes so that request handlers
+and form validators resolve the names without database round trips.
+"""
+
+import logging
+import threading
+
+import flask
+
+from app import data_version as dv
+from app import db
+from app import models
+
+
+logger = logging.getLogger(__name__)
+
+
+class IdCache:
+    """
+    Thread-safe name to identifier mapping of a model. Names missing in the mapping are looked up
+    in the database so that the rows stored without the data version bump are found as well.
+    """
+
+    def __init__(self, model, name_column):
+        """
+        :param model: database model
+        :param name_column: unique name column of the model
+        """
+
+        self._model = model
+        self._name_column = name_column
+        self._ids = {}
+        self._version = None
+        self._lock = threading.Lock()
+
+    def refresh(self, version=None):
+        """
+        Reloads the mapping from the database.
+
+        :param version: data version the mapping is loaded for (the current one if None)
+        """
+
+        if version is None:
+            version = dv.get().version
+
+        rows = db.session.query(self._name_column, self._model.id).all()
+        with self._lock:
+            self._ids = dict(rows)
+            self._version = version
+
+    def _check_version(self):
+        version = dv.get().version
+        if version != self._version:
+            self.refresh(version)
+
+    def get(self, name):
+        """
+        Returns the identifier by the name.
+
+        :param name: name
+        :return: identifier or None if not found
+        """
+
+        self._check_version()
+
+        ident = self._ids.get(name)
+        if ident is None:
+            ident = db.session.query(self._model.id).filter(self._name_column == name).scalar()
+            if ident is not None:
+                with self._lock:
+                    self._ids[name] = ident
+
+        return ident
+
+    def get_many(self, names):
+        """
+        Returns the identifiers by the names.
+
+        :param names: names iterable
+        :return: dict of identifiers by name (the names not found are missing)
+        """
+
+        self._check_version()
+
+        ids = self._ids
+        result = {name: ids[name] for name in names if name in ids}
+
+        missing = set(names) - result.keys()
+        if missing:
+            rows = db.session.query(self._name_column, self._model.id).filter(self._name_column.in_(missing)).all()
+            with self._lock:
+                self._ids.update(rows)
+            result.update(rows)
+
+        return result
+
+    def get_or_404(self, name):
+        """
+        Returns the identifier by the name.
+
+        :param name: name
+        :return: identifier
+        :raises HTTPException with 404 code if not found
+        """
+
+        ident = self.get(name)
+        if ident is None:
+            flask.abort(404)
+
+        return ident
+
+
+stocks = IdCache(models.Stock, models.Stock.ticker)
+insiders = IdCache(models.Insider, models.Insider.name)
+
+
+def warm():
+    """
+    Loads the caches. Should be called on the worker startup, failures are logged and ignored
+    since the caches are loaded on the first use anyway.
+    """
+
+    try:
+        stocks.refresh()
+        insiders.refresh()
+    except Exception as e:
+        logger.warning(f"Identifier caches warming failed: {e}")
+    finally:
+        db.session.remove()
@@ -0,0 +1,306 @@
+"""
+Request performance instrumentation. The wall time of every request is split into the database time
+(statement execution and server-side cursor fetches), the template rendering time and the response body
+serialization time, the number of the executed statements and the returned rows is counted as well.
+The measurements are exported per endpoint by '/metrics' handler and sent in 'Server-Timing' header.
+The header is sent before the body so the serialization of the streamed bodies is reported by the metrics only.
+
+The statements executed longer than 'SLOW_QUERY_THRESHOLD' milliseconds are logged along with their plans.
+Only the statements the application database engine executes while handling a request are measured,
+the data fetcher, the maintenance scripts and the migrations are not instrumented.
+"""
+
+import logging
+import time
+
+import flask
+import jinja2
+import psycopg2
+import sqlalchemy
+
+from app import app
+from app import db
+from app import metrics
+
+
+logger = logging.getLogger(__name__)
+
+STATS_KEY = 'stocks_app.request_stats'
+
+SLOW_QUERY_SAVEPOINT = 'slow_query_explain'
+EXPLAINED_STATEMENTS = ('SELECT', 'WITH', 'EXECUTE')
+MAX_LOGGED_STATEMENT_LENGTH = 2000
+
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 10000, 100000, 1000000)
+
+REQUESTS_TOTAL = metrics.Counter('http_requests_total', 'Number of the handled requests.', ('endpoint', 'status'))
+REQUEST_SECONDS = metrics.Histogram(
+    'http_request_duration_seconds', 'Request wall time including the body streaming.', labelnames=('endpoint',)
+)
+REQUEST_DB_SECONDS = metrics.Histogram(
+    'http_request_db_seconds', 'Request database time.', labelnames=('endpoint',)
+)
+REQUEST_RENDER_SECONDS = metrics.Histogram(
+    'http_request_render_seconds', 'Request template rendering time (database time excluded).', labelnames=('endpoint',)
+)
+REQUEST_SERIALIZATION_SECONDS = metrics.Histogram(
+    'http_request_serialization_seconds', 'Request body serialization time (database time excluded).',
+    labelnames=('endpoint',)
+)
+REQUEST_QUERIES = metrics.Histogram(
+    'http_request_queries', 'Number of the statements executed by a request.', COUNT_BUCKETS, ('endpoint',)
+)
+REQUEST_ROWS = metrics.Histogram(
+    'http_request_rows', 'Number of the rows returned by the database for a request.', COUNT_BUCKETS, ('endpoint',)
+)
+SLOW_QUERIES_TOTAL = metrics.Counter('db_slow_queries_total', 'Number of the statements exceeded the slow threshold.')
+
+
+class RequestStats:
+    """
+    Request performance measurements.
+    """
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.queries = 0
+        self.render_time = 0.0
+        self.serialization_time = 0.0
+        self._execution_time = 0.0
+        self._rows = 0
+        self._server_side_cursors = []
+
+    def add_query(self, cursor, elapsed):
+        """
+        Accounts the executed statement.
+
+        :param cursor: dbapi cursor the statement was executed by
+        :param elapsed: execution time in seconds
+        """
+
+        self.queries += 1
+        self._execution_time += elapsed
+
+        if getattr(cursor, 'name', None) is not None:
+            # server-side cursor rows are fetched later, see 'pool.CountingCursor'
+            self._server_side_cursors.append(cursor)
+        elif cursor.description is not None:
+            self._rows += max(cursor.rowcount, 0)
+
+    @property
+    def db_time(self):
+        return self._execution_time + sum(getattr(cursor, 'fetch_time', 0.0) for cursor in self._server_side_cursors)
+
+    @property
+    def rows(self):
+        return self._rows + sum(getattr(cursor, 'fetched', 0) for cursor in self._server_side_cursors)
+
+    def measure(self, func, *args, **kwargs):
+        """
+        Calls the function measuring its time excluding the database time.
+
+        :return: tuple of the function result and the elapsed time in seconds
+        """
+
+        started_at, db_time = time.perf_counter(), self.db_time
+        result = func(*args, **kwargs)
+
+        return result, time.perf_counter() - started_at - (self.db_time - db_time)
+
+
+def get_stats():
+    """
+    :return: current request stats or None if called outside of a request
+    """
+
+    if not flask.has_request_context():
+        return None
+
+    return flask.request.environ.get(STATS_KEY)
+
+
+class InstrumentedTemplate(jinja2.Template):
+    """
+    Template measuring the rendering time of the request.
+    """
+
+    def render(self, *args, **kwargs):
+        stats = get_stats()
+        if stats is None:
+            return super().render(*args, **kwargs)
+
+        result, elapsed = stats.measure(super().render, *args, **kwargs)
+        stats.render_time += elapsed
+
+        return result
+
+
+app.jinja_env.template_class = InstrumentedTemplate
+
+
+def iter_measured(stats, chunks):
+    """
+    Iterates over the response body chunks measuring the time spent building them.
+
+    :param stats: request stats
+    :param chunks: response body iterable
+    :return: generator of chunks
+    """
+
+    chunks = iter(chunks)
+    try:
+        while True:
+            try:
+                chunk, elapsed = stats.measure(next, chunks)
+            except StopIteration:
+                break
+            stats.serialization_time += elapsed
+            yield chunk
+    finally:
+        close = getattr(chunks, 'close', None)
+        if close is not None:
+            close()
+
+
+def format_server_timing(stats):
+    """
+    Builds 'Server-Timing' header value.
+
+    :param stats: request stats
+    :return: header value
+    """
+
+    return ', '.join([
+        f'db;dur={stats.db_time * 1000:.1f};desc="{stats.queries} queries, {stats.rows} rows"',
+        f'render;dur={stats.render_time * 1000:.1f}',
+        f'app;dur={(time.perf_counter() - stats.started_at) * 1000:.1f}',
+    ])
+
+
+def record(stats, endpoint, status):
+    """
+    Records the request measurements to the metrics.
+
+    :param stats: request stats
+    :param endpoint: request endpoint name
+    :param status: response status code
+    """
+
+    REQUESTS_TOTAL.inc(endpoint=endpoint, status=status)
+    REQUEST_SECONDS.observe(time.perf_counter() - stats.started_at, endpoint=endpoint)
+    REQUEST_DB_SECONDS.observe(stats.db_time, endpoint=endpoint)
+    REQUEST_RENDER_SECONDS.observe(stats.render_time, endpoint=endpoint)
+    REQUEST_SERIALIZATION_SECONDS.observe(stats.serialization_time, endpoint=endpoint)
+    REQUEST_QUERIES.observe(stats.queries, endpoint=endpoint)
+    REQUEST_ROWS.observe(stats.rows, endpoint=endpoint)
+
+
+@app.before_request
+def start_request():
+    flask.request.environ[STATS_KEY] = RequestStats()
+
+
+@app.after_request
+def finish_request(response):
+    """
+    Sends 'Server-Timing' header and records the metrics after the response body is sent.
+    """
+
+    stats = get_stats()
+    if stats is None:
+        return response
+
+    response.headers['Server-Timing'] = format_server_timing(stats)
+    if response.is_streamed:
+        response.response = iter_measured(stats, response.response)
+
+    endpoint, status = flask.request.endpoint or 'unknown', response.status_code
+    response.call_on_close(lambda: record(stats, endpoint, status))
+
+    return response
+
+
+def explain(dbapi_connection, statement, parameters):
+    """
+    Explains the statement in a savepoint so that a failure doesn't abort the transaction.
+
+    :param dbapi_connection: psycopg2 connection
+    :param statement: sql statement
+    :param parameters: statement parameters
+    :return: plan text
+    """
+
+    use_savepoint = not dbapi_connection.autocommit
+    with dbapi_connection.cursor() as cursor:
+        if use_savepoint:
+            cursor.execute(f'SAVEPOINT {SLOW_QUERY_SAVEPOINT}')
+        try:
+            cursor.execute(f'EXPLAIN {statement}', parameters)
+            plan = '\n'.join(row[0] for row in cursor.fetchall())
+        except psycopg2.Error:
+            if use_savepoint:
+                cursor.execute(f'ROLLBACK TO SAVEPOINT {SLOW_QUERY_SAVEPOINT}')
+            raise
+
+        if use_savepoint:
+            cursor.execute(f'RELEASE SAVEPOINT {SLOW_QUERY_SAVEPOINT}')
+
+    return plan
+
+
+def log_slow_query(cursor, statement, parameters, elapsed, executemany):
+    """
+    Logs the slow statement with its plan.
+
+    :param cursor: dbapi cursor the statement was executed by
+    :param statement: sql statement
+    :param parameters: statement parameters
+    :param elapsed: execution time in seconds
+    :param executemany: True if the statement was executed for many parameter sets
+    """
+
+    SLOW_QUERIES_TOTAL.inc()
+
+    plan = None
+    if not executemany and statement.lstrip().upper().startswith(EXPLAINED_STATEMENTS):
+        try:
+            plan = explain(cursor.connection, statement, parameters)
+        except Exception as e:
+            logger.warning(f"Slow query explain failed: {e}")
+
+    if len(statement) > MAX_LOGGED_STATEMENT_LENGTH:
+        statement = statement[:MAX_LOGGED_STATEMENT_LENGTH] + '...'
+
+    message = f"Slow query ({elapsed * 1000:.1f} ms"
+    if flask.has_request_context():
+        message += f", {flask.request.full_path}"
+    message += f"):\n{statement}"
+    if plan is not None:
+        message += f"\nPlan:\n{plan}"
+
+    logger.warning(message)
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if flask.has_request_context():
+        conn.info['query_started_at'] = time.perf_counter()
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started_at = conn.info.pop('query_started_at', None)
+    if started_at is None:
+        return
+
+    elapsed = time.perf_counter() - started_at
+
+    stats = get_stats()
+    if stats is not None:
+        stats.add_query(cursor, elapsed)
+
+    threshold = app.config['SLOW_QUERY_THRESHOLD']
+    if threshold and elapsed * 1000 >= threshold:
+        log_slow_query(cursor, statement, parameters, elapsed, executemany)
+
+
+sqlalchemy.event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+sqlalchemy.event.listen(db.engine, 'after_cursor_execute', after_cursor_execute)
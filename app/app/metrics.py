@@ -0,0 +1,197 @@
+"""
+Process metrics in Prometheus text exposition format. The metrics are collected per worker process
+and exposed by '/metrics' handler.
+"""
+
+import bisect
+import threading
+
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+REGISTRY = []
+
+
+def format_value(value):
+    """
+    Formats the metric value.
+
+    :param value: number
+    :return: formatted value
+    """
+
+    if value == float('inf'):
+        return '+Inf'
+
+    return repr(float(value))
+
+
+def format_labels(pairs):
+    """
+    Formats the metric labels.
+
+    :param pairs: iterable of (label name, label value) tuples
+    :return: labels string
+    """
+
+    labels = ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in pairs
+    )
+
+    return f'{{{labels}}}' if labels else ''
+
+
+class Metric:
+    """
+    Base metric. Metric values are kept separately for every combination of the label values.
+    """
+
+    type = None
+
+    def __init__(self, name, description, labelnames=()):
+        """
+        :param name: metric name
+        :param description: metric help text
+        :param labelnames: label names
+        """
+
+        self.name = name
+        self.description = description
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _get_key(self, labels):
+        return tuple(labels[name] for name in self.labelnames)
+
+    def _format_labels(self, key, *extra):
+        return format_labels([*zip(self.labelnames, key), *extra])
+
+    def collect(self):
+        """
+        :return: list of (sample name, labels string, value) tuples
+        """
+
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    """
+    Monotonically increasing value.
+    """
+
+    type = 'counter'
+
+    def __init__(self, name, description, labelnames=()):
+        super().__init__(name, description, labelnames)
+        self._values = {} if self.labelnames else {(): 0}
+
+    def inc(self, amount=1, **labels):
+        """
+        Increments the counter.
+
+        :param amount: increment
+        :param labels: label values
+        """
+
+        key = self._get_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def collect(self):
+        with self._lock:
+            values = sorted(self._values.items())
+
+        return [(self.name, self._format_labels(key), value) for key, value in values]
+
+
+class Gauge(Metric):
+    """
+    Value calculated on collection by a function.
+    """
+
+    type = 'gauge'
+
+    def __init__(self, name, description, func):
+        """
+        :param name: metric name
+        :param description: metric help text
+        :param func: function returning the current value
+        """
+
+        super().__init__(name, description)
+        self._func = func
+
+    def collect(self):
+        return [(self.name, '', self._func())]
+
+
+class Histogram(Metric):
+    """
+    Distribution of the observed values over the buckets.
+    """
+
+    type = 'histogram'
+
+    def __init__(self, name, description, buckets=DEFAULT_BUCKETS, labelnames=()):
+        """
+        :param name: metric name
+        :param description: metric help text
+        :param buckets: sorted bucket upper bounds
+        :param labelnames: label names
+        """
+
+        super().__init__(name, description, labelnames)
+        self._buckets = tuple(buckets)
+        # bucket counts and sum by label values
+        self._values = {} if self.labelnames else {(): ([0] * (len(self._buckets) + 1), [0.0])}
+
+    def observe(self, value, **labels):
+        """
+        Adds the value to the distribution.
+
+        :param value: observed value
+        :param labels: label values
+        """
+
+        key = self._get_key(labels)
+        pos = bisect.bisect_left(self._buckets, value)
+        with self._lock:
+            counts, total = self._values.setdefault(key, ([0] * (len(self._buckets) + 1), [0.0]))
+            counts[pos] += 1
+            total[0] += value
+
+    def collect(self):
+        with self._lock:
+            values = sorted((key, list(counts), total[0]) for key, (counts, total) in self._values.items())
+
+        samples = []
+        for key, counts, total in values:
+            cumulative = 0
+            for bound, count in zip(self._buckets + (float('inf'),), counts):
+                cumulative += count
+                labels = self._format_labels(key, ('le', format_value(bound)))
+                samples.append((f'{self.name}_bucket', labels, cumulative))
+
+            samples.append((f'{self.name}_sum', self._format_labels(key), total))
+            samples.append((f'{self.name}_count', self._format_labels(key), cumulative))
+
+        return samples
+
+
+def render():
+    """
+    Renders the registered metrics.
+
+    :return: Prometheus text exposition
+    """
+
+    lines = []
+    for metric in REGISTRY:
+        lines.append(f'# HELP {metric.name} {metric.description}')
+        lines.append(f'# TYPE {metric.name} {metric.type}')
+        for name, labels, value in metric.collect():
+            lines.append(f'{name}{labels} {format_value(value)}')
+
+    return '\n'.join(lines) + '\n'
@@ -50,6 +50,10 @@ class Quote(db.Model):
 
     __table_args__ = (
         db.UniqueConstraint('stock_id', 'date'),
+        db.Index(
+            'ix_quote_stock_id_date_prices',
+            'stock_id', 'date', 'open_price', 'close_price', 'high_price', 'low_price', 'volume'
+        ),
     )
 
     id = db.Column(db.Integer, primary_key=True)
@@ -81,6 +85,13 @@ class Trade(db.Model):
     Trade database model.
     """
 
+    __table_args__ = (
+        db.Index('ix_trade_stock_id_last_date_id', 'stock_id', 'last_date', 'id'),
+        db.Index(
+            'ix_trade_stock_id_transaction_type_last_date_id', 'stock_id', 'transaction_type', 'last_date', 'id'
+        ),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     stock_id = db.Column(db.Integer, db.ForeignKey(Stock.id, onupdate='cascade'), nullable=False)
     insider_id = db.Column(db.Integer, db.ForeignKey(Insider.id, onupdate='cascade'), nullable=False)
@@ -92,3 +103,62 @@ class Trade(db.Model):
     shares_traded = db.Column(db.Integer, nullable=False)
     last_price = db.Column(db.Float, nullable=True)
     shares_hold = db.Column(db.Integer, nullable=False)
+
+
+class QuoteStats(db.Model):
+    """
+    Quote statistics database model. Contains derived statistics of a stock price of a particular type
+    as of the quote date (see :py:mod:`app.stats`).
+    """
+
+    __tablename__ = 'quote_stats'
+    __table_args__ = (
+        db.UniqueConstraint('stock_id', 'date', 'price_type'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    stock_id = db.Column(db.Integer, db.ForeignKey(Stock.id, onupdate='cascade'), nullable=False)
+    date = db.Column(db.Date, nullable=False)
+    price_type = db.Column(db.Enum(PriceType), nullable=False)
+
+    price = db.Column(db.Float, nullable=False)
+    daily_return = db.Column(db.Float, nullable=True)
+    rolling_mean = db.Column(db.Float, nullable=False)
+    rolling_std = db.Column(db.Float, nullable=True)
+    running_max = db.Column(db.Float, nullable=False)
+    running_min = db.Column(db.Float, nullable=False)
+    max_drawdown = db.Column(db.Float, nullable=False)
+    max_abs_return = db.Column(db.Float, nullable=True)
+
+
+# removes the trades duplicated by the natural key keeping the earliest stored ones
+REMOVE_DUPLICATED_TRADES = '''
+    DELETE FROM trade
+    WHERE id IN (
+        SELECT id
+        FROM (
+            SELECT id,
+                   row_number() OVER (
+                       PARTITION BY stock_id, insider_id, last_date, transaction_type,
+                                    owner_type, shares_traded, last_price, shares_hold
+                       ORDER BY id
+                   ) AS row_number
+            FROM trade
+        ) numbered
+        WHERE row_number > 1
+    )
+'''
+
+# trade natural key, the price is coalesced since nulls are not considered equal by unique indexes
+db.Index(
+    'ix_trade_natural_key',
+    Trade.stock_id,
+    Trade.insider_id,
+    Trade.last_date,
+    Trade.transaction_type,
+    Trade.owner_type,
+    Trade.shares_traded,
+    db.func.coalesce(Trade.last_price, -1),
+    Trade.shares_hold,
+    unique=True,
+)
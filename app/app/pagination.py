@@ -0,0 +1,78 @@
+"""
+Keyset pagination. Rows are ordered by a unique key and a page starts right after the key of the previous page
+last row so that only the rows of the requested page are read from the key index whatever the page position is.
+"""
+
+import urllib
+
+import flask
+import sqlalchemy
+
+from app import app
+
+
+def page_query(query, key_columns, after=None, limit=None):
+    """
+    Orders the query by the key and restricts it to a page of the rows. One extra row is selected
+    to find out if it is the last page.
+
+    :param query: sqlalchemy query
+    :param key_columns: key columns the rows are ordered by (unique together)
+    :param after: key values of the previous page last row, the first page is selected if None
+    :param limit: maximum number of rows in the page, all the rows after the cursor are selected if None
+    :return: page query
+    """
+
+    if after is not None:
+        if len(key_columns) == 1:
+            query = query.filter(key_columns[0] > after[0])
+        else:
+            query = query.filter(sqlalchemy.tuple_(*key_columns) > sqlalchemy.tuple_(*after))
+
+    query = query.order_by(*key_columns)
+
+    return query if limit is None else query.limit(limit + 1)
+
+
+def paginate(query, key_columns, after=None, limit=None):
+    """
+    Orders the query by the key and selects a page of the rows (see :py:func:`page_query`).
+
+    :param query: sqlalchemy query
+    :param key_columns: key columns the rows are ordered by (unique together)
+    :param after: key values of the previous page last row, the first page is selected if None
+    :param limit: maximum number of rows in the page, all the rows after the cursor are selected if None
+    :return: tuple of rows iterable and the next page key values (None if it is the last page)
+    """
+
+    query = page_query(query, key_columns, after, limit)
+
+    if limit is None:
+        return query.yield_per(app.config['STREAM_BATCH_SIZE']), None
+
+    rows = query.all()
+    if len(rows) <= limit:
+        return rows, None
+
+    rows = rows[:limit]
+
+    return rows, tuple(getattr(rows[-1], column.key) for column in key_columns)
+
+
+def build_url(**args):
+    """
+    Builds the current request url with the query parameters replaced.
+
+    :param args: query parameters to be replaced (removed if None)
+    :return: url
+    """
+
+    query_args = flask.request.args.copy()
+    for name, value in args.items():
+        query_args.pop(name, None)
+        if value is not None:
+            query_args[name] = value
+
+    path = urllib.parse.quote(flask.request.path)
+
+    return f'{path}?{urllib.parse.urlencode(list(query_args.items(multi=True)))}'
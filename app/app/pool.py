@@ -0,0 +1,97 @@
+"""
+Database connection instrumentation. The pool measures how long the connection checkout takes
+(waiting for a free connection included) so that an undersized pool shows up in the metrics.
+The connections create the cursors counting the rows fetched by the server-side cursors.
+"""
+
+import time
+
+import psycopg2.extensions
+import sqlalchemy
+from sqlalchemy import pool
+
+from app import metrics
+
+
+CHECKOUT_SECONDS = metrics.Histogram(
+    'db_pool_checkout_seconds', 'Time spent waiting for a database connection from the pool.'
+)
+CHECKOUT_TIMEOUTS = metrics.Counter(
+    'db_pool_checkout_timeouts_total', 'Number of the connection checkouts failed by the pool timeout.'
+)
+
+
+class MeteredQueuePool(pool.QueuePool):
+    """
+    Queue pool collecting the connection checkout metrics.
+    """
+
+    current = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # the pool is recreated on engine disposal, the status gauges report the latest one
+        MeteredQueuePool.current = self
+
+    def _do_get(self):
+        started_at = time.perf_counter()
+        try:
+            return super()._do_get()
+        except sqlalchemy.exc.TimeoutError:
+            CHECKOUT_TIMEOUTS.inc()
+            raise
+        finally:
+            CHECKOUT_SECONDS.observe(time.perf_counter() - started_at)
+
+
+class CountingCursor(psycopg2.extensions.cursor):
+    """
+    Cursor counting the rows fetched by batches and the time spent fetching them. The row count of
+    a server-side cursor is not known after the execution, its rows are fetched from the database
+    by 'fetchmany' calls while the result is iterated. 'fetchone' is not overridden to keep
+    the row by row iteration of the client-side cursor results fast.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fetched = 0
+        self.fetch_time = 0.0
+
+    def fetchmany(self, *args, **kwargs):
+        started_at = time.perf_counter()
+        rows = super().fetchmany(*args, **kwargs)
+        self.fetch_time += time.perf_counter() - started_at
+        self.fetched += len(rows)
+
+        return rows
+
+    def fetchall(self):
+        started_at = time.perf_counter()
+        rows = super().fetchall()
+        self.fetch_time += time.perf_counter() - started_at
+        self.fetched += len(rows)
+
+        return rows
+
+
+def get_status(name):
+    """
+    Returns the current pool status value.
+
+    :param name: pool method name ('size', 'checkedout', 'overflow' or 'checkedin')
+    :return: value or 0 if the pool is not created yet
+    """
+
+    current = MeteredQueuePool.current
+
+    return getattr(current, name)() if current is not None else 0
+
+
+POOL_SIZE = metrics.Gauge('db_pool_size', 'Configured pool size.', lambda: get_status('size'))
+POOL_CHECKED_OUT = metrics.Gauge(
+    'db_pool_checked_out', 'Number of the connections in use.', lambda: get_status('checkedout')
+)
+POOL_OVERFLOW = metrics.Gauge(
+    'db_pool_overflow', 'Number of the overflow connections (negative while the pool is not filled).',
+    lambda: get_status('overflow')
+)
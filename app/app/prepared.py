@@ -0,0 +1,83 @@
+"""
+Server-side prepared statements. psycopg2 sends every query as a text so the database parses and plans it
+on each execution. The hot fixed-shape queries are prepared once per database connection with 'PREPARE'
+and executed with 'EXECUTE' afterwards. The prepared statement names are kept in the pooled connection info
+which is cleared by the pool when the connection is recreated.
+"""
+
+import re
+
+from app import db
+
+
+class PreparedQuery:
+    """
+    Sqlalchemy core statement prepared on the database side.
+    """
+
+    INFO_KEY = 'prepared_statements'
+
+    def __init__(self, name, statement):
+        """
+        :param name: unique statement name
+        :param statement: sqlalchemy core statement, parameters should be declared by named bind parameters
+        """
+
+        self.name = name
+        self._statement = statement
+        self._param_names = None
+        self._sql = None
+
+    def _compile(self):
+        compiled = self._statement.compile(dialect=db.engine.dialect)
+        param_names = []
+
+        def replace(match):
+            param_name = match.group(1)
+            if param_name not in param_names:
+                param_names.append(param_name)
+            return f'${param_names.index(param_name) + 1}'
+
+        # psycopg2 dialect renders the parameters as '%(name)s', 'PREPARE' requires positional '$n' ones
+        # the '%%' escapes are kept since the statements are passed through the driver parameters formatting
+        self._sql = re.sub(r'%\((\w+)\)s', replace, str(compiled))
+        self._param_names = param_names
+
+    def bind(self, **params):
+        """
+        Prepares the statement for the session connection if it is not yet prepared.
+
+        :param params: statement parameters
+        :return: tuple of the 'EXECUTE' statement text and its parameters
+        """
+
+        if self._sql is None:
+            self._compile()
+
+        connection = db.session.connection()
+        prepared = connection.info.setdefault(self.INFO_KEY, set())
+        if self.name not in prepared:
+            connection.execute(f'PREPARE {self.name} AS {self._sql}')
+            prepared.add(self.name)
+
+        if not self._param_names:
+            return f'EXECUTE {self.name}', {}
+
+        args = ', '.join(f'%({param_name})s' for param_name in self._param_names)
+
+        return f'EXECUTE {self.name}({args})', {name: params[name] for name in self._param_names}
+
+    def execute(self, **params):
+        """
+        Executes the statement in the current session transaction preparing it if it is not yet prepared
+        for the session connection.
+
+        :param params: statement parameters
+        :return: result proxy
+        """
+
+        statement, params = self.bind(**params)
+        if not params:
+            return db.session.connection().execute(statement)
+
+        return db.session.connection().execute(statement, params)
@@ -1,10 +1,13 @@
 """
-Database model serialization schemas.
+Database model serialization schemas and precompiled row serializers.
 """
 
+import functools
+
 import marshmallow as mm
 import marshmallow_sqlalchemy as ms
 
+from app import db
 from app import models
 
 
@@ -28,6 +31,16 @@ class QuoteApiSchema(ms.ModelSchema):
         exclude = ('id', 'stock_id')
 
 
+class QuoteStatsApiSchema(ms.ModelSchema):
+    """
+    Quote statistics model api serialization schema.
+    """
+
+    class Meta:
+        model = models.QuoteStats
+        exclude = ('id', 'stock_id')
+
+
 class InsiderApiSchema(ms.ModelSchema):
     """
     Insider model api serialization schema.
@@ -47,3 +60,108 @@ class TradeApiSchema(ms.ModelSchema):
         model = models.Trade
 
     insider = mm.fields.Nested(InsiderApiSchema)
+
+
+class RowSerializer:
+    """
+    Precompiled schema serializer. Selects only the columns the schema fields are built from
+    and converts the selected rows to dicts using a function generated once for the schema.
+    The result is the same as the schema produces for the model objects.
+    """
+
+    # converters of the field types not changing the value or returning a json serializable one
+    CONVERTERS = {
+        mm.fields.Field: None,
+        mm.fields.String: None,
+        mm.fields.Integer: 'int({})',
+        mm.fields.Float: 'float({})',
+        mm.fields.Date: '{}.isoformat()',
+    }
+
+    def __init__(self, schema, extra_columns=()):
+        """
+        :param schema: model schema instance ('only' and 'exclude' options are taken into account)
+        :param extra_columns: columns to be selected in addition to the schema ones (not serialized)
+        """
+
+        self.model = schema.opts.model
+        self.columns = []
+        self.joins = []
+        self._namespace = {}
+
+        source = self._compile_schema(schema, self.model, prefix='')
+        for column in extra_columns:
+            if column.key not in {col.key for col in self.columns}:
+                self.columns.append(column.label(column.key))
+
+        exec(f'def row_to_dict(row):\n    return {source}\n', self._namespace)
+        self.row_to_dict = self._namespace['row_to_dict']
+
+    def _compile_schema(self, schema, model, prefix):
+        items = []
+        for name, field in sorted(schema.fields.items()):
+            if isinstance(field, mm.fields.Nested):
+                relationship = getattr(model, name)
+                self.joins.append(relationship)
+                nested = self._compile_schema(field.schema, relationship.property.mapper.class_, prefix=name + '_')
+                items.append(f'{name!r}: {nested}')
+            else:
+                items.append(f'{name!r}: {self._compile_field(field, getattr(model, name), prefix + name)}')
+
+        return '{' + ', '.join(items) + '}'
+
+    def _compile_field(self, field, column, label):
+        idx = len(self.columns)
+        self.columns.append(column.label(label))
+        value = f'row[{idx}]'
+
+        if type(field) in self.CONVERTERS:
+            converter = self.CONVERTERS[type(field)]
+            if converter is None:
+                return value
+            expression = converter.format(value)
+        else:
+            self._namespace[f'field_{idx}'] = field
+            expression = f'field_{idx}._serialize({value}, {field.name!r}, None)'
+
+        if column.nullable:
+            expression = f'(None if {value} is None else {expression})'
+
+        return expression
+
+    def query(self):
+        """
+        Builds the query selecting the serialized columns.
+
+        :return: sqlalchemy query
+        """
+
+        query = db.session.query(*self.columns).select_from(self.model)
+        for relationship in self.joins:
+            query = query.join(relationship)
+
+        return query
+
+    def dump_iter(self, rows):
+        """
+        Serializes the rows selected by :py:meth:`query` one by one.
+
+        :param rows: rows iterable
+        :return: serialized rows generator
+        """
+
+        return map(self.row_to_dict, rows)
+
+
+@functools.lru_cache()
+def get_row_serializer(schema_class, only=None, extra_columns=()):
+    """
+    Returns the row serializer of the schema. The serializers are compiled once and cached.
+
+    :param schema_class: model schema class
+    :param only: tuple of the field names to be serialized (all if None)
+    :param extra_columns: columns to be selected in addition to the schema ones
+    :return: :py:class:`RowSerializer`
+    """
+
+    return RowSerializer(schema_class(only=only), extra_columns=extra_columns)
@@ -0,0 +1,167 @@
+"""
+Quote snapshot files. The data fetcher writes the quotes of every stock to '<directory>/<stock id>.quotes' file
+('QUOTE_SNAPSHOT_DIR' configuration parameter) after the ingestion, the files are published by atomic rename.
+The quote store (see :py:mod:`app.store`) maps the files read-only so the worker processes share the same memory
+pages instead of loading private copies from the database.
+
+A file consists of a header (magic, quotes version, number of quotes), int32 date ordinals padded to 8 bytes
+and float64 columns. A snapshot is used only if it was written at the current quotes version (see
+:py:data:`app.data_version.QUOTES`), otherwise the quotes are loaded from the database which stays the source
+of truth. Trade writes don't bump the quotes version so they keep the snapshots valid.
+"""
+
+import itertools
+import logging
+import mmap
+import os
+import struct
+import tempfile
+
+import numpy as np
+import sqlalchemy
+
+from app import data_version as dv
+from app import db
+from app import models
+
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'STKQUOT1'
+HEADER = struct.Struct('<8sqq')
+HEADER_SIZE = 32
+SUFFIX = '.quotes'
+
+
+def get_path(directory, stock_id):
+    """
+    :return: path of the stock snapshot file
+    """
+
+    return os.path.join(directory, f'{stock_id}{SUFFIX}')
+
+
+def get_layout(count, names):
+    """
+    Calculates the file layout.
+
+    :param count: number of quotes
+    :param names: column names
+    :return: tuple of the ordinals offset, dict of the column offsets by name and the file size
+    """
+
+    offset = HEADER_SIZE
+    ordinals_offset = offset
+    offset += (count * 4 + 7) // 8 * 8
+
+    column_offsets = {}
+    for name in names:
+        column_offsets[name] = offset
+        offset += count * 8
+
+    return ordinals_offset, column_offsets, offset
+
+
+def write(directory, stock_id, version, ordinals, columns):
+    """
+    Writes the stock snapshot to a temporary file and renames it to the snapshot file so the readers
+    see either the previous snapshot or the complete new one.
+
+    :param directory: snapshots directory
+    :param stock_id: stock identifier
+    :param version: quotes version the quotes were read at
+    :param ordinals: int32 array of the quote date ordinals
+    :param columns: dict of float64 arrays by column name
+    """
+
+    count = len(ordinals)
+    ordinals_offset, column_offsets, size = get_layout(count, columns)
+
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            file.write(HEADER.pack(MAGIC, version, count).ljust(HEADER_SIZE, b'\0'))
+            file.seek(ordinals_offset)
+            file.write(np.ascontiguousarray(ordinals, dtype='<i4').tobytes())
+            for name, column in columns.items():
+                file.seek(column_offsets[name])
+                file.write(np.ascontiguousarray(column, dtype='<f8').tobytes())
+            file.truncate(size)
+            file.flush()
+            os.fsync(file.fileno())
+
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, get_path(directory, stock_id))
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def read(directory, stock_id, version, names):
+    """
+    Maps the stock snapshot file. The returned arrays are read-only views of the mapped memory.
+
+    :param directory: snapshots directory
+    :param stock_id: stock identifier
+    :param version: current quotes version
+    :param names: column names
+    :return: tuple of the ordinals array and dict of column arrays by name or None if there is no valid snapshot
+    """
+
+    try:
+        with open(get_path(directory, stock_id), 'rb') as file:
+            if os.fstat(file.fileno()).st_size < HEADER_SIZE:
+                return None
+            buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    except FileNotFoundError:
+        return None
+
+    magic, snapshot_version, count = HEADER.unpack_from(buffer)
+    if magic != MAGIC or snapshot_version != version:
+        buffer.close()
+        return None
+
+    ordinals_offset, column_offsets, size = get_layout(count, names)
+    if len(buffer) != size:
+        logger.warning(f"Snapshot of stock {stock_id} is corrupted: {len(buffer)} bytes instead of {size}")
+        buffer.close()
+        return None
+
+    ordinals = np.frombuffer(buffer, dtype='<i4', count=count, offset=ordinals_offset)
+    columns = {
+        name: np.frombuffer(buffer, dtype='<f8', count=count, offset=column_offsets[name]) for name in names
+    }
+
+    return ordinals, columns
+
+
+def write_all(directory, names, batch_size=10000):
+    """
+    Writes the snapshots of all the stored stocks. The quotes version is read before the quotes so that
+    the snapshots are considered stale if any quotes are written meanwhile.
+
+    :param directory: snapshots directory
+    :param names: quote column names to be written
+    :param batch_size: number of quote rows fetched at once
+    :return: number of the written snapshots
+    """
+
+    os.makedirs(directory, exist_ok=True)
+    version = dv.get(dv.QUOTES).version
+
+    columns = [getattr(models.Quote, name) for name in names]
+    query = sqlalchemy.select([models.Quote.stock_id, models.Quote.date, *columns]).\
+        order_by(models.Quote.stock_id, models.Quote.date)
+
+    count = 0
+    with db.engine.connect() as connection:
+        rows = connection.execution_options(stream_results=True, max_row_buffer=batch_size).execute(query)
+        for stock_id, stock_rows in itertools.groupby(rows, key=lambda row: row[0]):
+            stock_rows = list(stock_rows)
+            ordinals = np.fromiter((row[1].toordinal() for row in stock_rows), dtype=np.int32, count=len(stock_rows))
+            values = np.array([row[2:] for row in stock_rows], dtype=np.float64).reshape(len(stock_rows), len(names))
+
+            write(directory, stock_id, version, ordinals, {name: values[:, idx] for idx, name in enumerate(names)})
+            count += 1
+
+    return count
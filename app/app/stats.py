@@ -0,0 +1,167 @@
+"""
+Quote statistics. Daily returns, rolling mean and standard deviation and running extremes of the stock prices
+are precomputed per price type by the data fetcher and stored to 'quote_stats' table. The statistics are
+recomputed incrementally: only the rows of the new (or rewritten) quote dates are calculated using
+the last window of the previous quotes and the last stored statistics row.
+"""
+
+import datetime
+import math
+
+import numpy as np
+import sqlalchemy
+
+from app import db
+from app import models
+
+
+ROLLING_WINDOW = 30
+
+PRICE_TYPES = tuple(models.PriceType)
+
+
+def window_view(values, window):
+    """
+    Returns the array of the trailing windows of the values. The windows of the first values are padded with nans.
+
+    :param values: 1-d float array
+    :param window: window size
+    :return: 2-d array, i-th row is the window ending with i-th value
+    """
+
+    padded = np.concatenate([np.full(window - 1, np.nan), values])
+    stride, = padded.strides
+
+    return np.lib.stride_tricks.as_strided(
+        padded, shape=(len(values), window), strides=(stride, stride), writeable=False
+    )
+
+
+def compute_stats(prices, prior_count, prior_state, window=ROLLING_WINDOW):
+    """
+    Calculates the statistics of the new prices.
+
+    :param prices: price array ordered by date, the first 'prior_count' prices are the already processed ones
+                   (at least 'window' of them if the stock has so many)
+    :param prior_count: number of the already processed prices
+    :param prior_state: (running max, running min, max drawdown, max absolute return) of the last processed price
+                        or None if there are no processed prices
+    :param window: rolling window size
+    :return: dict of the statistics arrays of the new prices by the statistics name
+    """
+
+    prices = np.asarray(prices, dtype=np.float64)
+    new_prices = prices[prior_count:]
+
+    returns = np.full(len(prices), np.nan)
+    returns[1:] = prices[1:] / prices[:-1] - 1
+
+    price_windows = window_view(prices, window)[prior_count:]
+    rolling_mean = np.nanmean(price_windows, axis=1)
+
+    return_windows = window_view(returns, window)[prior_count:]
+    counts = np.count_nonzero(~np.isnan(return_windows), axis=1)
+    means = np.nansum(return_windows, axis=1) / np.maximum(counts, 1)
+    squares = np.nansum((return_windows - means[:, np.newaxis]) ** 2, axis=1)
+    rolling_std = np.where(counts > 1, np.sqrt(squares / np.maximum(counts - 1, 1)), np.nan)
+
+    prior_max, prior_min, prior_drawdown, prior_abs_return = prior_state or (-np.inf, np.inf, 0.0, np.nan)
+    running_max = np.maximum.accumulate(np.concatenate([[prior_max], new_prices]))[1:]
+    running_min = np.minimum.accumulate(np.concatenate([[prior_min], new_prices]))[1:]
+    max_drawdown = np.minimum.accumulate(np.concatenate([[prior_drawdown], new_prices / running_max - 1]))[1:]
+    # fmax ignores nans so the return of the very first price doesn't hide the next ones
+    max_abs_return = np.fmax.accumulate(np.concatenate([[prior_abs_return], np.abs(returns[prior_count:])]))[1:]
+
+    return dict(
+        price=new_prices,
+        daily_return=returns[prior_count:],
+        rolling_mean=rolling_mean,
+        rolling_std=rolling_std,
+        running_max=running_max,
+        running_min=running_min,
+        max_drawdown=max_drawdown,
+        max_abs_return=max_abs_return,
+    )
+
+
+def get_start_date(stock_id, date_from):
+    """
+    Returns the date the statistics should be recomputed from. It is the earliest of the changed quotes date
+    and the date following the last stored statistics so that the gaps left by the previous runs are filled.
+
+    :param stock_id: stock identifier
+    :param date_from: the earliest changed quote date
+    :return: start date or None if the statistics should be computed from the first quote
+    """
+
+    last_date = db.session.query(sqlalchemy.func.max(models.QuoteStats.date)).\
+        filter(models.QuoteStats.stock_id == stock_id).\
+        scalar()
+    if last_date is None:
+        return None
+
+    return min(date_from, last_date + datetime.timedelta(days=1))
+
+
+def update_stats(stock_id, date_from, window=ROLLING_WINDOW):
+    """
+    Recomputes the stock statistics of the quotes starting from the date. Should be called in the transaction
+    the quotes are written in.
+
+    :param stock_id: stock identifier
+    :param date_from: the earliest changed quote date
+    :param window: rolling window size
+    :return: number of the written statistics rows
+    """
+
+    start_date = get_start_date(stock_id, date_from)
+    price_columns = [getattr(models.Quote, f'{price_type}_price') for price_type in PRICE_TYPES]
+
+    quotes_query = db.session.query(models.Quote.date, *price_columns).filter(models.Quote.stock_id == stock_id)
+    stats_query = models.QuoteStats.query.filter(models.QuoteStats.stock_id == stock_id)
+
+    if start_date is not None:
+        prior_quotes = quotes_query.\
+            filter(models.Quote.date < start_date).\
+            order_by(models.Quote.date.desc()).\
+            limit(window).\
+            all()[::-1]
+        new_quotes = quotes_query.filter(models.Quote.date >= start_date).order_by(models.Quote.date).all()
+
+        prior_date = db.session.query(sqlalchemy.func.max(models.QuoteStats.date)).\
+            filter(models.QuoteStats.stock_id == stock_id, models.QuoteStats.date < start_date).\
+            as_scalar()
+        prior_stats = stats_query.filter(models.QuoteStats.date == prior_date).all()
+
+        stats_query.filter(models.QuoteStats.date >= start_date).delete(synchronize_session=False)
+    else:
+        prior_quotes, prior_stats = [], []
+        new_quotes = quotes_query.order_by(models.Quote.date).all()
+        stats_query.delete(synchronize_session=False)
+
+    if not new_quotes:
+        return 0
+
+    prior_states = {
+        stats.price_type: (stats.running_max, stats.running_min, stats.max_drawdown, stats.max_abs_return)
+        for stats in prior_stats
+    }
+    quotes = prior_quotes + new_quotes
+    rows = []
+
+    for idx, price_type in enumerate(PRICE_TYPES, start=1):
+        prior_state = prior_states.get(price_type)
+        if prior_state is not None and prior_state[3] is None:
+            prior_state = prior_state[:3] + (np.nan,)
+
+        stats = compute_stats([quote[idx] for quote in quotes], len(prior_quotes), prior_state, window)
+        for pos, quote in enumerate(new_quotes):
+            row = dict(stock_id=stock_id, date=quote.date, price_type=price_type)
+            for name, values in stats.items():
+                value = float(values[pos])
+                row[name] = None if math.isnan(value) else value
+            rows.append(row)
+
+    db.session.execute(models.QuoteStats.__table__.insert().values(rows))
+
+    return len(rows)
@@ -0,0 +1,263 @@
+"""
+Columnar in-memory quote store. The quotes of a stock are loaded on the first access into arrays ordered by date
+(dates as int32 ordinals, prices and volumes as float64) and kept in the worker process so that the quotes,
+analytics and delta handlers read them without database round trips and without building an object per quote.
+The stocks are evicted in LRU order when the arrays size exceeds 'QUOTE_STORE_SIZE' bytes (0 disables the store)
+and all of them are dropped as soon as the quotes version (see :py:data:`app.data_version.QUOTES`) changes.
+
+If 'QUOTE_SNAPSHOT_DIR' is set the arrays are mapped from the snapshot files written by the data fetcher
+(see :py:mod:`app.snapshot`). The mapped pages are shared by the worker processes and don't count
+towards the store size.
+"""
+
+import collections
+import datetime
+import threading
+
+import numpy as np
+import sqlalchemy
+
+from app import app
+from app import data_version as dv
+from app import metrics
+from app import models
+from app import prepared
+from app import snapshot
+
+
+COLUMNS = ('open_price', 'close_price', 'high_price', 'low_price', 'volume')
+
+LOAD_QUERY = prepared.PreparedQuery(
+    'quote_store_load',
+    sqlalchemy.select([models.Quote.date, *(getattr(models.Quote, name) for name in COLUMNS)]).
+    where(models.Quote.stock_id == sqlalchemy.bindparam('stock_id')).
+    order_by(models.Quote.date)
+)
+
+LOADS_TOTAL = metrics.Counter(
+    'quote_store_loads_total', 'Number of the stocks loaded to the quote store.', ('source',)
+)
+
+
+class StockQuotes:
+    """
+    Quotes of a stock kept as columns ordered by date.
+    """
+
+    def __init__(self, ordinals, columns, mapped=False):
+        """
+        :param ordinals: int32 array of the quote date ordinals (ascending, unique)
+        :param columns: dict of float64 arrays by column name (see :py:data:`COLUMNS`)
+        :param mapped: True if the arrays are mapped from a snapshot file
+        """
+
+        self.ordinals = ordinals
+        self.columns = columns
+        self.mapped = mapped
+
+    @classmethod
+    def load(cls, stock_id):
+        """
+        Loads the stock quotes from the database.
+
+        :param stock_id: stock identifier
+        :return: :py:class:`StockQuotes`
+        """
+
+        rows = LOAD_QUERY.execute(stock_id=stock_id).fetchall()
+
+        ordinals = np.fromiter((row[0].toordinal() for row in rows), dtype=np.int32, count=len(rows))
+        values = np.array([row[1:] for row in rows], dtype=np.float64).reshape(len(rows), len(COLUMNS))
+
+        return cls(ordinals, {name: np.ascontiguousarray(values[:, idx]) for idx, name in enumerate(COLUMNS)})
+
+    @classmethod
+    def map(cls, directory, stock_id, version):
+        """
+        Maps the stock quotes from the snapshot file.
+
+        :param directory: snapshots directory
+        :param stock_id: stock identifier
+        :param version: current quotes version
+        :return: :py:class:`StockQuotes` or None if there is no snapshot written at the version
+        """
+
+        arrays = snapshot.read(directory, stock_id, version, COLUMNS)
+        if arrays is None:
+            return None
+
+        return cls(*arrays, mapped=True)
+
+    def __len__(self):
+        return len(self.ordinals)
+
+    @property
+    def nbytes(self):
+        return self.ordinals.nbytes + sum(column.nbytes for column in self.columns.values())
+
+    @property
+    def private_nbytes(self):
+        return 0 if self.mapped else self.nbytes
+
+    def dates(self, start=0, stop=None):
+        """
+        :return: list of the quote dates of the index range
+        """
+
+        return [datetime.date.fromordinal(ordinal) for ordinal in self.ordinals[start:stop].tolist()]
+
+    def find_range(self, date_from=None, date_to=None):
+        """
+        Finds the index range of the quotes within the dates.
+
+        :param date_from: range start date (inclusive, unbounded if None)
+        :param date_to: range end date (inclusive, unbounded if None)
+        :return: tuple of start and stop indices
+        """
+
+        start = 0 if date_from is None else int(np.searchsorted(self.ordinals, date_from.toordinal(), 'left'))
+        stop = len(self) if date_to is None else int(np.searchsorted(self.ordinals, date_to.toordinal(), 'right'))
+
+        return start, max(start, stop)
+
+    def select(self, date_from=None, date_to=None, after=None, limit=None):
+        """
+        Selects a page of the quotes within the dates the way :py:func:`app.pagination.paginate` does.
+
+        :param date_from: range start date (inclusive, unbounded if None)
+        :param date_to: range end date (inclusive, unbounded if None)
+        :param after: date of the previous page last quote (the first page is selected if None)
+        :param limit: maximum number of quotes in the page (unlimited if None)
+        :return: tuple of start and stop indices and the next page date (None if it is the last page)
+        """
+
+        start, stop = self.find_range(date_from, date_to)
+        if after is not None:
+            start = max(start, int(np.searchsorted(self.ordinals, after.toordinal(), 'right')))
+            stop = max(start, stop)
+
+        if limit is None or stop - start <= limit:
+            return start, stop, None
+
+        stop = start + limit
+
+        return start, stop, datetime.date.fromordinal(int(self.ordinals[stop - 1]))
+
+    def iter_dicts(self, start, stop, fields=None, batch_size=1000):
+        """
+        Serializes the quotes of the index range to the dicts 'QuoteApiSchema' row serializer produces.
+        The columns are converted batch by batch.
+
+        :param start: range start index
+        :param stop: range stop index
+        :param fields: tuple of the field names to be serialized (all if None)
+        :param batch_size: number of quotes converted at once
+        :return: generator of dicts
+        """
+
+        names = sorted(fields or ('date',) + COLUMNS)
+
+        for batch_start in range(start, stop, batch_size):
+            batch_stop = min(batch_start + batch_size, stop)
+            values = [
+                [date.isoformat() for date in self.dates(batch_start, batch_stop)] if name == 'date' else
+                self.columns[name][batch_start:batch_stop].tolist()
+                for name in names
+            ]
+
+            for row in zip(*values):
+                yield dict(zip(names, row))
+
+
+class QuoteStore:
+    """
+    Thread-safe LRU store of the stock quotes limited by the total size of the arrays.
+    """
+
+    def __init__(self, max_size, snapshot_dir=None):
+        """
+        :param max_size: maximum total size of the arrays loaded from the database in bytes (0 disables the store)
+        :param snapshot_dir: snapshots directory (the snapshots are not used if None)
+        """
+
+        self._max_size = max_size
+        self._snapshot_dir = snapshot_dir
+        self._size = 0
+        self._version = None
+        self._stocks = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def size(self):
+        return self._size
+
+    def __len__(self):
+        return len(self._stocks)
+
+    def get(self, stock_id):
+        """
+        Returns the stock quotes loading them if they are not stored.
+
+        :param stock_id: stock identifier
+        :return: :py:class:`StockQuotes` or None if the store is disabled
+            (by the zero size or 'QUOTE_STORE_ENABLED' configuration parameter)
+        """
+
+        if not self._max_size or not app.config['QUOTE_STORE_ENABLED']:
+            return None
+
+        version = dv.get(dv.QUOTES).version
+        with self._lock:
+            self._expire(version)
+            stock_quotes = self._stocks.get(stock_id)
+            if stock_quotes is not None:
+                self._stocks.move_to_end(stock_id)
+                return stock_quotes
+
+        stock_quotes = None
+        if self._snapshot_dir is not None:
+            stock_quotes = StockQuotes.map(self._snapshot_dir, stock_id, version)
+        if stock_quotes is None:
+            stock_quotes = StockQuotes.load(stock_id)
+        LOADS_TOTAL.inc(source='snapshot' if stock_quotes.mapped else 'database')
+
+        with self._lock:
+            self._expire(version)
+            if self._version == version and stock_quotes.private_nbytes <= self._max_size:
+                old_quotes = self._stocks.pop(stock_id, None)
+                if old_quotes is not None:
+                    self._size -= old_quotes.private_nbytes
+
+                self._stocks[stock_id] = stock_quotes
+                self._size += stock_quotes.private_nbytes
+
+                while self._size > self._max_size:
+                    _, evicted = self._stocks.popitem(last=False)
+                    self._size -= evicted.private_nbytes
+
+        return stock_quotes
+
+    def _expire(self, version):
+        if self._version is None or self._version < version:
+            self._stocks.clear()
+            self._size = 0
+            self._version = version
+
+
+def write_snapshots(directory):
+    """
+    Writes the snapshot files of all the stored stocks (see :py:func:`app.snapshot.write_all`).
+
+    :param directory: snapshots directory
+    :return: number of the written snapshots
+    """
+
+    return snapshot.write_all(directory, COLUMNS)
+
+
+quotes = QuoteStore(app.config['QUOTE_STORE_SIZE'], app.config['QUOTE_SNAPSHOT_DIR'])
+
+STORE_BYTES = metrics.Gauge(
+    'quote_store_bytes', 'Size of the quote store arrays loaded from the database.', lambda: quotes.size
+)
+STORE_STOCKS = metrics.Gauge('quote_store_stocks', 'Number of the stocks in the quote store.', lambda: len(quotes))
@@ -0,0 +1,128 @@
+"""
+Streaming json responses. Result sets are encoded and sent by chunks as a json array or as newline delimited json
+so that the whole result is never held in memory.
+"""
+
+import itertools
+
+import flask
+
+from app import app
+
+
+ENCODE_BATCH_SIZE = 256
+
+JSON_FORMAT = 'json'
+NDJSON_FORMAT = 'ndjson'
+
+MIMETYPES = {
+    'application/json': JSON_FORMAT,
+    'application/x-ndjson': NDJSON_FORMAT,
+    'application/ndjson': NDJSON_FORMAT,
+}
+
+
+def get_response_format():
+    """
+    Returns the response format requested by the client using 'format' query parameter or 'Accept' header.
+
+    :return: 'json' or 'ndjson'
+    """
+
+    response_format = flask.request.args.get('format')
+    if response_format in (JSON_FORMAT, NDJSON_FORMAT):
+        return response_format
+
+    mimetype = flask.request.accept_mimetypes.best_match(MIMETYPES.keys(), default='application/json')
+
+    return MIMETYPES[mimetype]
+
+
+def iter_chunks(parts, chunk_size):
+    """
+    Joins string parts into chunks of at least 'chunk_size' characters.
+
+    :param parts: string iterable
+    :param chunk_size: minimal chunk size
+    :return: chunks generator
+    """
+
+    buffer, buffer_size = [], 0
+    for part in parts:
+        buffer.append(part)
+        buffer_size += len(part)
+
+        if buffer_size >= chunk_size:
+            yield ''.join(buffer)
+            buffer, buffer_size = [], 0
+
+    if buffer:
+        yield ''.join(buffer)
+
+
+def get_encoder():
+    """
+    Creates the application json encoder producing the same output as 'flask.json.dumps' does.
+    The encoder is created once per response instead of once per item.
+
+    :return: json encoder
+    """
+
+    return app.json_encoder(
+        ensure_ascii=app.config['JSON_AS_ASCII'],
+        sort_keys=app.config['JSON_SORT_KEYS'],
+        separators=(',', ':'),
+    )
+
+
+def iter_json_array(items):
+    """
+    Encodes items as a json array. Items are encoded by batches to reduce the per item encoding overhead.
+
+    :param items: json serializable objects iterable
+    :return: encoded array parts generator
+    """
+
+    encoder = get_encoder()
+    items = iter(items)
+
+    yield '['
+    batch = list(itertools.islice(items, ENCODE_BATCH_SIZE))
+    while batch:
+        # the batch is encoded as an array the brackets of which are stripped
+        yield encoder.encode(batch)[1:-1]
+        batch = list(itertools.islice(items, ENCODE_BATCH_SIZE))
+        if batch:
+            yield ','
+    yield ']\n'
+
+
+def iter_ndjson(items):
+    """
+    Encodes items as newline delimited json.
+
+    :param items: json serializable objects iterable
+    :return: encoded lines generator
+    """
+
+    encoder = get_encoder()
+    for item in items:
+        yield encoder.encode(item) + '\n'
+
+
+def stream_response(items):
+    """
+    Builds a chunked json response. Items are evaluated lazily while the response is being sent.
+
+    :param items: json serializable objects iterable
+    :return: streamed response
+    """
+
+    if get_response_format() == NDJSON_FORMAT:
+        parts, mimetype = iter_ndjson(items), 'application/x-ndjson'
+    else:
+        parts, mimetype = iter_json_array(items), app.config['JSONIFY_MIMETYPE']
+
+    chunks = iter_chunks(parts, app.config['STREAM_CHUNK_SIZE'])
+
+    return flask.Response(flask.stream_with_context(chunks), mimetype=mimetype)
@@ -0,0 +1,59 @@
+"""
+Request statement timeout. The statements executed while handling a request are cancelled by the database
+after 'REQUEST_STATEMENT_TIMEOUT' milliseconds so that a heavy analytics request can't occupy a worker
+and a database connection for long. The timeout is set for the request transactions only, the data fetcher
+and the maintenance scripts are not limited.
+
+The statement timeout doesn't apply to the calculations made in Python (NumPy analytics and the delta engine),
+so their input size is checked against the compute limits (see :py:func:`check_compute_limit`) before they start.
+"""
+
+import flask
+import psycopg2.extensions
+import sqlalchemy
+
+from app import app
+from app import db
+
+
+@sqlalchemy.event.listens_for(db.session, 'after_begin')
+def set_statement_timeout(session, transaction, connection):
+    """
+    Sets the statement timeout for the transaction started in a request context.
+    """
+
+    timeout = app.config['REQUEST_STATEMENT_TIMEOUT']
+    if timeout and flask.has_request_context():
+        connection.execute(f'SET LOCAL statement_timeout = {int(timeout)}')
+
+
+def is_timeout_error(error):
+    """
+    Checks if the database error is caused by the statement timeout.
+
+    :param error: sqlalchemy database error
+    :return: True if the statement was cancelled
+    """
+
+    return isinstance(getattr(error, 'orig', None), psycopg2.extensions.QueryCanceledError)
+
+
+class ComputeLimitExceeded(Exception):
+    """
+    Raised if the input of a request calculation exceeds the configured limit.
+    """
+
+
+def check_compute_limit(name, size):
+    """
+    Checks the calculation input size against the limit set by the configuration parameter.
+    Only the calculations made in a request context are limited.
+
+    :param name: limit configuration parameter name
+    :param size: calculation input size (number of rows or pairs)
+    :raises ComputeLimitExceeded: if the size exceeds the limit
+    """
+
+    limit = app.config[name]
+    if limit and size > limit and flask.has_request_context():
+        raise ComputeLimitExceeded(f"{name} exceeded: {size} > {limit}")
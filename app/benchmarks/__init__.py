@@ -0,0 +1,3 @@
+"""
+Application benchmarks and development tools. Should be executed from the application directory.
+"""
@@ -0,0 +1,287 @@
+"""
+Deterministic synthetic data generator. Inserts N tickers with M years of daily quotes and K insider trades
+per ticker directly to the database using COPY, computes the quote statistics, refreshes the quote price view
+the way the data fetcher does and bumps the data version. The generated tickers are a prefix followed by digits
+so that they can be removed afterwards without touching the real tickers starting with the same prefix:
+
+    python -m benchmarks.datagen generate -n 20 -y 10 -k 1000
+    python -m benchmarks.datagen drop
+"""
+
+import argparse
+import csv
+import datetime
+import io
+import re
+import sys
+
+import numpy as np
+import sqlalchemy
+
+from app import analytics
+from app import data_version
+from app import db
+from app import models
+from app import stats
+
+
+DEFAULT_PREFIX = 'BN'
+
+END_DATE = datetime.date(2019, 4, 26)
+
+RELATIONS = ('Director', 'Officer', 'CEO', 'CFO', 'Beneficial Owner')
+TRANSACTION_TYPES = ('Buy', 'Sell', 'Option Execute', 'Automatic Sell')
+INSIDERS_PER_TICKER = 10
+
+
+def make_tickers(count, prefix=DEFAULT_PREFIX):
+    """
+    Builds the generated ticker names.
+
+    :param count: number of tickers
+    :param prefix: ticker prefix
+    :return: ticker names list
+    :raises ValueError if the tickers don't fit the ticker column
+    """
+
+    width = models.Stock.ticker.type.length - len(prefix)
+    if width < 1 or count > 10 ** width:
+        raise ValueError(f"{count} tickers with '{prefix}' prefix don't fit {width + len(prefix)} characters")
+
+    return [f'{prefix}{idx:0{width}d}' for idx in range(count)]
+
+
+def make_ticker_pattern(prefix=DEFAULT_PREFIX):
+    """
+    Builds the regular expression matching the generated ticker names only (the prefix followed by the index
+    digits filling the ticker column) so that the real tickers sharing the prefix are never matched.
+
+    :param prefix: ticker prefix
+    :return: regular expression without the anchors
+    """
+
+    width = models.Stock.ticker.type.length - len(prefix)
+
+    return f'{re.escape(prefix)}[0-9]{{{width}}}'
+
+
+def generated_stocks(prefix=DEFAULT_PREFIX):
+    """
+    :param prefix: ticker prefix
+    :return: condition matching the generated stocks (see :py:func:`make_ticker_pattern`)
+    """
+
+    return models.Stock.ticker.op('~')(f'^{make_ticker_pattern(prefix)}$')
+
+
+def make_insider_name(ticker, idx):
+    """
+    :return: generated insider name
+    """
+
+    return f'{ticker} INSIDER {idx}'
+
+
+def make_dates(years):
+    """
+    Builds the trading days (week days) of the last years ending at :py:data:`END_DATE`.
+
+    :param years: number of years
+    :return: dates list ordered by date
+    """
+
+    start_date = END_DATE.replace(year=END_DATE.year - years)
+    dates = np.arange(np.datetime64(start_date), np.datetime64(END_DATE + datetime.timedelta(days=1)))
+
+    return [date.item() for date in dates[np.is_busday(dates)]]
+
+
+def make_quotes(rnd, dates):
+    """
+    Generates a random walk of the prices.
+
+    :param rnd: random generator
+    :param dates: quote dates
+    :return: list of (date, open, close, high, low, volume) tuples
+    """
+
+    size = len(dates)
+    close_prices = rnd.uniform(10, 500) * np.exp(np.cumsum(rnd.normal(0, 0.02, size)))
+    open_prices = np.concatenate([close_prices[:1], close_prices[:-1]]) * rnd.uniform(0.99, 1.01, size)
+    high_prices = np.maximum(open_prices, close_prices) * rnd.uniform(1.0, 1.02, size)
+    low_prices = np.minimum(open_prices, close_prices) * rnd.uniform(0.98, 1.0, size)
+    volumes = rnd.randint(10 ** 5, 10 ** 8, size)
+
+    return [
+        (date, round(open_price, 2), round(close_price, 2), round(high_price, 2), round(low_price, 2), float(volume))
+        for date, open_price, close_price, high_price, low_price, volume
+        in zip(dates, open_prices, close_prices, high_prices, low_prices, volumes)
+    ]
+
+
+def make_trades(rnd, dates, insider_ids, count):
+    """
+    Generates insider trades. The held shares grow with every trade so the trades natural keys are unique.
+
+    :param rnd: random generator
+    :param dates: trading days
+    :param insider_ids: identifiers of the insiders making the trades
+    :param count: number of trades
+    :return: list of (insider id, last date, transaction type, owner type, traded, price, held) tuples
+    """
+
+    trades, shares_hold = [], 0
+    for date_idx in sorted(rnd.randint(0, len(dates), count)):
+        shares_traded = int(rnd.randint(100, 100000))
+        shares_hold += shares_traded
+        trades.append((
+            insider_ids[rnd.randint(len(insider_ids))],
+            dates[date_idx],
+            TRANSACTION_TYPES[rnd.randint(len(TRANSACTION_TYPES))],
+            'direct' if rnd.randint(2) else 'indirect',
+            shares_traded,
+            None if rnd.randint(7) == 0 else round(rnd.uniform(10, 500), 2),
+            shares_hold,
+        ))
+
+    return trades
+
+
+def copy_rows(table, columns, rows):
+    """
+    Writes the rows to the table using COPY in the current session transaction.
+
+    :param table: table name
+    :param columns: column names
+    :param rows: rows to write (None values are written as NULL)
+    """
+
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    buffer.seek(0)
+
+    with db.session.connection().connection.cursor() as cursor:
+        cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH CSV", buffer)
+
+
+def generate(tickers_count, years, trades_count, prefix=DEFAULT_PREFIX, seed=0):
+    """
+    Generates the data replacing the previously generated one with the same prefix. Every ticker data depends
+    only on the seed and the ticker position so the same arguments always produce the same data.
+
+    :param tickers_count: number of tickers
+    :param years: number of quote years per ticker
+    :param trades_count: number of trades per ticker
+    :param prefix: ticker prefix
+    :param seed: random generator seed
+    :return: dict with the generated 'tickers', 'quotes' and 'trades' counts and the quotes date range
+    """
+
+    tickers = make_tickers(tickers_count, prefix)
+    dates = make_dates(years)
+
+    drop(prefix)
+
+    stocks = [models.Stock(ticker=ticker) for ticker in tickers]
+    insiders = [
+        models.Insider(name=make_insider_name(ticker, idx), relation=RELATIONS[idx % len(RELATIONS)])
+        for ticker in tickers for idx in range(INSIDERS_PER_TICKER)
+    ]
+    db.session.add_all(stocks + insiders)
+    db.session.flush()
+
+    quotes_count, trades_count_total = 0, 0
+    for idx, stock in enumerate(stocks):
+        rnd = np.random.RandomState([seed, idx])
+        insider_ids = [insider.id for insider in insiders[idx * INSIDERS_PER_TICKER:(idx + 1) * INSIDERS_PER_TICKER]]
+
+        quotes = make_quotes(rnd, dates)
+        copy_rows(
+            'quote',
+            ('stock_id', 'date', 'open_price', 'close_price', 'high_price', 'low_price', 'volume'),
+            [(stock.id, *quote) for quote in quotes]
+        )
+        trades = make_trades(rnd, dates, insider_ids, trades_count)
+        copy_rows(
+            'trade',
+            ('stock_id', 'insider_id', 'last_date', 'transaction_type', 'owner_type',
+             'shares_traded', 'last_price', 'shares_hold'),
+            [(stock.id, *trade) for trade in trades]
+        )
+        stats.update_stats(stock.id, dates[0])
+
+        quotes_count += len(quotes)
+        trades_count_total += len(trades)
+
+    db.session.commit()
+    analytics.refresh_price_view()
+    data_version.bump(data_version.QUOTES)
+
+    return dict(
+        tickers=len(tickers),
+        quotes=quotes_count,
+        trades=trades_count_total,
+        date_from=dates[0].isoformat(),
+        date_to=dates[-1].isoformat(),
+    )
+
+
+def drop(prefix=DEFAULT_PREFIX, tickers=None):
+    """
+    Removes the generated stocks along with their quotes, statistics, trades and generated insiders.
+    Only the tickers :py:func:`make_tickers` builds for the prefix are removed (the given ones if set),
+    the other tickers starting with the prefix are kept. The removal is flushed but not committed.
+
+    :param prefix: ticker prefix
+    :param tickers: generated ticker names to be removed (all the generated ones if None)
+    :return: number of the removed stocks
+    """
+
+    if tickers is None:
+        stock_filter = generated_stocks(prefix)
+        insider_filter = models.Insider.name.op('~')(f'^{make_insider_name(make_ticker_pattern(prefix), "[0-9]+")}$')
+    else:
+        stock_filter = models.Stock.ticker.in_(tickers)
+        insider_filter = models.Insider.name.in_([
+            make_insider_name(ticker, idx) for ticker in tickers for idx in range(INSIDERS_PER_TICKER)
+        ])
+
+    stock_ids = db.session.query(models.Stock.id).filter(stock_filter)
+    insider_ids = db.session.query(models.Insider.id).filter(insider_filter)
+
+    for model in (models.QuoteStats, models.Quote, models.Trade):
+        model.query.filter(model.stock_id.in_(stock_ids.subquery())).delete(synchronize_session=False)
+
+    # the insiders of the removed stocks may have traded other stocks too
+    models.Insider.query.\
+        filter(models.Insider.id.in_(insider_ids.subquery())).\
+        filter(~sqlalchemy.exists().where(models.Trade.insider_id == models.Insider.id)).\
+        delete(synchronize_session=False)
+
+    return models.Stock.query.filter(models.Stock.id.in_(stock_ids.subquery())).delete(synchronize_session=False)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Synthetic benchmark data generator.')
+    parser.add_argument('command', choices=['generate', 'drop'], help='command to execute')
+    parser.add_argument('-n', '--tickers', dest='tickers', type=int, default=20, help='number of tickers')
+    parser.add_argument('-y', '--years', dest='years', type=int, default=10, help='quote years per ticker')
+    parser.add_argument('-k', '--trades', dest='trades', type=int, default=1000, help='trades per ticker')
+    parser.add_argument('--prefix', dest='prefix', default=DEFAULT_PREFIX, help='ticker prefix')
+    parser.add_argument('--seed', dest='seed', type=int, default=0, help='random seed')
+
+    args = parser.parse_args()
+
+    try:
+        if args.command == 'generate':
+            result = generate(args.tickers, args.years, args.trades, args.prefix, args.seed)
+            print(f"{result['tickers']} tickers, {result['quotes']} quotes, {result['trades']} trades generated "
+                  f"({result['date_from']} - {result['date_to']})")
+        else:
+            count = drop(args.prefix)
+            db.session.commit()
+            analytics.refresh_price_view()
+            data_version.bump(data_version.QUOTES)
+            print(f"{count} tickers removed")
+    except ValueError as e:
+        sys.exit(str(e))
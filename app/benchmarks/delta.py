@@ -0,0 +1,155 @@
+"""
+Price delta engine parity check and benchmark. Compares :py:func:`app.delta.find_min_deltas` with a brute force
+search on random series and the engine backend with the SQL one on generated tickers (see 'benchmarks.datagen'),
+the generated tickers are removed afterwards:
+
+    python -m benchmarks.delta -s 200 -n 50 -t 3 -y 2
+"""
+
+import argparse
+import datetime
+import time
+
+import numpy as np
+
+from app import data_version
+from app import db
+from app import delta
+from app import models
+from benchmarks import datagen
+
+
+DEFAULT_PREFIX = 'DP'
+
+
+def find_min_deltas_brute_force(dates, prices, value):
+    """
+    Reference implementation of :py:func:`app.delta.find_min_deltas` checking all the pairs of dates.
+
+    :return: list of :py:class:`app.delta.DeltaRow` sorted by start date
+    """
+
+    candidates = [
+        ((dates[end] - dates[start]).days, start, end)
+        for end in range(len(prices)) for start in range(end) if abs(prices[start] - prices[end]) >= value
+    ]
+    if not candidates:
+        return []
+
+    min_diff = min(date_diff for date_diff, _, _ in candidates)
+
+    return sorted(
+        (
+            delta.DeltaRow(dates[start], dates[end], prices[start], prices[end], date_diff,
+                           abs(prices[start] - prices[end]))
+            for date_diff, start, end in candidates if date_diff == min_diff
+        ),
+        key=lambda row: row.start_date,
+    )
+
+
+def make_series(rnd, size):
+    """
+    Generates a random price series. The prices are rounded to a few values so that the series has equal prices
+    and the dates have random gaps so that there are several pairs with the same minimal interval.
+
+    :param rnd: random generator
+    :param size: number of quotes
+    :return: tuple of dates and prices lists
+    """
+
+    ordinals = datetime.date(2019, 1, 1).toordinal() + np.cumsum(rnd.randint(1, 4, size))
+    prices = np.round(rnd.uniform(0, 20, size), 0) + rnd.choice([0, 0.25, 0.5], size)
+
+    return [datetime.date.fromordinal(int(ordinal)) for ordinal in ordinals], prices.tolist()
+
+
+def check_engine(series_count, size, seed=0):
+    """
+    Compares :py:func:`app.delta.find_min_deltas` with the brute force search on random series.
+
+    :param series_count: number of series
+    :param size: number of quotes per series
+    :param seed: random generator seed
+    :return: tuple of the engine and brute force seconds
+    :raises AssertionError if the results differ
+    """
+
+    rnd = np.random.RandomState(seed)
+    engine_time = brute_force_time = 0
+
+    for idx in range(series_count):
+        dates, prices = make_series(rnd, size)
+        for value in (0, 0.25, 1, 5, 15, 25):
+            started_at = time.perf_counter()
+            result = delta.find_min_deltas(dates, prices, value)
+            engine_time += time.perf_counter() - started_at
+
+            started_at = time.perf_counter()
+            reference = find_min_deltas_brute_force(dates, prices, value)
+            brute_force_time += time.perf_counter() - started_at
+
+            assert result == reference, f"engine result differs from the brute force one (series {idx}, {value})"
+
+    return engine_time, brute_force_time
+
+
+def check_backends(tickers_count, years, prefix=DEFAULT_PREFIX, seed=0):
+    """
+    Compares the engine and SQL backends on the generated tickers.
+
+    :param tickers_count: number of generated tickers
+    :param years: number of quote years per ticker
+    :param prefix: generated tickers prefix
+    :param seed: random generator seed
+    :return: tuple of the engine and SQL backend seconds
+    :raises AssertionError if the results differ
+    """
+
+    tickers = datagen.make_tickers(tickers_count, prefix)
+    datagen.generate(tickers_count, years, 0, prefix, seed)
+    engine_time = sql_time = 0
+
+    try:
+        stocks = models.Stock.query.filter(models.Stock.ticker.in_(tickers)).all()
+        for stock in stocks:
+            for price_type in map(str, models.PriceType):
+                for value in (0.01, 1, 10, 100, 10 ** 6):
+                    started_at = time.perf_counter()
+                    result = delta.get_deltas_engine(stock.id, price_type, value)
+                    engine_time += time.perf_counter() - started_at
+
+                    started_at = time.perf_counter()
+                    reference = delta.get_deltas_sql(stock.id, price_type, value)
+                    sql_time += time.perf_counter() - started_at
+
+                    assert result == reference, \
+                        f"engine result differs from the SQL one ({stock.ticker}, {price_type}, {value})"
+    finally:
+        db.session.rollback()
+        datagen.drop(prefix, tickers)
+        db.session.commit()
+        data_version.bump(data_version.QUOTES)
+
+    return engine_time, sql_time
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Price delta engine parity check and benchmark.')
+    parser.add_argument('-s', '--size', dest='size', type=int, default=200, help='random series size')
+    parser.add_argument('-n', '--series', dest='series', type=int, default=50, help='number of random series')
+    parser.add_argument('-t', '--tickers', dest='tickers', type=int, default=3, help='number of generated tickers')
+    parser.add_argument('-y', '--years', dest='years', type=int, default=2, help='quote years per generated ticker')
+    parser.add_argument('--prefix', dest='prefix', default=DEFAULT_PREFIX, help='generated tickers prefix')
+    parser.add_argument('--seed', dest='seed', type=int, default=0, help='random seed')
+    parser.add_argument('--skip-db', dest='skip_db', action='store_true', help="don't compare the backends")
+
+    args = parser.parse_args()
+
+    results = {'find_min_deltas / brute force': check_engine(args.series, args.size, args.seed)}
+    if not args.skip_db:
+        results['engine / sql backend'] = check_backends(args.tickers, args.years, args.prefix, args.seed)
+
+    print(f"{'check':<32}{'engine, s':>12}{'reference, s':>15}{'speedup':>10}")
+    for name, (engine_time, reference_time) in results.items():
+        print(f"{name:<32}{engine_time:>12.3f}{reference_time:>15.3f}{reference_time / engine_time:>10.1f}")
@@ -0,0 +1,220 @@
+"""
+Read path query plan check. Explains the hot statements of the request handlers and the data fetcher
+with the default planner settings and fails if any of them doesn't use the expected index or scans 'quote',
+'trade', 'quote_stats' table or 'quote_price' view sequentially. The statements are built by the same code
+the handlers run: the query builders and the row serializers of :py:mod:`app.handlers`, the prepared
+statements (explained as 'EXECUTE') and the SQL analytics backend queries. The plans depend on the table
+statistics so the check should be run on a realistically sized database (see 'benchmarks.datagen'):
+
+    python -m benchmarks.explain -t BN000
+"""
+
+import argparse
+import datetime
+import json
+import sys
+
+import data_fetcher
+from app import analytics
+from app import db
+from app import delta
+from app import handlers
+from app import models
+from app import pagination
+from app import serialization as sz
+from app import store
+
+
+CHECKED_TABLES = ('quote', 'trade', 'quote_stats', 'quote_price')
+
+QUOTE_INDEX = ('ix_quote_stock_id_date_prices', 'Index Only Scan')
+PRICE_VIEW_INDEX = ('ix_quote_price_stock_id_price_type_date', None)
+
+# expected index and scan node type (any index scan if None) by statement name
+EXPECTED_SCANS = {
+    'quotes': QUOTE_INDEX,
+    'quotes page': QUOTE_INDEX,
+    'quotes range': QUOTE_INDEX,
+    'batch quotes': QUOTE_INDEX,
+    'trades': ('ix_trade_stock_id_last_date_id', None),
+    'trades page': ('ix_trade_stock_id_last_date_id', 'Index Scan'),
+    'trades by type page': ('ix_trade_stock_id_transaction_type_last_date_id', 'Index Scan'),
+    'insider trades': ('ix_trade_natural_key', None),
+    'stats': ('quote_stats_stock_id_date_price_type_key', None),
+    'quote store load': QUOTE_INDEX,
+    'analytics window': QUOTE_INDEX,
+    **{f'delta series {price_type}': QUOTE_INDEX for price_type in map(str, models.PriceType)},
+    'analytics pairs': PRICE_VIEW_INDEX,
+    'analytics top pairs': PRICE_VIEW_INDEX,
+    'analytics summary': PRICE_VIEW_INDEX,
+    'last quote date': ('quote_stock_id_date_key', 'Index Only Scan'),
+    'last trade date': ('ix_trade_stock_id_last_date_id', 'Index Only Scan'),
+}
+
+
+def compile_query(query):
+    """
+    :param query: sqlalchemy query
+    :return: tuple of the statement text and its parameters
+    """
+
+    statement = query.statement.compile(dialect=db.engine.dialect)
+
+    return str(statement), statement.params
+
+
+def get_statements(stock, insider_id):
+    """
+    Builds the hot read path statements.
+
+    :param stock: stock
+    :param insider_id: insider identifier
+    :return: dict of (statement text, parameters) tuples by name
+    """
+
+    after = datetime.date(2000, 1, 1)
+    today = datetime.date.today()
+    page_size = 100
+
+    # query parameters of the handlers
+    no_range = dict(date_from=None, date_to=None)
+    date_range = dict(date_from=after, date_to=today)
+    trade_args = dict(no_range, transaction_type=None)
+
+    quotes = sz.get_row_serializer(sz.QuoteApiSchema, extra_columns=(models.Quote.date,))
+    batch_quotes = sz.get_row_serializer(sz.QuoteApiSchema, extra_columns=(models.Quote.stock_id, models.Quote.date))
+    trades = sz.get_row_serializer(sz.TradeApiSchema, extra_columns=(models.Trade.last_date, models.Trade.id))
+    stats = sz.get_row_serializer(sz.QuoteStatsApiSchema)
+
+    quote_key = [models.Quote.date]
+    trade_key = [models.Trade.last_date, models.Trade.id]
+    stock_trades = [models.Trade.stock_id == stock.id]
+    insider_trades = [models.Trade.stock_id == stock.id, models.Trade.insider_id == insider_id]
+
+    queries = {
+        'quotes': pagination.page_query(handlers.build_quotes_query(quotes, stock.id, no_range), quote_key),
+        'quotes page': pagination.page_query(
+            handlers.build_quotes_query(quotes, stock.id, no_range), quote_key, after=(after,), limit=page_size
+        ),
+        'quotes range': pagination.page_query(handlers.build_quotes_query(quotes, stock.id, date_range), quote_key),
+        'batch quotes': handlers.build_batch_quotes_query(batch_quotes, [stock.id, stock.id + 1], no_range),
+        'trades': pagination.page_query(handlers.build_trades_query(trades, stock_trades, trade_args), trade_key),
+        'trades page': pagination.page_query(
+            handlers.build_trades_query(trades, stock_trades, trade_args), trade_key,
+            after=(after, 0), limit=page_size
+        ),
+        'trades by type page': pagination.page_query(
+            handlers.build_trades_query(trades, stock_trades, dict(trade_args, transaction_type='Buy')), trade_key,
+            limit=page_size
+        ),
+        'insider trades': pagination.page_query(
+            handlers.build_trades_query(trades, insider_trades, dict(date_range, transaction_type=None)), trade_key
+        ),
+        'stats': handlers.build_stats_query(stats, stock.id, dict(date=None, type=None)),
+        'last quote date': data_fetcher.Fetcher.last_quote_date_query(db.session, stock.ticker),
+        'last trade date': data_fetcher.Fetcher.last_trade_date_query(db.session, stock.ticker),
+    }
+
+    statements = {name: compile_query(query) for name, query in queries.items()}
+
+    statements['quote store load'] = store.LOAD_QUERY.bind(stock_id=stock.id)
+    statements['analytics window'] = analytics.WINDOW_QUERY.bind(stock_id=stock.id, date_from=after, date_to=today)
+    for price_type, query in delta.SERIES_QUERIES.items():
+        statements[f'delta series {price_type}'] = query.bind(stock_id=stock.id)
+
+    analytics_params = dict(
+        stock_id=stock.id, date_from=after, date_to=today, limit=page_size, top=10, min_diff=None,
+        max_span_days=None, price_types=list(analytics.PRICE_TYPES), quantiles=list(analytics.QUANTILES),
+    )
+    statements['analytics pairs'] = (analytics.get_analytics_query(), analytics_params)
+    statements['analytics top pairs'] = (analytics.get_analytics_query(top=10), analytics_params)
+    statements['analytics summary'] = (analytics.get_summary_query(), analytics_params)
+
+    return statements
+
+
+def iter_plan_nodes(plan):
+    """
+    Iterates over the plan tree nodes.
+
+    :param plan: 'EXPLAIN (FORMAT JSON)' plan node
+    :return: plan nodes generator
+    """
+
+    yield plan
+    for child in plan.get('Plans', []):
+        yield from iter_plan_nodes(child)
+
+
+def explain(statement, params):
+    """
+    Explains the statement.
+
+    :param statement: statement text
+    :param params: statement parameters
+    :return: plan root node
+    """
+
+    plan = db.session.connection().execute(f'EXPLAIN (FORMAT JSON) {statement}', params).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+
+    return plan[0]['Plan']
+
+
+def check(statements):
+    """
+    Checks the statements plans built with the default planner settings.
+
+    :param statements: dict of (statement text, parameters) tuples by name
+    :return: dict of (ok flag, index scans, sequentially scanned tables) by statement name,
+        index scans are '<node type> using <index name>' strings
+    """
+
+    result = {}
+
+    try:
+        for name, (statement, params) in statements.items():
+            nodes = list(iter_plan_nodes(explain(statement, params)))
+            index_scans = {(node['Node Type'], node['Index Name']) for node in nodes if 'Index Name' in node}
+            seq_scans = sorted({
+                node['Relation Name'] for node in nodes
+                if node['Node Type'] == 'Seq Scan' and node['Relation Name'] in CHECKED_TABLES
+            })
+
+            expected_index, expected_type = EXPECTED_SCANS[name]
+            ok = not seq_scans and any(
+                index == expected_index and expected_type in (None, node_type) for node_type, index in index_scans
+            )
+            result[name] = (ok, sorted(f'{node_type} using {index}' for node_type, index in index_scans), seq_scans)
+    finally:
+        db.session.rollback()
+
+    return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Read path query plan check.')
+    parser.add_argument('-t', '--ticker', dest='ticker', default=None, help='ticker to use (the first one if not set)')
+
+    args = parser.parse_args()
+
+    stock_query = models.Stock.query
+    if args.ticker:
+        stock_query = stock_query.filter_by(ticker=args.ticker)
+    stock = stock_query.first()
+    insider_id = None
+    if stock is not None:
+        insider_id = db.session.query(models.Trade.insider_id).filter_by(stock_id=stock.id).limit(1).scalar()
+    if insider_id is None:
+        sys.exit('database is empty')
+
+    failed = False
+    for name, (ok, index_scans, seq_scans) in check(get_statements(stock, insider_id)).items():
+        failed = failed or not ok
+        expected_index, expected_type = EXPECTED_SCANS[name]
+        expected = '' if ok else f"; expected: {expected_type or 'index scan'} using {expected_index}"
+        print(f"{name:<20}{'OK' if ok else 'FAIL':<6}{', '.join(index_scans) or '-'}"
+              f"{'; sequential scans: ' + ', '.join(seq_scans) if seq_scans else ''}{expected}")
+
+    sys.exit(1 if failed else 0)
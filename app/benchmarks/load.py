@@ -0,0 +1,235 @@
+"""
+Web server load benchmark. Starts gunicorn with every worker class being compared, loads it with a mix of
+cheap page requests and heavy analytics and delta requests from concurrent clients and compares
+the latency percentiles and the throughput. The response cache is disabled for the server so that
+every request reaches the database:
+
+    python -m benchmarks.load -m sync gthread gevent -c 16 -d 30
+"""
+
+import argparse
+import datetime
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+
+import numpy as np
+import requests
+import sqlalchemy
+
+from app import db
+from app import models
+
+
+LIGHT = 'light'
+HEAVY = 'heavy'
+
+REQUESTS = (
+    (LIGHT, 'index', '/'),
+    (LIGHT, 'quotes page', '/{ticker}'),
+    (LIGHT, 'api quotes page', '/api/{ticker}?limit=100'),
+    (LIGHT, 'trades page', '/{ticker}/insider'),
+    (HEAVY, 'analytics summary', '/api/{ticker}/analytics?date_from={date_from}&date_to={date_to}&summary=1'),
+    (HEAVY, 'delta', '/api/{ticker}/delta?value={delta_value}&type=close'),
+)
+
+
+def get_targets(tickers, window_days):
+    """
+    Selects the request parameters of the tickers.
+
+    :param tickers: tickers to use (all the stored ones if empty)
+    :param window_days: analytics date window size
+    :return: list of dicts with 'ticker', 'date_from' and 'date_to' keys
+    """
+
+    query = db.session.query(models.Stock.ticker, sqlalchemy.func.max(models.Quote.date)).\
+        join(models.Quote, models.Quote.stock_id == models.Stock.id).\
+        group_by(models.Stock.ticker).\
+        order_by(models.Stock.ticker)
+    if tickers:
+        query = query.filter(models.Stock.ticker.in_(tickers))
+
+    return [
+        dict(ticker=ticker, date_from=last_date - datetime.timedelta(days=window_days), date_to=last_date)
+        for ticker, last_date in query
+    ]
+
+
+def start_server(worker_class, port, workers, concurrency):
+    """
+    Starts gunicorn and waits until it is ready.
+
+    :param worker_class: gunicorn worker class
+    :param port: port to listen
+    :param workers: number of worker processes
+    :param concurrency: number of threads or greenlets per worker
+    :return: server process
+    """
+
+    env = dict(
+        os.environ,
+        PORT=str(port),
+        HTTP_WORKERS=str(workers),
+        HTTP_WORKER_CLASS=worker_class,
+        HTTP_THREADS=str(concurrency),
+        HTTP_WORKER_CONNECTIONS=str(concurrency),
+        RESPONSE_CACHE_MEMORY_SIZE='0',
+        RESPONSE_CACHE_DIR='',
+    )
+    env.setdefault('DB_POOL_SIZE', str(concurrency))
+
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--bind', f'127.0.0.1:{port}', 'stocks_app:app'],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"gunicorn with '{worker_class}' workers exited with code {process.returncode}")
+        try:
+            requests.get(f'http://127.0.0.1:{port}/metrics', timeout=1).raise_for_status()
+            return process
+        except requests.RequestException:
+            time.sleep(0.2)
+
+    stop_server(process)
+    raise RuntimeError(f"gunicorn with '{worker_class}' workers didn't start")
+
+
+def stop_server(process):
+    """
+    Stops the server process.
+
+    :param process: server process
+    """
+
+    process.terminate()
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def run_client(base_url, targets, args, seed, started_at, results):
+    """
+    Sends the requests until the benchmark ends. The request sequence is determined by the seed.
+
+    :param base_url: server url
+    :param targets: request parameters list
+    :param args: benchmark arguments
+    :param seed: random generator seed
+    :param started_at: benchmark start time (monotonic), the requests sent during the warmup are not recorded
+    :param results: list the (kind, latency in seconds, success flag) tuples are appended to
+    """
+
+    rng = random.Random(seed)
+    session = requests.Session()
+    measured_from = started_at + args.warmup
+    deadline = measured_from + args.duration
+
+    while True:
+        kind = HEAVY if rng.random() < args.heavy_share else LIGHT
+        _, _, template = rng.choice([request for request in REQUESTS if request[0] == kind])
+        url = base_url + template.format(delta_value=args.delta_value, **rng.choice(targets))
+
+        request_started_at = time.monotonic()
+        if request_started_at >= deadline:
+            break
+        try:
+            response = session.get(url, timeout=args.timeout)
+            success = response.status_code == 200
+        except requests.RequestException:
+            success = False
+        finished_at = time.monotonic()
+
+        if request_started_at >= measured_from and finished_at <= deadline:
+            results.append((kind, finished_at - request_started_at, success))
+
+
+def run(worker_class, targets, args):
+    """
+    Runs the benchmark against gunicorn with the worker class.
+
+    :param worker_class: gunicorn worker class
+    :param targets: request parameters list
+    :param args: benchmark arguments
+    :return: list of (kind, latency in seconds, success flag) tuples
+    """
+
+    process = start_server(worker_class, args.port, args.workers, args.worker_concurrency)
+    results = []
+
+    try:
+        base_url = f'http://127.0.0.1:{args.port}'
+        started_at = time.monotonic()
+        clients = [
+            threading.Thread(target=run_client, args=(base_url, targets, args, args.seed + idx, started_at, results))
+            for idx in range(args.concurrency)
+        ]
+        for client in clients:
+            client.start()
+        for client in clients:
+            client.join()
+    finally:
+        stop_server(process)
+
+    return results
+
+
+def format_percentiles(latencies):
+    """
+    :return: formatted p50 and p99 latencies in milliseconds
+    """
+
+    if not latencies:
+        return f"{'-':>10}{'-':>10}"
+
+    p50, p99 = np.percentile(latencies, [50, 99]) * 1000
+
+    return f'{p50:>10.1f}{p99:>10.1f}'
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Web server load benchmark.')
+    parser.add_argument('-m', '--modes', dest='modes', nargs='+', default=['sync', 'gthread', 'gevent'],
+                        help='gunicorn worker classes to compare')
+    parser.add_argument('-c', '--concurrency', dest='concurrency', type=int, default=16, help='concurrent clients')
+    parser.add_argument('-d', '--duration', dest='duration', type=float, default=30, help='measurement seconds')
+    parser.add_argument('--warmup', dest='warmup', type=float, default=5, help='warmup seconds')
+    parser.add_argument('-w', '--workers', dest='workers', type=int, default=2, help='gunicorn worker processes')
+    parser.add_argument('--worker-concurrency', dest='worker_concurrency', type=int, default=8,
+                        help='threads or greenlets per worker process')
+    parser.add_argument('-t', '--tickers', dest='tickers', nargs='*', default=[], help='tickers (all if not set)')
+    parser.add_argument('--heavy-share', dest='heavy_share', type=float, default=0.1, help='heavy requests share')
+    parser.add_argument('--window-days', dest='window_days', type=int, default=365, help='analytics date window')
+    parser.add_argument('--delta-value', dest='delta_value', type=float, default=10, help='delta request value')
+    parser.add_argument('--timeout', dest='timeout', type=float, default=60, help='request timeout seconds')
+    parser.add_argument('--port', dest='port', type=int, default=8090, help='server port')
+    parser.add_argument('--seed', dest='seed', type=int, default=0, help='random seed')
+
+    args = parser.parse_args()
+
+    targets = get_targets(args.tickers, args.window_days)
+    db.session.remove()
+    if not targets:
+        sys.exit('database is empty')
+
+    print(f"{'mode':<10}{'requests':>10}{'errors':>8}{'rps':>10}"
+          f"{'light p50':>10}{'p99':>10}{'heavy p50':>10}{'p99':>10}  (latencies in ms)")
+
+    for mode in args.modes:
+        results = run(mode, targets, args)
+        latencies = {
+            kind: [latency for result_kind, latency, success in results if result_kind == kind and success]
+            for kind in (LIGHT, HEAVY)
+        }
+        errors = sum(1 for _, _, success in results if not success)
+
+        print(f"{mode:<10}{len(results):>10}{errors:>8}{len(results) / args.duration:>10.1f}"
+              f"{format_percentiles(latencies[LIGHT])}{format_percentiles(latencies[HEAVY])}")
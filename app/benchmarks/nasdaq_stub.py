@@ -0,0 +1,262 @@
+"""
+Local nasdaq site stub. Records nasdaq 'historical' and 'insider-trades' pages (or generates synthetic ones)
+to a directory and serves them over http so that the data fetcher can be run without the real site:
+
+    python -m benchmarks.nasdaq_stub record -t tickers.txt -p 10 -d pages
+    python -m benchmarks.nasdaq_stub serve -d pages --port 8081
+    python data_fetcher.py --mode async --base-url http://localhost:8081 -t tickers.txt
+"""
+
+import argparse
+import datetime
+import html
+import http.server
+import logging
+import os
+import random
+import re
+import urllib.parse as url_parser
+
+import requests
+
+
+logger = logging.getLogger('nasdaq_stub')
+
+HISTORY_PATH_RE = re.compile(r'^/symbol/(?P<ticker>[\w.-]+)/historical/?$')
+TRADES_PATH_RE = re.compile(r'^/symbol/(?P<ticker>[\w.-]+)/insider-trades/?$')
+
+
+def history_page_path(directory, ticker):
+    """
+    :return: path of the ticker 'historical' page file
+    """
+
+    return os.path.join(directory, ticker.lower(), 'historical.html')
+
+
+def trades_page_path(directory, ticker, page):
+    """
+    :return: path of the ticker 'insider-trades' page file
+    """
+
+    return os.path.join(directory, ticker.lower(), f'insider-trades-{page}.html')
+
+
+def save_page(path, text):
+    """
+    Saves the page text to the file creating the parent directories.
+    """
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write(text)
+
+
+def record(directory, tickers, pages, base_url='https://www.nasdaq.com'):
+    """
+    Downloads nasdaq pages of the tickers to the directory.
+
+    :param directory: directory to save the pages to
+    :param tickers: ticker names
+    :param pages: number of 'insider-trades' pages to download
+    :param base_url: nasdaq site url
+    """
+
+    http_session = requests.Session()
+
+    for ticker in tickers:
+        resp = http_session.get(f'{base_url}/symbol/{ticker.lower()}/historical')
+        resp.raise_for_status()
+        save_page(history_page_path(directory, ticker), resp.text)
+
+        for page in range(1, pages + 1):
+            resp = http_session.get(f'{base_url}/symbol/{ticker.lower()}/insider-trades', params=dict(page=page))
+            resp.raise_for_status()
+            save_page(trades_page_path(directory, ticker, page), resp.text)
+
+        logger.info(f"'{ticker}' pages recorded")
+
+
+def render_history_page(rows):
+    """
+    Renders a page with the same 'historical' table layout as nasdaq site has.
+
+    :param rows: list of (date, open, high, low, close, volume) tuples
+    :return: page html
+    """
+
+    table_rows = ''.join(
+        f'<tr><td>{date:%m/%d/%Y}</td><td>{open_price:,.2f}</td><td>{high_price:,.2f}</td>'
+        f'<td>{low_price:,.2f}</td><td>{close_price:,.2f}</td><td>{volume:,.0f}</td></tr>\n'
+        for date, open_price, high_price, low_price, close_price, volume in rows
+    )
+
+    return (
+        '<html><head><title>Historical Quotes</title></head><body>\n'
+        '<div id="quotes_content_left_pnlAJAX">\n<table>\n'
+        '<thead><tr><th>Date</th><th>Open</th><th>High</th><th>Low</th>'
+        '<th>Close / Last</th><th>Volume</th></tr></thead>\n'
+        f'<tbody>\n{table_rows}</tbody>\n'
+        '</table>\n</div>\n</body></html>\n'
+    )
+
+
+def render_trades_page(ticker, rows, page_count):
+    """
+    Renders a page with the same 'insider-trades' table layout as nasdaq site has.
+
+    :param ticker: ticker name
+    :param rows: list of (insider, relation, date, transaction, owner type, traded, price, held) tuples
+    :param page_count: total number of pages
+    :return: page html
+    """
+
+    table_rows = ''.join(
+        f'<tr><td><a href="/insiders/{html.escape(insider.lower().replace(" ", "-"))}">{html.escape(insider)}</a></td>'
+        f'<td>{html.escape(relation)}</td><td>{date:%m/%d/%Y}</td><td>{transaction}</td><td>{owner_type}</td>'
+        f'<td>{shares_traded:,}</td><td>{"" if price is None else price}</td><td>{shares_held:,}</td></tr>\n'
+        for insider, relation, date, transaction, owner_type, shares_traded, price, shares_held in rows
+    )
+    last_page_url = f'https://www.nasdaq.com/symbol/{ticker.lower()}/insider-trades?page={page_count}'
+
+    return (
+        '<html><head><title>Insider Activity</title></head><body>\n'
+        '<div class="genTable">\n<table>\n'
+        '<thead><tr><th>Insider</th><th>Relation</th><th>Last Date</th><th>Transaction</th>'
+        '<th>Owner Type</th><th>Shares Traded</th><th>Last Price</th><th>Shares Held</th></tr></thead>\n'
+        f'{table_rows}'
+        '</table>\n</div>\n'
+        f'<a id="quotes_content_left_lb_LastPage" href="{last_page_url}">last &gt;&gt;</a>\n'
+        '</body></html>\n'
+    )
+
+
+def generate(directory, tickers, history_size=250, pages=10, trades_per_page=15, seed=0):
+    """
+    Generates deterministic synthetic nasdaq pages of the tickers to the directory.
+
+    :param directory: directory to save the pages to
+    :param tickers: ticker names
+    :param history_size: number of 'historical' table rows
+    :param pages: number of 'insider-trades' pages
+    :param trades_per_page: number of 'insider-trades' table rows per page
+    :param seed: random generator seed
+    """
+
+    rnd = random.Random(seed)
+    last_date = datetime.date(2019, 4, 1)
+
+    for ticker in tickers:
+        price, history = rnd.uniform(10, 500), []
+        for offset in range(history_size):
+            open_price = price
+            close_price = max(1.0, open_price * rnd.uniform(0.95, 1.05))
+            high_price = max(open_price, close_price) * rnd.uniform(1.0, 1.02)
+            low_price = min(open_price, close_price) * rnd.uniform(0.98, 1.0)
+            history.append((
+                last_date - datetime.timedelta(days=offset),
+                open_price, high_price, low_price, close_price, rnd.randint(10 ** 5, 10 ** 8),
+            ))
+            price = close_price
+
+        save_page(history_page_path(directory, ticker), render_history_page(history))
+
+        insiders = [(f'{ticker} INSIDER {idx}', rnd.choice(['Director', 'Officer', 'CEO', 'CFO'])) for idx in range(10)]
+        for page in range(1, pages + 1):
+            trades = []
+            for offset in range(trades_per_page):
+                insider, relation = rnd.choice(insiders)
+                trades.append((
+                    insider,
+                    relation,
+                    last_date - datetime.timedelta(days=(page - 1) * trades_per_page + offset),
+                    rnd.choice(['Buy', 'Sell', 'Option Execute', 'Automatic Sell']),
+                    rnd.choice(['direct', 'indirect']),
+                    rnd.randint(100, 100000),
+                    rnd.choice([None, round(rnd.uniform(10, 500), 2)]),
+                    rnd.randint(1000, 1000000),
+                ))
+
+            save_page(trades_page_path(directory, ticker, page), render_trades_page(ticker, trades, pages))
+
+
+class StubRequestHandler(http.server.BaseHTTPRequestHandler):
+    """
+    Serves the saved pages using the nasdaq site url scheme.
+    """
+
+    protocol_version = 'HTTP/1.1'
+    directory = '.'
+
+    def do_GET(self):
+        url = url_parser.urlparse(self.path)
+        query = url_parser.parse_qs(url.query)
+
+        history_match = HISTORY_PATH_RE.match(url.path)
+        trades_match = TRADES_PATH_RE.match(url.path)
+
+        if history_match:
+            path = history_page_path(self.directory, history_match.group('ticker'))
+        elif trades_match:
+            path = trades_page_path(self.directory, trades_match.group('ticker'), int(query.get('page', ['1'])[0]))
+            if not os.path.exists(path):
+                # nasdaq returns the first page if the requested one is out of range
+                path = trades_page_path(self.directory, trades_match.group('ticker'), 1)
+        else:
+            path = None
+
+        if path is None or not os.path.exists(path):
+            self.send_error(404)
+            return
+
+        with open(path, 'rb') as file:
+            body = file.read()
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+
+def make_server(directory, host='localhost', port=8081):
+    """
+    Creates the stub http server. The server should be started using 'serve_forever' method.
+
+    :param directory: directory the pages are saved to
+    :param host: host to listen on
+    :param port: port to listen on (0 to choose a free one)
+    :return: http server
+    """
+
+    handler = type('StubRequestHandler', (StubRequestHandler,), dict(directory=directory))
+
+    return http.server.ThreadingHTTPServer((host, port), handler)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Local nasdaq site stub.')
+    parser.add_argument('command', choices=['record', 'generate', 'serve'], help='command to execute')
+    parser.add_argument('-d', '--directory', dest='directory', default='pages', help='pages directory')
+    parser.add_argument('-t', '--tickers', dest='tickers', default='tickers.txt', help='tickers file')
+    parser.add_argument('-p', '--pages', dest='pages', type=int, default=10, help='number of trade pages')
+    parser.add_argument('--host', dest='host', default='localhost', help='host to listen on')
+    parser.add_argument('--port', dest='port', type=int, default=8081, help='port to listen on')
+
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='[%(levelname)-8s] %(asctime)-15s (%(name)s): %(message)s')
+
+    with open(args.tickers) as file:
+        tickers = [line.strip() for line in file.readlines() if line.strip()]
+
+    if args.command == 'record':
+        record(args.directory, tickers, args.pages)
+    elif args.command == 'generate':
+        generate(args.directory, tickers, pages=args.pages)
+    else:
+        logger.info(f"Serving '{args.directory}' on http://{args.host}:{args.port}")
+        make_server(args.directory, args.host, args.port).serve_forever()
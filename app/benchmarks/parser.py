@@ -0,0 +1,116 @@
+"""
+Nasdaq page parser micro-benchmark. Compares the table extraction backends on saved pages
+(recorded or generated by 'benchmarks.nasdaq_stub') and checks that they produce the same rows:
+
+    python -m benchmarks.parser -d pages -n 20
+"""
+
+import argparse
+import glob
+import os
+import tempfile
+import timeit
+
+import data_fetcher
+from benchmarks import nasdaq_stub
+
+
+def load_pages(directory):
+    """
+    Loads saved pages from the directory.
+
+    :param directory: pages directory (see 'benchmarks.nasdaq_stub' layout)
+    :return: tuple of 'historical' pages list and 'insider-trades' (page number, page text) list
+    """
+
+    history_pages, trades_pages = [], []
+
+    for path in sorted(glob.glob(os.path.join(directory, '*', 'historical.html'))):
+        with open(path, encoding='utf-8') as file:
+            history_pages.append(file.read())
+
+    for path in sorted(glob.glob(os.path.join(directory, '*', 'insider-trades-*.html'))):
+        page = int(os.path.basename(path)[len('insider-trades-'):-len('.html')])
+        with open(path, encoding='utf-8') as file:
+            trades_pages.append((page, file.read()))
+
+    return history_pages, trades_pages
+
+
+def parse_all(history_pages, trades_pages):
+    """
+    Parses all the pages using the current parser backend.
+
+    :return: parsed rows
+    """
+
+    history = [data_fetcher.Parser.parse_history_page('BENCH', text) for text in history_pages]
+    trades = [data_fetcher.Parser.parse_trades_page('BENCH', page, text) for page, text in trades_pages]
+
+    return history, trades
+
+
+def run(history_pages, trades_pages, number):
+    """
+    Runs the benchmark for every table extraction backend.
+
+    :param history_pages: 'historical' pages
+    :param trades_pages: 'insider-trades' pages
+    :param number: number of iterations
+    :return: dict of (history seconds, trades seconds) per page by backend name
+    :raises AssertionError if the backends results differ
+    """
+
+    results, reference = {}, None
+
+    for name, extractor in data_fetcher.TABLE_EXTRACTORS.items():
+        data_fetcher.Parser.TABLE_EXTRACTOR = extractor
+
+        parsed = parse_all(history_pages, trades_pages)
+        if reference is None:
+            reference = parsed
+        assert parsed == reference, f"'{name}' parser result differs from the reference one"
+
+        history_time = timeit.timeit(
+            lambda: [data_fetcher.Parser.parse_history_page('BENCH', text) for text in history_pages], number=number
+        )
+        trades_time = timeit.timeit(
+            lambda: [data_fetcher.Parser.parse_trades_page('BENCH', page, text) for page, text in trades_pages],
+            number=number
+        )
+        results[name] = (
+            history_time / number / max(len(history_pages), 1),
+            trades_time / number / max(len(trades_pages), 1),
+        )
+
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Nasdaq page parser benchmark.')
+    parser.add_argument(
+        '-d', '--directory', dest='directory', default=None, help='saved pages directory (generated if not set)'
+    )
+    parser.add_argument('-n', '--number', dest='number', type=int, default=10, help='number of iterations')
+
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_directory:
+        directory = args.directory
+        if directory is None:
+            directory = tmp_directory
+            nasdaq_stub.generate(directory, ['AAA', 'BBB', 'CCC'], pages=10)
+
+        history_pages, trades_pages = load_pages(directory)
+
+    results = run(history_pages, trades_pages, args.number)
+
+    reference_name = next(iter(results))
+    reference_history, reference_trades = results[reference_name]
+
+    print(f"{'backend':<10}{'parse_history, ms':>20}{'speedup':>10}{'parse_trades, ms':>20}{'speedup':>10}")
+    for name, (history_time, trades_time) in results.items():
+        print(
+            f"{name:<10}{history_time * 1000:>20.3f}{reference_history / history_time:>10.1f}"
+            f"{trades_time * 1000:>20.3f}{reference_trades / trades_time:>10.1f}"
+        )
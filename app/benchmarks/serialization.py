@@ -0,0 +1,175 @@
+"""
+Api response serialization benchmark. Compares marshmallow model schema dumping of orm objects with
+the precompiled row serializers on synthetic quotes and trades and checks that they produce the same json.
+The synthetic data is inserted in a transaction which is rolled back at the end:
+
+    python -m benchmarks.serialization -s 10000 100000
+"""
+
+import argparse
+import datetime
+import time
+
+import flask
+from sqlalchemy import orm
+
+from app import app
+from app import db
+from app import models
+from app import serialization as sz
+from app import streaming
+
+
+BENCH_TICKER = 'BENCH'
+
+
+def insert_data(size):
+    """
+    Inserts a stock with 'size' synthetic quotes and trades.
+
+    :param size: number of quotes and trades
+    :return: stock identifier
+    """
+
+    stock = models.Stock(ticker=BENCH_TICKER)
+    insiders = [models.Insider(name=f'BENCH INSIDER {idx}', relation='Director') for idx in range(10)]
+    db.session.add_all([stock, *insiders])
+    db.session.flush()
+
+    start_date = datetime.date(1800, 1, 1)
+    db.session.execute(models.Quote.__table__.insert(), [
+        dict(
+            stock_id=stock.id,
+            date=start_date + datetime.timedelta(days=idx),
+            open_price=100 + idx % 97 * 0.37,
+            close_price=100 + idx % 89 * 0.41,
+            high_price=150 + idx % 83 * 0.13,
+            low_price=50 + idx % 79 * 0.17,
+            volume=float(10 ** 6 + idx),
+        )
+        for idx in range(size)
+    ])
+    db.session.execute(models.Trade.__table__.insert(), [
+        dict(
+            stock_id=stock.id,
+            insider_id=insiders[idx % len(insiders)].id,
+            transaction_type='Buy' if idx % 3 else 'Sell',
+            owner_type=models.OwnerType.direct if idx % 2 else models.OwnerType.indirect,
+            last_date=start_date + datetime.timedelta(days=idx // 5),
+            shares_traded=idx,
+            last_price=None if idx % 7 == 0 else 10 + idx % 113 * 0.29,
+            shares_hold=idx * 3,
+        )
+        for idx in range(size)
+    ])
+
+    return stock.id
+
+
+def dump_marshmallow(schema, objects):
+    """
+    Serializes the objects the way the api did before the row serializers were introduced.
+
+    :return: json array
+    """
+
+    return '[' + ','.join(flask.json.dumps(schema.dump(obj).data, separators=(',', ':')) for obj in objects) + ']\n'
+
+
+def dump_rows(serializer, rows):
+    """
+    Serializes the rows using the row serializer and the streaming encoder.
+
+    :return: json array
+    """
+
+    return ''.join(streaming.iter_json_array(serializer.dump_iter(rows)))
+
+
+def measure(func):
+    """
+    :return: tuple of the function result and the elapsed time in seconds
+    """
+
+    started_at = time.perf_counter()
+    result = func()
+
+    return result, time.perf_counter() - started_at
+
+
+def run(stock_id):
+    """
+    Runs the benchmark on the quotes and the trades of the stock.
+
+    :param stock_id: stock identifier
+    :return: dict of (marshmallow seconds, row serializer seconds) by data name
+    :raises AssertionError if the serializers results differ
+    """
+
+    results = {}
+    batch_size = app.config['STREAM_BATCH_SIZE']
+
+    quote_serializer = sz.get_row_serializer(sz.QuoteApiSchema)
+    trade_serializer = sz.get_row_serializer(sz.TradeApiSchema)
+
+    cases = {
+        'quotes': (
+            lambda: dump_marshmallow(
+                sz.QuoteApiSchema(),
+                models.Quote.query.filter_by(stock_id=stock_id).order_by(models.Quote.date).yield_per(batch_size)
+            ),
+            lambda: dump_rows(
+                quote_serializer,
+                quote_serializer.query().
+                filter(models.Quote.stock_id == stock_id).
+                order_by(models.Quote.date).
+                yield_per(batch_size)
+            ),
+        ),
+        'trades': (
+            lambda: dump_marshmallow(
+                sz.TradeApiSchema(),
+                models.Trade.query.filter_by(stock_id=stock_id).
+                options(orm.joinedload(models.Trade.insider)).
+                order_by(models.Trade.last_date, models.Trade.id).
+                yield_per(batch_size)
+            ),
+            lambda: dump_rows(
+                trade_serializer,
+                trade_serializer.query().
+                filter(models.Trade.stock_id == stock_id).
+                order_by(models.Trade.last_date, models.Trade.id).
+                yield_per(batch_size)
+            ),
+        ),
+    }
+
+    for name, (marshmallow_case, rows_case) in cases.items():
+        marshmallow_result, marshmallow_time = measure(marshmallow_case)
+        db.session.expunge_all()
+        rows_result, rows_time = measure(rows_case)
+
+        assert marshmallow_result == rows_result, f"'{name}' serialization results differ"
+        results[name] = (marshmallow_time, rows_time)
+
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Api response serialization benchmark.')
+    parser.add_argument('-s', '--sizes', dest='sizes', type=int, nargs='+', default=[10000, 100000], help='row counts')
+
+    args = parser.parse_args()
+
+    print(f"{'data':<10}{'rows':>10}{'marshmallow, s':>18}{'row serializer, s':>20}{'speedup':>10}")
+
+    with app.app_context():
+        for size in args.sizes:
+            try:
+                results = run(insert_data(size))
+            finally:
+                db.session.rollback()
+
+            for name, (marshmallow_time, rows_time) in results.items():
+                print(f"{name:<10}{size:>10}{marshmallow_time:>18.3f}{rows_time:>20.3f}"
+                      f"{marshmallow_time / rows_time:>10.1f}")
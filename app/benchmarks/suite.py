@@ -0,0 +1,391 @@
+"""
+Benchmark suite. Times every request handler through the Flask test client on the generated data
+(see 'benchmarks.datagen') and the data fetcher ingestion of the saved nasdaq pages (recorded or generated by
+'benchmarks.nasdaq_stub') served by the local stub. The response cache and the quote store are turned off
+so every request reaches the database. The results are written to a json file and compared with a previous run,
+the exit code is 1 if any case got slower than the threshold:
+
+    python -m benchmarks.datagen generate -n 20 -y 10 -k 1000
+    python -m benchmarks.suite -o before.json
+    python -m benchmarks.suite -o after.json -b before.json
+"""
+
+import argparse
+import datetime
+import json
+import logging
+import os
+import platform
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse as url_parser
+
+import numpy as np
+import sqlalchemy
+
+import data_fetcher
+from app import app
+from app import db
+from app import models
+from benchmarks import datagen
+from benchmarks import nasdaq_stub
+
+
+FIXTURE_PREFIX = 'FX'
+
+# (name, url template), the templates are formatted with the target parameters (see 'get_target')
+HANDLER_CASES = (
+    ('index', '/'),
+    ('api index', '/api'),
+    ('quotes page', '/{ticker}'),
+    ('api quotes', '/api/{ticker}'),
+    ('api quotes page', '/api/{ticker}?limit=100'),
+    ('api quotes date range', '/api/{ticker}?date_from={date_from}&date_to={date_to}&fields=date,close_price'),
+    ('api batch quotes', '/api/quotes?tickers={tickers}&date_from={date_from}&date_to={date_to}'),
+    ('trades page', '/{ticker}/insider'),
+    ('api trades', '/api/{ticker}/insider'),
+    ('api trades by type', '/api/{ticker}/insider?transaction_type=Buy'),
+    ('insider page', '/{ticker}/insider/{insider}'),
+    ('api insider', '/api/{ticker}/insider/{insider}'),
+    ('stats page', '/{ticker}/stats'),
+    ('api stats', '/api/{ticker}/stats?type=close'),
+    ('analytics page', '/{ticker}/analytics?date_from={date_from}&date_to={date_to}'),
+    ('api analytics', '/api/{ticker}/analytics?date_from={date_from}&date_to={date_to}'),
+    ('api analytics summary', '/api/{ticker}/analytics?date_from={year_from}&date_to={date_to}&summary=1'),
+    ('api analytics top', '/api/{ticker}/analytics?date_from={year_from}&date_to={date_to}&top=100'),
+    ('api analytics span', '/api/{ticker}/analytics?date_from={year_from}&date_to={date_to}&max_span_days=30'),
+    ('delta page', '/{ticker}/delta?value={delta_value}&type=close'),
+    ('api delta', '/api/{ticker}/delta?value={delta_value}&type=close'),
+    ('analytics form', '/analytics/form'),
+    ('delta form', '/delta/form'),
+    ('metrics', '/metrics'),
+)
+
+SERVER_TIMING_DB_RE = re.compile(r'(?:^|,\s*)db;dur=(?P<dur>[\d.]+)')
+
+
+def get_target(prefix, window_days, delta_value, batch_size):
+    """
+    Selects the request parameters from the generated data: the first generated ticker, its first insider
+    and the date window ending at its last quote.
+
+    :param prefix: generated tickers prefix
+    :param window_days: analytics and date range window size
+    :param delta_value: delta request value
+    :param batch_size: number of tickers of the batch quotes request
+    :return: dict of the url template parameters
+    :raises RuntimeError if the data is not generated
+    """
+
+    stocks = models.Stock.query.\
+        filter(datagen.generated_stocks(prefix)).\
+        order_by(models.Stock.ticker).\
+        limit(batch_size).\
+        all()
+    if not stocks:
+        raise RuntimeError(f"no '{prefix}' tickers found, run 'python -m benchmarks.datagen generate' first")
+
+    stock = stocks[0]
+    last_date = db.session.query(sqlalchemy.func.max(models.Quote.date)).filter_by(stock_id=stock.id).scalar()
+    insider = models.Insider.query.\
+        join(models.Trade, models.Trade.insider_id == models.Insider.id).\
+        filter(models.Trade.stock_id == stock.id).\
+        order_by(models.Insider.name).\
+        first()
+
+    return dict(
+        ticker=stock.ticker,
+        tickers=','.join(stock.ticker for stock in stocks),
+        insider=url_parser.quote(insider.name if insider else ''),
+        date_from=last_date - datetime.timedelta(days=window_days),
+        year_from=last_date - datetime.timedelta(days=365),
+        date_to=last_date,
+        delta_value=delta_value,
+    )
+
+
+def summarize(times):
+    """
+    :param times: measured times in seconds
+    :return: dict of the time statistics in milliseconds
+    """
+
+    times = np.array(times) * 1000
+
+    return dict(
+        min=float(times.min()),
+        median=float(np.median(times)),
+        p95=float(np.percentile(times, 95)),
+        mean=float(times.mean()),
+    )
+
+
+def run_handlers(target, repeat, cases=None):
+    """
+    Times the handlers. Every case is requested once to warm up and then 'repeat' times, the time
+    includes the whole response body reading. The database time is taken from 'Server-Timing' header.
+
+    :param target: url template parameters
+    :param repeat: number of the measured requests per case
+    :param cases: names of the cases to run (all if not set)
+    :return: dict of the case results by case name
+    """
+
+    client = app.test_client()
+    results = {}
+
+    for name, template in HANDLER_CASES:
+        if cases and name not in cases:
+            continue
+
+        url = template.format(**target)
+        times, db_times, size, status = [], [], 0, None
+
+        for idx in range(repeat + 1):
+            started_at = time.perf_counter()
+            response = client.get(url)
+            body = response.get_data()
+            elapsed = time.perf_counter() - started_at
+            response.close()
+
+            status, size = response.status_code, len(body)
+            db_match = SERVER_TIMING_DB_RE.search(response.headers.get('Server-Timing', ''))
+            if idx > 0:
+                times.append(elapsed)
+                if db_match:
+                    db_times.append(float(db_match.group('dur')) / 1000)
+
+        results[name] = dict(
+            url=url,
+            status=status,
+            bytes=size,
+            time=summarize(times),
+            db_time=summarize(db_times) if db_times else None,
+        )
+
+    return results
+
+
+def run_fetcher(directory, tickers, modes, workers, pages):
+    """
+    Times the data fetcher ingestion of the saved pages. For every mode the fixture tickers data is removed
+    and fetched twice: the first run inserts all the rows, the second one finds them unchanged.
+
+    :param directory: saved pages directory
+    :param tickers: fixture ticker names
+    :param modes: fetcher modes ('threads' and/or 'async')
+    :param workers: number of the fetcher threads
+    :param pages: number of trades pages per ticker
+    :return: dict of the run results by '<mode> <run>' name
+    """
+
+    server = nasdaq_stub.make_server(directory, port=0)
+    server_thread = threading.Thread(target=server.serve_forever, daemon=True)
+    server_thread.start()
+
+    base_url = data_fetcher.Parser.BASE_URL
+    data_fetcher.Parser.BASE_URL = f'http://localhost:{server.server_address[1]}'
+    results = {}
+
+    try:
+        for mode in modes:
+            datagen.drop(FIXTURE_PREFIX, tickers)
+            db.session.commit()
+
+            for run in ('initial', 'repeated'):
+                if mode == 'async':
+                    fetcher = data_fetcher.AsyncFetcher(max_workers=workers, max_trades_pages=pages)
+                else:
+                    fetcher = data_fetcher.Fetcher(max_workers=workers, max_trades_pages=pages)
+
+                fetcher.fetch(tickers)
+                db.session.remove()
+
+                report = fetcher.telemetry.report()
+                totals = report['totals']
+                results[f'{mode} {run}'] = dict(
+                    time=report['elapsed'] * 1000,
+                    failed_tasks=report['failed_tasks'],
+                    rows_inserted=totals['inserted'],
+                    rows_updated=totals['updated'],
+                    rows_skipped=totals['skipped'],
+                    fetch_time=totals['fetch_time'] * 1000,
+                    parse_time=totals['parse_time'] * 1000,
+                    write_time=totals['write_time'] * 1000,
+                )
+    finally:
+        data_fetcher.Parser.BASE_URL = base_url
+        server.shutdown()
+        server.server_close()
+        datagen.drop(FIXTURE_PREFIX, tickers)
+        db.session.commit()
+
+    return results
+
+
+def link_pages(source, directory):
+    """
+    Links the saved pages of every ticker to the directory under a fixture ticker name so that
+    the fetcher doesn't overwrite the stored data of the real tickers.
+
+    :param source: saved pages directory (see 'benchmarks.nasdaq_stub' layout)
+    :param directory: directory to create the links in
+    :return: fixture ticker names
+    """
+
+    names = sorted(name for name in os.listdir(source) if os.path.isdir(os.path.join(source, name)))
+    tickers = datagen.make_tickers(len(names), FIXTURE_PREFIX)
+
+    for name, ticker in zip(names, tickers):
+        os.symlink(os.path.abspath(os.path.join(source, name)), os.path.join(directory, ticker.lower()))
+
+    return tickers
+
+
+def get_revision():
+    """
+    :return: current git revision or None if unknown
+    """
+
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL, universal_newlines=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def get_dataset(prefix):
+    """
+    :param prefix: generated tickers prefix
+    :return: dict of the generated data size
+    """
+
+    stock_ids = db.session.query(models.Stock.id).filter(datagen.generated_stocks(prefix))
+
+    return dict(
+        tickers=stock_ids.count(),
+        quotes=models.Quote.query.filter(models.Quote.stock_id.in_(stock_ids.subquery())).count(),
+        trades=models.Trade.query.filter(models.Trade.stock_id.in_(stock_ids.subquery())).count(),
+    )
+
+
+def compare(results, baseline, threshold):
+    """
+    Compares the case times with the baseline ones (the median for the handlers, the total for the fetcher).
+
+    :param results: current results
+    :param baseline: baseline results
+    :param threshold: slowdown ratio considered a regression
+    :return: list of (section, case name, baseline ms, current ms, ratio, regression flag) tuples
+    """
+
+    sections = (
+        ('handlers', lambda case: case['time']['median']),
+        ('fetcher', lambda case: case['time']),
+    )
+
+    rows = []
+    for section, get_time in sections:
+        for name, case in results.get(section, {}).items():
+            baseline_case = baseline.get(section, {}).get(name)
+            if baseline_case is None:
+                continue
+
+            current_time, baseline_time = get_time(case), get_time(baseline_case)
+            ratio = current_time / baseline_time if baseline_time else float('inf')
+            rows.append((section, name, baseline_time, current_time, ratio, ratio > threshold))
+
+    return rows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Handlers and data fetcher benchmark suite.')
+    parser.add_argument('-o', '--output', dest='output', default='benchmark.json', help='results json file')
+    parser.add_argument('-b', '--baseline', dest='baseline', default=None, help='previous results json file')
+    parser.add_argument('-r', '--repeat', dest='repeat', type=int, default=10, help='requests per handler case')
+    parser.add_argument('-c', '--cases', dest='cases', nargs='*', default=[], help='handler cases (all if not set)')
+    parser.add_argument('--threshold', dest='threshold', type=float, default=1.2, help='regression slowdown ratio')
+    parser.add_argument('--prefix', dest='prefix', default=datagen.DEFAULT_PREFIX, help='generated tickers prefix')
+    parser.add_argument('--window-days', dest='window_days', type=int, default=90, help='analytics date window')
+    parser.add_argument('--delta-value', dest='delta_value', type=float, default=10, help='delta request value')
+    parser.add_argument('--batch-size', dest='batch_size', type=int, default=10, help='batch quotes tickers')
+    parser.add_argument('--skip-fetcher', dest='skip_fetcher', action='store_true', help="don't run the fetcher")
+    parser.add_argument('--pages', dest='pages', default=None, help='saved pages directory (generated if not set)')
+    parser.add_argument('--fixture-tickers', dest='fixture_tickers', type=int, default=10,
+                        help='number of tickers of the generated pages')
+    parser.add_argument('--fetcher-modes', dest='fetcher_modes', nargs='+', default=['threads', 'async'],
+                        help='fetcher modes')
+    parser.add_argument('--fetcher-workers', dest='fetcher_workers', type=int, default=4, help='fetcher threads')
+    parser.add_argument('--fetcher-pages', dest='fetcher_pages', type=int, default=10, help='trades pages per ticker')
+
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format='[%(levelname)-8s] %(asctime)-15s (%(name)s): %(message)s')
+
+    # every request should reach the database
+    app.config['RESPONSE_CACHE_ENABLED'] = False
+    app.config['QUOTE_STORE_ENABLED'] = False
+
+    try:
+        target = get_target(args.prefix, args.window_days, args.delta_value, args.batch_size)
+    except RuntimeError as e:
+        sys.exit(str(e))
+
+    results = dict(
+        meta=dict(
+            started_at=datetime.datetime.utcnow().isoformat(),
+            revision=get_revision(),
+            python=platform.python_version(),
+            dataset=get_dataset(args.prefix),
+            target={name: str(value) for name, value in target.items()},
+            repeat=args.repeat,
+        ),
+    )
+    db.session.remove()
+
+    results['handlers'] = run_handlers(target, args.repeat, args.cases)
+
+    if not args.skip_fetcher:
+        with tempfile.TemporaryDirectory() as tmp_directory:
+            if args.pages is None:
+                fixture_tickers = datagen.make_tickers(args.fixture_tickers, FIXTURE_PREFIX)
+                nasdaq_stub.generate(tmp_directory, fixture_tickers, pages=args.fetcher_pages)
+            else:
+                fixture_tickers = link_pages(args.pages, tmp_directory)
+
+            results['fetcher'] = run_fetcher(
+                tmp_directory, fixture_tickers, args.fetcher_modes, args.fetcher_workers, args.fetcher_pages
+            )
+
+    with open(args.output, 'w') as file:
+        json.dump(results, file, indent=2, default=str)
+
+    print(f"{'handler':<25}{'status':>8}{'KiB':>10}{'median, ms':>12}{'p95, ms':>10}{'db, ms':>10}")
+    for name, case in results['handlers'].items():
+        db_time = f"{case['db_time']['median']:>10.1f}" if case['db_time'] else f"{'-':>10}"
+        print(f"{name:<25}{case['status']:>8}{case['bytes'] / 1024:>10.1f}"
+              f"{case['time']['median']:>12.1f}{case['time']['p95']:>10.1f}{db_time}")
+
+    if results.get('fetcher'):
+        print(f"\n{'fetcher run':<25}{'ms':>10}{'inserted':>10}{'updated':>10}{'skipped':>10}{'failed':>8}")
+        for name, case in results['fetcher'].items():
+            print(f"{name:<25}{case['time']:>10.1f}{case['rows_inserted']:>10}{case['rows_updated']:>10}"
+                  f"{case['rows_skipped']:>10}{case['failed_tasks']:>8}")
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+
+        rows = compare(results, baseline, args.threshold)
+        print(f"\n{'case':<35}{'baseline, ms':>14}{'current, ms':>14}{'ratio':>8}")
+        for section, name, baseline_time, current_time, ratio, regression in rows:
+            print(f"{section + ': ' + name:<35}{baseline_time:>14.1f}{current_time:>14.1f}{ratio:>8.2f}"
+                  f"{'  REGRESSION' if regression else ''}")
+
+        if any(row[-1] for row in rows):
+            sys.exit(1)
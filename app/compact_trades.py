@@ -0,0 +1,64 @@
+"""
+Trades compaction script. Removes duplicated trades (having the same natural key) keeping the earliest stored ones
+and creates the trade natural key unique index. Should be executed once on databases filled before the index
+was introduced.
+"""
+
+import logging
+
+from app import data_version
+from app import db
+from app import models
+
+
+logger = logging.getLogger('compact_trades')
+
+NATURAL_KEY_INDEX = 'ix_trade_natural_key'
+
+
+def compact_trades():
+    """
+    Removes duplicated trades.
+
+    :return: number of removed trades
+    """
+
+    return db.session.execute(models.REMOVE_DUPLICATED_TRADES).rowcount
+
+
+def create_natural_key_index():
+    """
+    Creates the trade natural key unique index if it doesn't exist.
+
+    :return: True if the index has been created
+    """
+
+    # expression based indexes are not reflected by sqlalchemy so the catalog is queried directly
+    exists = db.session.execute(
+        'SELECT 1 FROM pg_indexes WHERE tablename = :table_name AND indexname = :index_name',
+        dict(table_name=models.Trade.__tablename__, index_name=NATURAL_KEY_INDEX)
+    ).first()
+    if exists:
+        return False
+
+    index, = (index for index in models.Trade.__table__.indexes if index.name == NATURAL_KEY_INDEX)
+    index.create(db.session.connection())
+
+    return True
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='[%(levelname)-8s] %(asctime)-15s (%(name)s): %(message)s')
+
+    try:
+        removed = compact_trades()
+        created = create_natural_key_index()
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    if removed:
+        data_version.bump()
+
+    logger.info(f"{removed} duplicated trades removed, natural key index {'created' if created else 'already exists'}")
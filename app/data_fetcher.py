@@ -4,17 +4,34 @@ and saving data to the application database. Should be executed on application s
 """
 
 import argparse
+import asyncio
+import collections
+import contextlib
+import datetime
+import json
 import logging
+import os
+import threading
+import time
 import urllib.parse as url_parser
 from concurrent import futures as conc_futures
 
+import aiohttp
 import bs4
+import lxml.html
 import requests
-import sqlalchemy.exc
+import sqlalchemy
 from dateutil import parser as date_parser
+from sqlalchemy import orm
+from sqlalchemy.dialects import postgresql
 
+from app import analytics
+from app import app
+from app import data_version
 from app import db
 from app import models
+from app import stats
+from app import store
 
 
 logger = logging.getLogger('fetcher')
@@ -26,28 +43,21 @@ class ParsingError(Exception):
     """
 
 
-class Parser:
+class Bs4TableExtractor:
     """
-    Nasdaq web page parser. Parses 'history' and 'insider-trades' page tables.
+    Extracts nasdaq page tables using BeautifulSoup pure python html parser.
     """
 
-    BASE_URL = 'https://www.nasdaq.com'
-
     @staticmethod
-    def parse_page(url, **params):
+    def build_dom(page_text):
         """
-        Parses the page at the url and returns its DOM
+        Parses the page text and returns its DOM
 
-        :param url: page url to parse
-        :param params: parameters to be passed to the 'request' method
+        :param page_text: page html text
         :return: parsed page DOM
         """
 
-        resp = requests.get(url, params=params)
-        resp.raise_for_status()
-        page_dom = bs4.BeautifulSoup(resp.text, 'html.parser')
-
-        return page_dom
+        return bs4.BeautifulSoup(page_text, 'html.parser')
 
     @staticmethod
     def find_tag(dom, **kwargs):
@@ -78,6 +88,219 @@ class Parser:
         return [[col.get_text().strip() for col in row.find_all('td')]
                 for row in table_dom.find_all('tr', recursive=False)]
 
+    @classmethod
+    def history_table(cls, page_text):
+        """
+        Extracts nasdaq 'historical' web page table.
+
+        :param page_text: page html text
+        :return: list of table rows
+        """
+
+        page_dom = cls.build_dom(page_text)
+        div_dom = cls.find_tag(page_dom, name='div', id='quotes_content_left_pnlAJAX')
+        table_dom = cls.find_tag(div_dom, name='table').find('tbody')
+
+        return cls.parse_table(table_dom)
+
+    @classmethod
+    def trades_table(cls, page_text, page):
+        """
+        Extracts nasdaq 'insider-trades' web page table.
+
+        :param page_text: page html text
+        :param page: requested page number
+        :return: list of table rows (empty if the page number is out of range)
+        """
+
+        page_dom = cls.build_dom(page_text)
+
+        last_page_dom = cls.find_tag(page_dom, id='quotes_content_left_lb_LastPage')
+        if page > parse_page_count(last_page_dom.get('href', '')):
+            return []
+
+        div_dom = cls.find_tag(page_dom, name='div', class_='genTable')
+        table_dom = cls.find_tag(div_dom, name='table')
+
+        return cls.parse_table(table_dom)
+
+
+class LxmlTableExtractor:
+    """
+    Extracts nasdaq page tables using lxml (libxml2) html parser and XPath queries
+    addressing the required tables directly.
+    """
+
+    GEN_TABLE_XPATH = '//div[contains(concat(" ", normalize-space(@class), " "), " genTable ")]'
+
+    @staticmethod
+    def find_first(dom, xpath):
+        """
+        Finds the first element matching the XPath expression.
+
+        :param dom: element to be used for search
+        :param xpath: XPath expression
+        :return: the requested element
+        :raises ParsingError is the requested element not found
+        """
+
+        result = dom.xpath(xpath)
+        if not result:
+            raise ParsingError(f"Element {xpath} not found")
+
+        return result[0]
+
+    @staticmethod
+    def parse_table(rows_dom):
+        """
+        Parses table rows and returns the result in a matrix form.
+
+        :param rows_dom: table row elements
+        :return: list of table rows
+        """
+
+        return [[col.text_content().strip() for col in row.iterdescendants('td')] for row in rows_dom]
+
+    @classmethod
+    def history_table(cls, page_text):
+        """
+        Extracts nasdaq 'historical' web page table.
+
+        :param page_text: page html text
+        :return: list of table rows
+        """
+
+        page_dom = lxml.html.document_fromstring(page_text)
+        div_dom = cls.find_first(page_dom, '//div[@id="quotes_content_left_pnlAJAX"]')
+        table_dom = cls.find_first(div_dom, './/table')
+        body_dom = cls.find_first(table_dom, './/tbody')
+
+        return cls.parse_table(body_dom.iterchildren('tr'))
+
+    @classmethod
+    def trades_table(cls, page_text, page):
+        """
+        Extracts nasdaq 'insider-trades' web page table.
+
+        :param page_text: page html text
+        :param page: requested page number
+        :return: list of table rows (empty if the page number is out of range)
+        """
+
+        page_dom = lxml.html.document_fromstring(page_text)
+
+        last_page_dom = cls.find_first(page_dom, '//*[@id="quotes_content_left_lb_LastPage"]')
+        if page > parse_page_count(last_page_dom.get('href', '')):
+            return []
+
+        div_dom = cls.find_first(page_dom, cls.GEN_TABLE_XPATH)
+        table_dom = cls.find_first(div_dom, './/table')
+
+        return cls.parse_table(table_dom.iterchildren('tr'))
+
+
+TABLE_EXTRACTORS = {
+    'bs4': Bs4TableExtractor,
+    'lxml': LxmlTableExtractor,
+}
+
+
+def parse_page_count(last_page_url):
+    """
+    Returns the page count using nasdaq 'insider-trades' last page url.
+
+    :param last_page_url: last page link url
+    :return: number of pages
+    """
+
+    url = url_parser.urlparse(last_page_url)
+
+    return int(url_parser.parse_qs(url.query).get('page', ['1'])[0])
+
+
+def parse_date(text):
+    """
+    Parses a date in nasdaq 'MM/DD/YYYY' format falling back to the generic date parser.
+
+    :param text: date text
+    :return: parsed date
+    :raises ValueError if the text is not a date
+    """
+
+    try:
+        return datetime.datetime.strptime(text, '%m/%d/%Y').date()
+    except ValueError:
+        return date_parser.parse(text).date()
+
+
+class Parser:
+    """
+    Nasdaq web page parser. Parses 'history' and 'insider-trades' page tables.
+    """
+
+    BASE_URL = 'https://www.nasdaq.com'
+
+    TABLE_EXTRACTOR = LxmlTableExtractor
+
+    _http_sessions = threading.local()
+
+    @classmethod
+    def http_session(cls):
+        """
+        :return: thread-local http session keeping connections to the server alive
+        """
+
+        session = getattr(cls._http_sessions, 'session', None)
+        if session is None:
+            session = cls._http_sessions.session = requests.Session()
+
+        return session
+
+    @classmethod
+    def history_url(cls, ticker):
+        """
+        :param ticker: ticker name
+        :return: nasdaq 'historical' web page url
+        """
+
+        return f'{cls.BASE_URL}/symbol/{ticker.lower()}/historical'
+
+    @classmethod
+    def trades_url(cls, ticker):
+        """
+        :param ticker: ticker name
+        :return: nasdaq 'insider-trades' web page url
+        """
+
+        return f'{cls.BASE_URL}/symbol/{ticker.lower()}/insider-trades'
+
+    @classmethod
+    def get_page(cls, url, **params):
+        """
+        Downloads the page at the url and returns its text
+
+        :param url: page url to download
+        :param params: parameters to be passed to the 'request' method
+        :return: page text
+        """
+
+        return cls.download(url, **params)[0]
+
+    @classmethod
+    def download(cls, url, **params):
+        """
+        Downloads the page at the url.
+
+        :param url: page url to download
+        :param params: parameters to be passed to the 'request' method
+        :return: tuple of page text and page size in bytes
+        """
+
+        resp = cls.http_session().get(url, params=params)
+        resp.raise_for_status()
+
+        return resp.text, len(resp.content)
+
     @classmethod
     def parse_history(cls, ticker):
         """
@@ -87,11 +310,19 @@ class Parser:
         :return: historical data as a list of dicts
         """
 
-        page_dom = cls.parse_page(f'{cls.BASE_URL}/symbol/{ticker.lower()}/historical')
-        div_dom = cls.find_tag(page_dom, name='div', id='quotes_content_left_pnlAJAX')
-        table_dom = cls.find_tag(div_dom, name='table').find('tbody')
+        return cls.parse_history_page(ticker, cls.get_page(cls.history_url(ticker)))
 
-        table = cls.parse_table(table_dom)
+    @classmethod
+    def parse_history_page(cls, ticker, page_text):
+        """
+        Parses nasdaq 'historical' web page text and returns historical data.
+
+        :param ticker: ticker name
+        :param page_text: page html text
+        :return: historical data as a list of dicts
+        """
+
+        table = cls.TABLE_EXTRACTOR.history_table(page_text)
         result = []
 
         for row in table:
@@ -101,7 +332,7 @@ class Parser:
 
             try:
                 result.append(dict(
-                    date=date_parser.parse(row[0]).date(),
+                    date=parse_date(row[0]),
                     open_price=float(row[1].replace(',', '')),
                     high_price=float(row[2].replace(',', '')),
                     low_price=float(row[3].replace(',', '')),
@@ -124,51 +355,43 @@ class Parser:
         :return: historical data as a list of dicts
         """
 
-        page_dom = cls.parse_page(f'{cls.BASE_URL}/symbol/{ticker.lower()}/insider-trades', page=page)
-        page_count = cls.parse_trades_page_count(page_dom)
-
-        result = []
-        if page <= page_count:
-            div_dom = cls.find_tag(page_dom, name='div', class_='genTable')
-            table_dom = cls.find_tag(div_dom, name='table')
-
-            table = cls.parse_table(table_dom)
-
-            for row in table:
-                if len(row) != 8:
-                    logger.warning(f"Unexpected table row size (expected: 8, actual: {len(row)}): {row}")
-                    continue
-
-                try:
-                    result.append(dict(
-                        insider=row[0],
-                        relation=row[1],
-                        last_date=date_parser.parse(row[2]).date(),
-                        transaction_type=row[3],
-                        owner_type=row[4],
-                        shares_traded=float(row[5].replace(',', '')),
-                        last_price=float(row[6]) if row[6] else None,
-                        shares_hold=float(row[7].replace(',', '')),
-                    ))
-                except ValueError as e:
-                    logger.warning(f"Unexpected data format: {ticker} {page} {e}")
-                    continue
-
-        return result
+        return cls.parse_trades_page(ticker, page, cls.get_page(cls.trades_url(ticker), page=page))
 
     @classmethod
-    def parse_trades_page_count(cls, page_dom):
+    def parse_trades_page(cls, ticker, page, page_text):
         """
-        Traverses nasdaq 'insider-trades' page DOM to find the page count.
+        Parses nasdaq 'insider-trades' web page text and returns trades data.
 
-        :param page_dom: page DOM to traverse
-        :return: number of pages
+        :param ticker: ticker name
+        :param page: page number
+        :param page_text: page html text
+        :return: historical data as a list of dicts
         """
 
-        last_page_dom = cls.find_tag(page_dom, id='quotes_content_left_lb_LastPage')
-        last_page_url = url_parser.urlparse(last_page_dom.get('href', ''))
+        table = cls.TABLE_EXTRACTOR.trades_table(page_text, page)
+        result = []
+
+        for row in table:
+            if len(row) != 8:
+                logger.warning(f"Unexpected table row size (expected: 8, actual: {len(row)}): {row}")
+                continue
 
-        return int(url_parser.parse_qs(last_page_url.query).get('page', ['1'])[0])
+            try:
+                result.append(dict(
+                    insider=row[0],
+                    relation=row[1],
+                    last_date=parse_date(row[2]),
+                    transaction_type=row[3],
+                    owner_type=row[4],
+                    shares_traded=float(row[5].replace(',', '')),
+                    last_price=float(row[6]) if row[6] else None,
+                    shares_hold=float(row[7].replace(',', '')),
+                ))
+            except ValueError as e:
+                logger.warning(f"Unexpected data format: {ticker} {page} {e}")
+                continue
+
+        return result
 
 
 class Fetcher:
@@ -184,16 +407,38 @@ class Fetcher:
 
         return db.session()
 
-    def __init__(self, max_workers, max_trades_pages=10):
+    def __init__(self, max_workers, max_trades_pages=10, incremental=False, progress_interval=5.0):
         """
         :param max_workers: number of threads (workers) the tasks to be executed on
         :param max_trades_pages: maximum number of trades pages to parse
+        :param incremental: fetch only the data newer than the already stored one
+        :param progress_interval: minimal interval between the progress messages in seconds
         """
 
         self._max_workers = max_workers
         self._max_trades_pages = max_trades_pages
+        self._incremental = incremental
+        self._progress_interval = progress_interval
         self._executor = conc_futures.ThreadPoolExecutor(max_workers)
 
+        self.telemetry = None
+
+    def iter_tasks(self, tickers):
+        """
+        Creates the fetching tasks of the tickers.
+
+        :param tickers: ticker names
+        :return: generator of (task telemetry, fetching method, method arguments) tuples
+        """
+
+        for ticker in tickers:
+            yield self.telemetry.add_task(ticker, 'history'), self.fetch_history, (ticker,)
+            if self._incremental:
+                yield self.telemetry.add_task(ticker, 'new trades'), self.fetch_new_trades, (ticker,)
+            else:
+                for page in range(1, self._max_trades_pages + 1):
+                    yield self.telemetry.add_task(ticker, 'trades', page), self.fetch_trades, (ticker, page)
+
     def fetch(self, tickers):
         """
         Executes nasdaq data fetching tasks using thread pool executor and waits for the result.
@@ -202,106 +447,971 @@ class Fetcher:
         """
 
         logger.info(f"Fetching nasdaq data using {self._max_workers} threads")
-        futures = []
-
-        for ticker in tickers:
-            futures.append(self._executor.submit(self.fetch_history, ticker))
-            for page in range(self._max_trades_pages):
-                futures.append(self._executor.submit(self.fetch_trades, ticker, page + 1))
+        self.telemetry = Telemetry(tickers, self._progress_interval)
 
+        futures = [
+            self._executor.submit(self.run_task, task, method, *args)
+            for task, method, args in self.iter_tasks(tickers)
+        ]
         for future in conc_futures.as_completed(futures):
-            try:
-                result = future.result()
-            except Exception as e:
-                logger.error(f"Fetching task failed: {e}")
-            else:
-                logger.info(f"Fetching task finished: {result}")
+            self.log_result(future.result)
 
-        logger.info(f"Data fetching successfully finished")
+        self.telemetry.finish()
 
-    def fetch_history(self, ticker):
+    def run_task(self, task, method, *args):
         """
-        Fetches history information about the ticker
+        Executes the fetching task.
 
-        :param ticker: ticker name
+        :param task: task telemetry
+        :param method: fetching method
+        :param args: method arguments
         :return: result message
         """
 
-        history = Parser.parse_history(ticker)
+        try:
+            result = method(task, *args)
+        except Exception as e:
+            self.telemetry.finish_task(task, e)
+            raise
+
+        self.telemetry.finish_task(task)
+
+        return result
+
+    @staticmethod
+    def log_result(get_result):
+        """
+        Logs the fetching task result.
+
+        :param get_result: function returning the task result message or raising the task error
+        """
 
         try:
-            stock = self.upsert(models.Stock, dict(ticker=ticker), keys=('ticker',))
-            for item in history:
-                item.update(stock_id=stock.id)
-                self.upsert(models.Quote, item, keys=('date', 'stock_id'))
+            result = get_result()
+        except Exception as e:
+            logger.error(f"Fetching task failed: {e}")
+        else:
+            logger.info(f"Fetching task finished: {result}")
 
-        except Exception:
-            self.session.rollback()
-            raise
+    def download(self, task, url, **params):
+        """
+        Downloads the page measuring the download time.
 
-        return f"{len(history)} history items for '{ticker}' has been collected"
+        :param task: task telemetry
+        :param url: page url
+        :param params: query parameters
+        :return: page text
+        """
 
-    def fetch_trades(self, ticker, page):
+        with task.measure('fetch'):
+            page_text, size = Parser.download(url, **params)
+
+        task.requests += 1
+        task.bytes += size
+
+        return page_text
+
+    def fetch_history(self, task, ticker):
+        """
+        Fetches history information about the ticker
+
+        :param task: task telemetry
+        :param ticker: ticker name
+        :return: result message
+        """
+
+        page_text = self.download(task, Parser.history_url(ticker))
+        with task.measure('parse'):
+            history = Parser.parse_history_page(ticker, page_text)
+
+        return self.store_history(task, ticker, history)
+
+    def fetch_trades(self, task, ticker, page):
         """
         Fetches trade information about the ticker
 
+        :param task: task telemetry
         :param ticker: ticker name
         :param page: page number to parse
         :return: result message
         """
 
-        trades = Parser.parse_trades(ticker, page)
+        page_text = self.download(task, Parser.trades_url(ticker), page=page)
+        with task.measure('parse'):
+            trades = Parser.parse_trades_page(ticker, page, page_text)
 
-        try:
-            stock = self.upsert(models.Stock, dict(ticker=ticker), keys=('ticker',))
+        return self.store_trades(task, ticker, page, trades)
+
+    def fetch_new_trades(self, task, ticker):
+        """
+        Fetches trade information about the ticker newer than the already stored one.
+        The pages are fetched one by one until a page contains only already stored trades.
+
+        :param task: task telemetry
+        :param ticker: ticker name
+        :return: result message
+        """
+
+        known_trades = self.get_known_trades(ticker)
+        new_count, page = 0, 0
+
+        for page in range(1, self._max_trades_pages + 1):
+            page_text = self.download(task, Parser.trades_url(ticker), page=page)
+            with task.measure('parse'):
+                trades = Parser.parse_trades_page(ticker, page, page_text)
+
+            new_trades = known_trades.filter_new(trades)
+            task.skipped += len(trades) - len(new_trades)
+            if not new_trades:
+                break
+
+            self.store_trades(task, ticker, page, new_trades)
+            new_count += len(new_trades)
+
+        return f"{new_count} new trade items for '{ticker}' has been collected (pages: {page})"
+
+    def store_history(self, task, ticker, history):
+        """
+        Saves history information about the ticker to the database and updates the ticker quote statistics
+
+        :param task: task telemetry
+        :param ticker: ticker name
+        :param history: parsed history items
+        :return: result message
+        """
+
+        parsed_count = len(history)
+        if self._incremental:
+            last_date = self.get_last_quote_date(ticker)
+            if last_date is not None:
+                # the last stored quote is rewritten since it could be stored before the trading day ended
+                history = [item for item in history if item['date'] >= last_date]
+
+        with self.write_batch() as batch:
+            stock_ids = self.resolve_ids(models.Stock, [dict(ticker=ticker)], key='ticker')
+            for item in history:
+                item.update(stock_id=stock_ids[ticker])
+
+            inserted, updated, changed = self.bulk_upsert(
+                models.Quote, history, keys=('stock_id', 'date'), returning=('date',)
+            )
+            batch.rows = inserted + updated
+            batch.quotes = bool(changed)
+
+            # the statistics are recomputed starting from the earliest inserted or updated quote only
+            if changed:
+                stats.update_stats(stock_ids[ticker], min(date for date, in changed))
+
+        task.add_write(batch.elapsed, parsed_count, inserted, updated)
+
+        return (
+            f"{len(history)} history items for '{ticker}' has been collected "
+            f"({inserted} inserted, {updated} updated, {parsed_count - batch.rows} skipped, {batch.rate:.0f} rows/s)"
+        )
+
+    def store_trades(self, task, ticker, page, trades):
+        """
+        Saves trade information about the ticker to the database
+
+        :param task: task telemetry
+        :param ticker: ticker name
+        :param page: page number the trades were parsed from
+        :param trades: parsed trade items
+        :return: result message
+        """
+
+        with self.write_batch() as batch:
+            stock_ids = self.resolve_ids(models.Stock, [dict(ticker=ticker)], key='ticker')
+            insider_ids = self.resolve_ids(
+                models.Insider,
+                [dict(name=trade['insider'], relation=trade['relation']) for trade in trades],
+                key='name'
+            )
+
+            rows = []
             for trade in trades:
-                insider_data = dict(name=trade.pop('insider'), relation=trade.pop('relation'))
-                insider = self.upsert(models.Insider, insider_data, keys=('name',))
+                insider_name = trade.pop('insider')
+                trade.pop('relation')
+                rows.append(dict(trade, stock_id=stock_ids[ticker], insider_id=insider_ids[insider_name]))
+
+            if rows:
+                # already stored trades (having the same natural key) are skipped
+                statement = postgresql.insert(models.Trade.__table__).values(rows).on_conflict_do_nothing()
+                batch.rows = self.session.execute(statement).rowcount
+
+        task.add_write(batch.elapsed, len(trades), batch.rows, 0)
+
+        return (
+            f"{len(trades)} trade items for '{ticker}' has been collected "
+            f"(page: {page}, {len(trades) - batch.rows} already stored, {batch.rate:.0f} rows/s)"
+        )
+
+    @staticmethod
+    def last_quote_date_query(session, ticker):
+        """
+        :return: query of the date of the latest stored quote of the ticker
+        """
+
+        return session.query(sqlalchemy.func.max(models.Quote.date)).\
+            join(models.Stock, models.Stock.id == models.Quote.stock_id).\
+            filter(models.Stock.ticker == ticker)
+
+    @staticmethod
+    def last_trade_date_query(session, ticker):
+        """
+        :return: query of the date of the latest stored trade of the ticker
+        """
+
+        return session.query(sqlalchemy.func.max(models.Trade.last_date)).\
+            join(models.Stock, models.Stock.id == models.Trade.stock_id).\
+            filter(models.Stock.ticker == ticker)
+
+    def get_last_quote_date(self, ticker):
+        """
+        Returns the date of the latest stored quote of the ticker.
+
+        :param ticker: ticker name
+        :return: the latest quote date or None if there are no quotes
+        """
+
+        try:
+            return self.last_quote_date_query(self.session, ticker).scalar()
+        finally:
+            self.session.close()
 
-                self.session.add(models.Trade(stock_id=stock.id, insider_id=insider.id, **trade))
-                self.session.commit()
+    def get_known_trades(self, ticker):
+        """
+        Returns the latest stored trades of the ticker.
+
+        :param ticker: ticker name
+        :return: known trades
+        """
 
+        try:
+            last_date = self.last_trade_date_query(self.session, ticker).scalar()
+
+            last_date_trades = self.session.query(models.Trade).\
+                join(models.Stock, models.Stock.id == models.Trade.stock_id).\
+                filter(models.Stock.ticker == ticker, models.Trade.last_date == last_date).\
+                options(orm.joinedload(models.Trade.insider)).\
+                all()
+
+            return KnownTrades(last_date, [
+                dict(
+                    insider=trade.insider.name,
+                    transaction_type=trade.transaction_type,
+                    owner_type=str(trade.owner_type),
+                    shares_traded=trade.shares_traded,
+                    last_price=trade.last_price,
+                    shares_hold=trade.shares_hold,
+                )
+                for trade in last_date_trades
+            ])
+        finally:
+            self.session.close()
+
+    @contextlib.contextmanager
+    def write_batch(self):
+        """
+        Executes database writes in a single transaction and measures the write rate.
+        The caller should set the 'rows' attribute of the yielded batch to the number of written rows.
+        The data version is bumped after the transaction is committed if any rows have been written,
+        the quotes version is bumped as well if the caller has set the 'quotes' attribute.
+
+        :return: batch object with 'rows', 'quotes', 'elapsed' and 'rate' attributes
+        """
+
+        batch = WriteBatch()
+        started_at = time.monotonic()
+
+        try:
+            yield batch
+            self.session.commit()
         except Exception:
             self.session.rollback()
             raise
 
-        return f"{len(trades)} trade items for '{ticker}' has been collected (page: {page})"
+        if batch.quotes:
+            data_version.bump(data_version.QUOTES)
+        elif batch.rows:
+            data_version.bump()
+
+        batch.elapsed = time.monotonic() - started_at
 
-    def upsert(self, model, data, keys):
+    def bulk_upsert(self, model, rows, keys, returning=()):
         """
-        Inserts 'model' object to the database or updates it if it already exists.
+        Inserts 'model' rows to the database using a single 'INSERT ... ON CONFLICT' statement.
+        Already existing rows (identified by 'keys') are updated. If several rows have the same keys the last one wins.
 
         :param model: database model
-        :param data: model fields to be updated or used for the creating a new object if it already exists
-        :param keys: model fields to be used for identification (primary or unique fields)
-        :return: updated or inserted object
+        :param rows: list of model fields dicts
+        :param keys: model fields to be used for identification (must be covered by a unique constraint)
+        :param returning: model fields to be returned for the inserted and updated rows
+        :return: tuple of inserted and updated row counts and list of 'returning' fields tuples of those rows
         """
 
-        key_fields = {key: data[key] for key in keys}
-        instance = model(**data)
+        # rows are sorted by keys so that concurrent batches lock the same rows in the same order
+        unique_rows = {tuple(row[key] for key in keys): row for row in rows}
+        rows = [unique_rows[row_keys] for row_keys in sorted(unique_rows)]
+        if not rows:
+            return 0, 0, []
+
+        statement = postgresql.insert(model.__table__).values(rows)
+        update_fields = [field for field in rows[0] if field not in keys]
+        returning_columns = [model.__table__.c[field] for field in returning]
+
+        if not update_fields:
+            statement = statement.on_conflict_do_nothing(index_elements=keys)
+            if not returning_columns:
+                return self.session.execute(statement).rowcount, 0, []
+
+            changed = [tuple(row) for row in self.session.execute(statement.returning(*returning_columns))]
+            return len(changed), 0, changed
+
+        # unchanged rows are not rewritten
+        statement = statement.on_conflict_do_update(
+            index_elements=keys,
+            set_={field: statement.excluded[field] for field in update_fields},
+            where=sqlalchemy.or_(*(
+                model.__table__.c[field].is_distinct_from(statement.excluded[field]) for field in update_fields
+            ))
+        )
+        # 'xmax' of a newly inserted row version is zero while a row updated by the conflict clause has it set
+        statement = statement.returning(
+            sqlalchemy.literal_column('xmax = 0', type_=sqlalchemy.Boolean), *returning_columns
+        )
+
+        result = self.session.execute(statement).fetchall()
+        inserted = sum(row[0] for row in result)
+
+        return inserted, len(result) - inserted, [tuple(row[1:]) for row in result]
+
+    def resolve_ids(self, model, rows, key):
+        """
+        Upserts 'model' rows and returns their identifiers using a single lookup query.
 
+        :param model: database model
+        :param rows: list of model fields dicts
+        :param key: unique model field to be used for identification
+        :return: dict of identifiers by key field value
+        """
+
+        self.bulk_upsert(model, rows, keys=(key,))
+
+        key_column = getattr(model, key)
+        values = {row[key] for row in rows}
+        if not values:
+            return {}
+
+        return dict(self.session.query(key_column, model.id).filter(key_column.in_(values)))
+
+
+class KnownTrades:
+    """
+    Already stored trades of a stock. Nasdaq lists trades starting from the latest ones so a trade is considered
+    known if it is older than the latest stored trade or it is one of the latest date stored trades.
+    """
+
+    def __init__(self, last_date, last_date_trades):
+        """
+        :param last_date: the latest stored trade date (None if there are no trades)
+        :param last_date_trades: the latest date trades
+        """
+
+        self._last_date = last_date
+        self._last_date_trades = {self.trade_key(trade) for trade in last_date_trades}
+
+    @staticmethod
+    def trade_key(trade):
+        """
+        :param trade: trade fields dict
+        :return: trade identity within a date
+        """
+
+        return (
+            trade['insider'],
+            trade['transaction_type'],
+            trade['owner_type'],
+            trade['shares_traded'],
+            trade['last_price'],
+            trade['shares_hold'],
+        )
+
+    def is_known(self, trade):
+        """
+        :param trade: parsed trade
+        :return: True if the trade is already stored
+        """
+
+        if self._last_date is None or trade['last_date'] > self._last_date:
+            return False
+
+        return trade['last_date'] < self._last_date or self.trade_key(trade) in self._last_date_trades
+
+    def filter_new(self, trades):
+        """
+        :param trades: parsed trades
+        :return: not yet stored trades
+        """
+
+        return [trade for trade in trades if not self.is_known(trade)]
+
+
+class WriteBatch:
+    """
+    Database write batch statistics.
+    """
+
+    def __init__(self):
+        self.rows = 0
+        self.quotes = False
+        self.elapsed = 0.0
+
+    @property
+    def rate(self):
+        """
+        :return: rows written per second
+        """
+
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+
+class TaskStats:
+    """
+    Fetching task telemetry. The times are measured in seconds, the parsed rows are split into the inserted,
+    the updated and the skipped (already stored or unchanged) ones.
+    """
+
+    def __init__(self, ticker, kind, page=None):
+        """
+        :param ticker: ticker name
+        :param kind: task kind ('history', 'trades' or 'new trades')
+        :param page: trades page number (None if the task fetches several pages)
+        """
+
+        self.ticker = ticker
+        self.kind = kind
+        self.page = page
+        self.fetch_time = 0.0
+        self.parse_time = 0.0
+        self.write_time = 0.0
+        self.requests = 0
+        self.retries = 0
+        self.bytes = 0
+        self.parsed = 0
+        self.inserted = 0
+        self.updated = 0
+        self.skipped = 0
+        self.error = None
+
+    @contextlib.contextmanager
+    def measure(self, phase):
+        """
+        Measures the execution time of the phase.
+
+        :param phase: phase name ('fetch', 'parse' or 'write')
+        """
+
+        started_at = time.monotonic()
         try:
-            self.session.add(instance)
-            self.session.flush()
+            yield
+        finally:
+            attr = f'{phase}_time'
+            setattr(self, attr, getattr(self, attr) + time.monotonic() - started_at)
+
+    def add_write(self, elapsed, parsed, inserted, updated):
+        """
+        Accounts the database write batch.
+
+        :param elapsed: batch time
+        :param parsed: number of the rows passed to the batch
+        :param inserted: number of the inserted rows
+        :param updated: number of the updated rows
+        """
+
+        self.write_time += elapsed
+        self.parsed += parsed
+        self.inserted += inserted
+        self.updated += updated
+        self.skipped += parsed - inserted - updated
+
+    def as_dict(self):
+        """
+        :return: task telemetry as a json serializable dict
+        """
+
+        return dict(vars(self))
 
-        except sqlalchemy.exc.IntegrityError:
-            self.session.rollback()
-            instance = self.session.query(model).filter_by(**key_fields).first()
 
-            for key, value in data.items():
-                setattr(instance, key, value)
+class Telemetry:
+    """
+    Data fetching telemetry. Collects the task telemetries, logs the progress by the finished tickers
+    (a ticker is finished when all its tasks are finished) and builds the summary report.
+    """
+
+    TOTAL_FIELDS = (
+        'fetch_time', 'parse_time', 'write_time', 'requests', 'retries', 'bytes',
+        'parsed', 'inserted', 'updated', 'skipped',
+    )
+
+    def __init__(self, tickers, progress_interval=5.0):
+        """
+        :param tickers: ticker names to be fetched
+        :param progress_interval: minimal interval between the progress messages in seconds
+        """
+
+        self._lock = threading.Lock()
+        self._progress_interval = progress_interval
+        self._started_at = datetime.datetime.utcnow()
+        self._started = time.monotonic()
+        self._finished_at = None
+        self._elapsed = None
+        self._last_progress = self._started
+
+        self._tickers = list(dict.fromkeys(tickers))
+        self._pending = collections.Counter()
+        self._failed_tickers = set()
+        self._finished_tickers = 0
+        self._tasks = []
+
+    def add_task(self, ticker, kind, page=None):
+        """
+        Registers a new task.
+
+        :param ticker: ticker name
+        :param kind: task kind
+        :param page: trades page number
+        :return: task telemetry
+        """
+
+        with self._lock:
+            self._pending[ticker] += 1
+
+        return TaskStats(ticker, kind, page)
+
+    def finish_task(self, task, error=None):
+        """
+        Accounts the finished task and logs the progress if the progress interval has passed.
 
-        self.session.commit()
+        :param task: task telemetry
+        :param error: task error (None if succeeded)
+        """
+
+        if error is not None:
+            task.error = str(error)
+
+        with self._lock:
+            self._tasks.append(task)
+            if error is not None:
+                self._failed_tickers.add(task.ticker)
+
+            self._pending[task.ticker] -= 1
+            if self._pending[task.ticker] == 0:
+                self._finished_tickers += 1
+
+            now = time.monotonic()
+            if now - self._last_progress < self._progress_interval:
+                return
+            self._last_progress = now
+
+        self.log_progress()
+
+    def get_totals(self):
+        """
+        :return: dict of the task telemetry fields summed over the finished tasks
+        """
+
+        with self._lock:
+            tasks = list(self._tasks)
+
+        return {field: sum(getattr(task, field) for task in tasks) for field in self.TOTAL_FIELDS}
+
+    def get_written(self, kind):
+        """
+        :param kind: task kind
+        :return: number of the rows inserted or updated by the finished tasks of the kind
+        """
 
-        return instance
+        with self._lock:
+            tasks = [task for task in self._tasks if task.kind == kind]
+
+        return sum(task.inserted + task.updated for task in tasks)
+
+    def log_progress(self):
+        """
+        Logs the finished tickers count and the estimated time left.
+        """
+
+        elapsed = time.monotonic() - self._started
+        finished, total = self._finished_tickers, len(self._tickers)
+        totals = self.get_totals()
+
+        if finished:
+            eta = datetime.timedelta(seconds=round(elapsed / finished * (total - finished)))
+        else:
+            eta = 'unknown'
+
+        logger.info(
+            f"Progress: {finished}/{total} tickers ({finished / total if total else 1:.0%}), "
+            f"{totals['inserted'] + totals['updated']} rows written, {totals['bytes'] / 2 ** 20:.1f} MiB downloaded, "
+            f"ETA: {eta}"
+        )
+
+    def finish(self):
+        """
+        Finishes the fetching and logs the summary.
+        """
+
+        self._elapsed = time.monotonic() - self._started
+        self._finished_at = datetime.datetime.utcnow()
+        totals = self.get_totals()
+
+        logger.info(
+            f"Data fetching finished in {self._elapsed:.1f} s: {len(self._tickers)} tickers "
+            f"({len(self._failed_tickers)} failed), {totals['inserted']} rows inserted, {totals['updated']} updated, "
+            f"{totals['skipped']} skipped, {totals['bytes'] / 2 ** 20:.1f} MiB downloaded "
+            f"(fetch: {totals['fetch_time']:.1f} s, parse: {totals['parse_time']:.1f} s, "
+            f"write: {totals['write_time']:.1f} s, retries: {totals['retries']})"
+        )
+
+    def report(self):
+        """
+        Builds the summary report.
+
+        :return: json serializable dict
+        """
+
+        totals = self.get_totals()
+        elapsed = self._elapsed if self._elapsed is not None else time.monotonic() - self._started
+        written = totals['inserted'] + totals['updated']
+
+        with self._lock:
+            tasks = [task.as_dict() for task in self._tasks]
+
+        return dict(
+            started_at=self._started_at.isoformat(),
+            finished_at=self._finished_at.isoformat() if self._finished_at else None,
+            elapsed=elapsed,
+            tickers=len(self._tickers),
+            finished_tickers=self._finished_tickers,
+            failed_tickers=sorted(self._failed_tickers),
+            tasks_count=len(tasks),
+            failed_tasks=sum(1 for task in tasks if task['error'] is not None),
+            totals=totals,
+            throughput=dict(
+                tickers_per_second=self._finished_tickers / elapsed if elapsed else 0.0,
+                rows_written_per_second=written / elapsed if elapsed else 0.0,
+                bytes_per_second=totals['bytes'] / elapsed if elapsed else 0.0,
+                write_rows_per_second=written / totals['write_time'] if totals['write_time'] else 0.0,
+            ),
+            tasks=tasks,
+        )
+
+    def write_report(self, path):
+        """
+        Writes the summary report to the json file creating the parent directories if needed.
+
+        :param path: report file path
+        """
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, 'w') as file:
+            json.dump(self.report(), file, indent=2)
+
+        logger.info(f"Fetching report written to {path}")
+
+
+class RateLimiter:
+    """
+    Asynchronous rate limiter. Spreads the acquisitions evenly so that their rate doesn't exceed the limit.
+    """
+
+    def __init__(self, rate):
+        """
+        :param rate: maximum number of acquisitions per second (unlimited if None)
+        """
+
+        self._interval = 1.0 / rate if rate else 0.0
+        self._next_at = 0.0
+
+    async def acquire(self):
+        """
+        Waits until the next acquisition is allowed.
+        """
+
+        if not self._interval:
+            return
+
+        now = time.monotonic()
+        delay = self._next_at - now
+        self._next_at = max(now, self._next_at) + self._interval
+
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class AsyncFetcher(Fetcher):
+    """
+    Asynchronous nasdaq data fetcher. Pages are downloaded concurrently using a pooled http client
+    while the parsing and the database writes are executed on the thread pool.
+    """
+
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+    def __init__(self, max_workers, max_trades_pages=10, incremental=False, progress_interval=5.0,
+                 max_connections=8, rate_limit=None, max_retries=3, backoff=0.5):
+        """
+        :param max_workers: number of threads the parsing and the database writes to be executed on
+        :param max_trades_pages: maximum number of trades pages to parse
+        :param incremental: fetch only the data newer than the already stored one
+        :param progress_interval: minimal interval between the progress messages in seconds
+        :param max_connections: maximum number of simultaneous connections per host
+        :param rate_limit: maximum number of requests per second (unlimited if None)
+        :param max_retries: maximum number of request retries
+        :param backoff: retry backoff factor in seconds (the delay is doubled for every retry)
+        """
+
+        super().__init__(max_workers, max_trades_pages, incremental, progress_interval)
+
+        self._max_connections = max_connections
+        self._rate_limit = rate_limit
+        self._max_retries = max_retries
+        self._backoff = backoff
+
+    def fetch(self, tickers):
+        """
+        Executes nasdaq data fetching tasks using the event loop and waits for the result.
+
+        :param tickers: ticker names to fetch the information about
+        """
+
+        logger.info(
+            f"Fetching nasdaq data asynchronously using {self._max_connections} connections per host "
+            f"and {self._max_workers} threads"
+        )
+        self.telemetry = Telemetry(tickers, self._progress_interval)
+        asyncio.run(self._fetch(tickers))
+
+        self.telemetry.finish()
+
+    async def _fetch(self, tickers):
+        rate_limiter = RateLimiter(self._rate_limit)
+        connector = aiohttp.TCPConnector(limit_per_host=self._max_connections)
+
+        async with aiohttp.ClientSession(connector=connector) as http_session:
+            methods = {
+                self.fetch_history: self.fetch_history_async,
+                self.fetch_trades: self.fetch_trades_async,
+                self.fetch_new_trades: self.fetch_new_trades_async,
+            }
+            coroutines = [
+                self.run_task_async(task, methods[method], http_session, rate_limiter, *args)
+                for task, method, args in self.iter_tasks(tickers)
+            ]
+
+            for coroutine in asyncio.as_completed(coroutines):
+                try:
+                    result = await coroutine
+                except Exception as e:
+                    logger.error(f"Fetching task failed: {e}")
+                else:
+                    logger.info(f"Fetching task finished: {result}")
+
+    async def run_task_async(self, task, method, *args):
+        """
+        Executes the fetching task.
+
+        :param task: task telemetry
+        :param method: fetching coroutine method
+        :param args: method arguments
+        :return: result message
+        """
+
+        try:
+            result = await method(task, *args)
+        except Exception as e:
+            self.telemetry.finish_task(task, e)
+            raise
+
+        self.telemetry.finish_task(task)
+
+        return result
+
+    async def fetch_history_async(self, task, http_session, rate_limiter, ticker):
+        """
+        Fetches history information about the ticker
+
+        :param task: task telemetry
+        :param http_session: http client session
+        :param rate_limiter: requests rate limiter
+        :param ticker: ticker name
+        :return: result message
+        """
+
+        page_text = await self.get_page(task, http_session, rate_limiter, Parser.history_url(ticker))
+        history = await self.run_in_executor(self.parse, task, Parser.parse_history_page, ticker, page_text)
+
+        return await self.run_in_executor(self.store_history, task, ticker, history)
+
+    async def fetch_trades_async(self, task, http_session, rate_limiter, ticker, page):
+        """
+        Fetches trade information about the ticker
+
+        :param task: task telemetry
+        :param http_session: http client session
+        :param rate_limiter: requests rate limiter
+        :param ticker: ticker name
+        :param page: page number to parse
+        :return: result message
+        """
+
+        page_text = await self.get_page(task, http_session, rate_limiter, Parser.trades_url(ticker), page=page)
+        trades = await self.run_in_executor(self.parse, task, Parser.parse_trades_page, ticker, page, page_text)
+
+        return await self.run_in_executor(self.store_trades, task, ticker, page, trades)
+
+    async def fetch_new_trades_async(self, task, http_session, rate_limiter, ticker):
+        """
+        Fetches trade information about the ticker newer than the already stored one.
+        The pages are fetched one by one until a page contains only already stored trades.
+
+        :param task: task telemetry
+        :param http_session: http client session
+        :param rate_limiter: requests rate limiter
+        :param ticker: ticker name
+        :return: result message
+        """
+
+        known_trades = await self.run_in_executor(self.get_known_trades, ticker)
+        new_count, page = 0, 0
+
+        for page in range(1, self._max_trades_pages + 1):
+            page_text = await self.get_page(task, http_session, rate_limiter, Parser.trades_url(ticker), page=page)
+            trades = await self.run_in_executor(self.parse, task, Parser.parse_trades_page, ticker, page, page_text)
+
+            new_trades = known_trades.filter_new(trades)
+            task.skipped += len(trades) - len(new_trades)
+            if not new_trades:
+                break
+
+            await self.run_in_executor(self.store_trades, task, ticker, page, new_trades)
+            new_count += len(new_trades)
+
+        return f"{new_count} new trade items for '{ticker}' has been collected (pages: {page})"
+
+    @staticmethod
+    def parse(task, parse_method, *args):
+        """
+        Parses the page measuring the parsing time. Executed on the thread pool so the time spent
+        waiting for a free thread is not accounted.
+
+        :param task: task telemetry
+        :param parse_method: page parsing method
+        :param args: parsing method arguments
+        :return: parsed items
+        """
+
+        with task.measure('parse'):
+            return parse_method(*args)
+
+    async def get_page(self, task, http_session, rate_limiter, url, **params):
+        """
+        Downloads the page retrying on connection errors and temporary server errors with exponential backoff.
+        The download time includes the rate limiting delays and the retries.
+
+        :param task: task telemetry
+        :param http_session: http client session
+        :param rate_limiter: requests rate limiter
+        :param url: page url
+        :param params: query parameters
+        :return: page text
+        :raises aiohttp.ClientError if the page can't be downloaded
+        """
+
+        with task.measure('fetch'):
+            return await self._get_page(task, http_session, rate_limiter, url, **params)
+
+    async def _get_page(self, task, http_session, rate_limiter, url, **params):
+        for attempt in range(self._max_retries + 1):
+            await rate_limiter.acquire()
+            task.requests += 1
+            try:
+                async with http_session.get(url, params=params) as resp:
+                    if resp.status not in self.RETRY_STATUSES:
+                        resp.raise_for_status()
+                        body = await resp.read()
+                        task.bytes += len(body)
+                        return await resp.text()
+
+                    error = aiohttp.ClientResponseError(
+                        resp.request_info, resp.history, status=resp.status, message=resp.reason
+                    )
+
+            except aiohttp.ClientResponseError:
+                raise
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = e
+
+            if attempt < self._max_retries:
+                task.retries += 1
+                delay = self._backoff * 2 ** attempt
+                logger.warning(f"Request to {url} {params} failed ({error}), retrying in {delay:.1f} seconds")
+                await asyncio.sleep(delay)
+
+        raise error
+
+    async def run_in_executor(self, func, *args):
+        """
+        Executes the function on the thread pool.
+
+        :param func: function to be executed
+        :param args: function arguments
+        :return: function result
+        """
+
+        return await asyncio.get_event_loop().run_in_executor(self._executor, func, *args)
 
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Fetch data from nasdaq.')
-    parser.add_argument('-l', '--loglevel', dest='loglevel', choices=['debug', 'warning', 'info'], default='info', help='logging level')
-    parser.add_argument('-n', '--threads', dest='threads', type=int, default=4, help='number of threads the tasks to be executed on')
-    parser.add_argument('-p', '--max-pages', dest='pages', type=int, default=1, help='maxinum number of trade pages to parse')
+    parser.add_argument(
+        '-l', '--loglevel', dest='loglevel', choices=['debug', 'warning', 'info'], default='info', help='logging level'
+    )
+    parser.add_argument(
+        '-n', '--threads', dest='threads', type=int, default=4, help='number of threads the tasks to be executed on'
+    )
+    parser.add_argument(
+        '-p', '--max-pages', dest='pages', type=int, default=1, help='maxinum number of trade pages to parse'
+    )
     parser.add_argument('-t', '--tickers', dest='tickers', default='tickers.txt', help='tickers file')
+    parser.add_argument('-i', '--incremental', dest='incremental', action='store_true', help='fetch only new data')
+    parser.add_argument(
+        '-m', '--mode', dest='mode', choices=['threads', 'async'], default='threads', help='fetching mode'
+    )
+    parser.add_argument(
+        '--parser', dest='parser', choices=list(TABLE_EXTRACTORS), default='lxml', help='html table extraction backend'
+    )
+    parser.add_argument('--base-url', dest='base_url', default=Parser.BASE_URL, help='nasdaq site url')
+    parser.add_argument(
+        '--connections', dest='connections', type=int, default=8,
+        help='maximum number of connections per host (async mode)'
+    )
+    parser.add_argument(
+        '--rate-limit', dest='rate_limit', type=float, default=None,
+        help='maximum number of requests per second (async mode)'
+    )
+    parser.add_argument(
+        '--retries', dest='retries', type=int, default=3, help='maximum number of request retries (async mode)'
+    )
+    parser.add_argument(
+        '--progress-interval', dest='progress_interval', type=float, default=5.0,
+        help='progress logging interval in seconds'
+    )
+    parser.add_argument('--report', dest='report', default=None, help='json summary report file path')
+    parser.add_argument(
+        '--snapshot-dir', dest='snapshot_dir', default=app.config['QUOTE_SNAPSHOT_DIR'],
+        help='quote snapshots directory (not written if not set)'
+    )
 
     args = parser.parse_args()
 
@@ -311,5 +1421,38 @@ if __name__ == '__main__':
     with open(args.tickers) as file:
         tickers = [line.strip() for line in file.readlines()]
 
-    fetcher = Fetcher(max_workers=args.threads, max_trades_pages=args.pages)
+    Parser.BASE_URL = args.base_url.rstrip('/')
+    Parser.TABLE_EXTRACTOR = TABLE_EXTRACTORS[args.parser]
+
+    if args.mode == 'async':
+        fetcher = AsyncFetcher(
+            max_workers=args.threads,
+            max_trades_pages=args.pages,
+            incremental=args.incremental,
+            progress_interval=args.progress_interval,
+            max_connections=args.connections,
+            rate_limit=args.rate_limit,
+            max_retries=args.retries,
+        )
+    else:
+        fetcher = Fetcher(
+            max_workers=args.threads,
+            max_trades_pages=args.pages,
+            incremental=args.incremental,
+            progress_interval=args.progress_interval,
+        )
+
     fetcher.fetch(tickers)
+
+    if fetcher.telemetry.get_written('history'):
+        started_at = time.monotonic()
+        analytics.refresh_price_view()
+        data_version.bump()
+        logger.info(f"Quote price view refreshed in {time.monotonic() - started_at:.2f}s")
+
+    if args.report:
+        fetcher.telemetry.write_report(args.report)
+
+    if args.snapshot_dir:
+        count = store.write_snapshots(args.snapshot_dir)
+        logger.info(f"{count} quote snapshots written to {args.snapshot_dir}")
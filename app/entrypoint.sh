@@ -13,7 +13,7 @@ done
 
 
 echo 'Fetching data from https://www.nasdaq.com'
-python data_fetcher.py --threads ${FETCHER_WORKERS} --max-pages ${MAX_PAGES:-10} -t './tickers.txt' --loglevel info
+python data_fetcher.py --incremental --mode ${FETCHER_MODE:-threads} --threads ${FETCHER_WORKERS} --max-pages ${MAX_PAGES:-10} -t './tickers.txt' --loglevel info --report ${FETCHER_REPORT:-/tmp/stocks-app/fetcher-report.json}
 if [ $? -ne 0 ]; then
     echo 'Nasdaq data fetching failed'
     exit 1
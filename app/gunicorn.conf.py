@@ -1,9 +1,45 @@
 """
-gunicorn wsgi server configuration.
+gunicorn wsgi server configuration. The worker class is set by 'HTTP_WORKER_CLASS' environment variable:
+
+    - 'sync' (default): a worker process handles a single request at a time
+    - 'gthread': a worker process handles up to 'HTTP_THREADS' requests concurrently using threads
+    - 'gevent': a worker process handles up to 'HTTP_WORKER_CONNECTIONS' requests concurrently using greenlets
+
+The database connection pool size (see 'DB_POOL_SIZE' and 'DB_POOL_MAX_OVERFLOW') should cover the worker concurrency.
+
+The concurrent workers only help while the requests wait for the database. The NumPy analytics and the delta engine
+are CPU-bound: a greenlet doesn't yield until the calculation is over and the threads contend for the GIL, so
+a heavy calculation still holds a whole gevent worker (and slows down a gthread one). These calculations are bounded
+by 'ANALYTICS_MAX_PAIRS' and 'DELTA_MAX_ROWS' instead of the statement timeout, scale them with 'HTTP_WORKERS'.
 """
 
 import multiprocessing
 import os
 
+WORKER_CLASSES = ('sync', 'gthread', 'gevent')
+
 port = os.environ.get('PORT', '8080')
 workers = os.environ.get('HTTP_WORKERS', multiprocessing.cpu_count())
+worker_class = os.environ.get('HTTP_WORKER_CLASS', 'sync')
+threads = int(os.environ.get('HTTP_THREADS', 4))
+worker_connections = int(os.environ.get('HTTP_WORKER_CONNECTIONS', 100))
+
+if worker_class not in WORKER_CLASSES:
+    raise ValueError(f"unsupported worker class '{worker_class}', expected one of: {', '.join(WORKER_CLASSES)}")
+
+
+def post_worker_init(worker):
+    """
+    Makes psycopg2 cooperative for gevent workers and warms up the worker identifier caches
+    so that the first requests don't load them.
+    """
+
+    if worker_class == 'gevent':
+        import psycopg2.extensions
+        import psycopg2.extras
+        # libpq blocks the whole process while waiting for the database, the wait callback
+        # waits with the select function patched by gevent yielding to the other greenlets
+        psycopg2.extensions.set_wait_callback(psycopg2.extras.wait_select)
+
+    from app import id_cache
+    id_cache.warm()
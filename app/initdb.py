@@ -1,7 +1,12 @@
 """
-Database initialization script. Should be executed on application startup.
+Database initialization script. Applies database schema migrations. Should be executed on application startup.
 """
 
-from app import db
+import os
 
-db.create_all()
+from alembic import command
+from alembic import config
+
+
+alembic_config = config.Config(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'alembic.ini'))
+command.upgrade(alembic_config, 'head')
@@ -0,0 +1,43 @@
+"""
+Alembic migrations environment. Uses the application database engine and models metadata.
+"""
+
+import logging.config
+
+from alembic import context
+
+from app import db
+
+
+config = context.config
+if config.config_file_name is not None:
+    logging.config.fileConfig(config.config_file_name, disable_existing_loggers=False)
+
+
+def run_migrations_offline():
+    """
+    Emits migrations SQL to the script output without connecting to the database.
+    """
+
+    context.configure(url=str(db.engine.url), target_metadata=db.metadata, literal_binds=True)
+
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_online():
+    """
+    Applies migrations to the database.
+    """
+
+    with db.engine.connect() as connection:
+        context.configure(connection=connection, target_metadata=db.metadata)
+
+        with context.begin_transaction():
+            context.run_migrations()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
@@ -0,0 +1,74 @@
+"""
+Initial schema.
+
+Tables are created only if they don't exist so that the databases initialized by
+'db.create_all()' before the migrations were introduced are adopted as is.
+
+Revision ID: 0001
+Revises:
+Create Date: 2019-04-15 12:00:00
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    existing_tables = set(sa.inspect(op.get_bind()).get_table_names())
+
+    if 'stock' not in existing_tables:
+        op.create_table(
+            'stock',
+            sa.Column('id', sa.Integer, primary_key=True),
+            sa.Column('ticker', sa.String(5), unique=True, nullable=False),
+        )
+
+    if 'quote' not in existing_tables:
+        op.create_table(
+            'quote',
+            sa.Column('id', sa.Integer, primary_key=True),
+            sa.Column('stock_id', sa.Integer, sa.ForeignKey('stock.id', onupdate='cascade'), nullable=False),
+            sa.Column('date', sa.Date, nullable=False),
+            sa.Column('open_price', sa.Float, nullable=False),
+            sa.Column('close_price', sa.Float, nullable=False),
+            sa.Column('high_price', sa.Float, nullable=False),
+            sa.Column('low_price', sa.Float, nullable=False),
+            sa.Column('volume', sa.Float, nullable=False),
+            sa.UniqueConstraint('stock_id', 'date'),
+        )
+
+    if 'insider' not in existing_tables:
+        op.create_table(
+            'insider',
+            sa.Column('id', sa.Integer, primary_key=True),
+            sa.Column('name', sa.String(100), unique=True, nullable=False),
+            sa.Column('relation', sa.String(50), nullable=False),
+        )
+
+    if 'trade' not in existing_tables:
+        op.create_table(
+            'trade',
+            sa.Column('id', sa.Integer, primary_key=True),
+            sa.Column('stock_id', sa.Integer, sa.ForeignKey('stock.id', onupdate='cascade'), nullable=False),
+            sa.Column('insider_id', sa.Integer, sa.ForeignKey('insider.id', onupdate='cascade'), nullable=False),
+            sa.Column('transaction_type', sa.String(100), nullable=False),
+            sa.Column('owner_type', sa.Enum('direct', 'indirect', name='ownertype'), nullable=False),
+            sa.Column('last_date', sa.Date, nullable=False),
+            sa.Column('shares_traded', sa.Integer, nullable=False),
+            sa.Column('last_price', sa.Float, nullable=True),
+            sa.Column('shares_hold', sa.Integer, nullable=False),
+        )
+
+
+def downgrade():
+    op.drop_table('trade')
+    op.drop_table('insider')
+    op.drop_table('quote')
+    op.drop_table('stock')
+    sa.Enum(name='ownertype').drop(op.get_bind())
@@ -0,0 +1,48 @@
+"""
+Trade natural key.
+
+Removes duplicated trades keeping the earliest stored ones
+and creates the natural key unique index.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2019-04-15 12:10:00
+"""
+
+from alembic import op
+
+
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute('''
+        DELETE FROM trade
+        WHERE id IN (
+            SELECT id
+            FROM (
+                SELECT id,
+                       row_number() OVER (
+                           PARTITION BY stock_id, insider_id, last_date, transaction_type,
+                                        owner_type, shares_traded, last_price, shares_hold
+                           ORDER BY id
+                       ) AS row_number
+                FROM trade
+            ) numbered
+            WHERE row_number > 1
+        )
+    ''')
+
+    # the index could be already created by the 'compact_trades.py' script
+    op.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS ix_trade_natural_key
+        ON trade (stock_id, insider_id, last_date, transaction_type,
+                  owner_type, shares_traded, coalesce(last_price, -1), shares_hold)
+    ''')
+
+
+def downgrade():
+    op.drop_index('ix_trade_natural_key', table_name='trade')
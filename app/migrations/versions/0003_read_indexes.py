@@ -0,0 +1,36 @@
+"""
+Read path indexes.
+
+* ix_quote_stock_id_date_prices - covers quote reads by stock ordered by date
+  ('/<ticker>', analytics and delta price series) allowing index-only scans
+* ix_trade_stock_id_last_date - trade reads by stock ordered by date ('/<ticker>/insider')
+  and the latest trade date lookups of the incremental fetcher
+
+Trade reads by stock and insider ('/<ticker>/insider/<name>') are served by the natural key index prefix.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2019-04-15 12:20:00
+"""
+
+from alembic import op
+
+
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(
+        'ix_quote_stock_id_date_prices',
+        'quote',
+        ['stock_id', 'date', 'open_price', 'close_price', 'high_price', 'low_price', 'volume'],
+    )
+    op.create_index('ix_trade_stock_id_last_date', 'trade', ['stock_id', 'last_date'])
+
+
+def downgrade():
+    op.drop_index('ix_trade_stock_id_last_date', table_name='trade')
+    op.drop_index('ix_quote_stock_id_date_prices', table_name='quote')
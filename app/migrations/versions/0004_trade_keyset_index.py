@@ -0,0 +1,28 @@
+"""
+Trade keyset index.
+
+Trades are paginated by (last_date, id) keys so the id is added to the trade reads index
+to serve the keyset pagination ordering and cursor conditions.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2019-04-22 12:00:00
+"""
+
+from alembic import op
+
+
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_trade_stock_id_last_date_id', 'trade', ['stock_id', 'last_date', 'id'])
+    op.drop_index('ix_trade_stock_id_last_date', table_name='trade')
+
+
+def downgrade():
+    op.create_index('ix_trade_stock_id_last_date', 'trade', ['stock_id', 'last_date'])
+    op.drop_index('ix_trade_stock_id_last_date_id', table_name='trade')
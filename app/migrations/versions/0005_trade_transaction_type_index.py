@@ -0,0 +1,31 @@
+"""
+Trade transaction type index.
+
+Serves trade reads by stock filtered by transaction type and date range ('/<ticker>/insider?transaction_type=...')
+keeping the keyset pagination ordering. Quote and insider trade date ranges are served by the existing
+ix_quote_stock_id_date_prices and ix_trade_natural_key indexes.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2019-04-24 12:00:00
+"""
+
+from alembic import op
+
+
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(
+        'ix_trade_stock_id_transaction_type_last_date_id',
+        'trade',
+        ['stock_id', 'transaction_type', 'last_date', 'id'],
+    )
+
+
+def downgrade():
+    op.drop_index('ix_trade_stock_id_transaction_type_last_date_id', table_name='trade')
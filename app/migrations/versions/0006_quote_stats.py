@@ -0,0 +1,43 @@
+"""
+Quote statistics.
+
+Creates the table of the derived quote statistics maintained by the data fetcher.
+The statistics of the already stored quotes are computed by the next fetcher run.
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2019-04-29 12:00:00
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'quote_stats',
+        sa.Column('id', sa.Integer, primary_key=True),
+        sa.Column('stock_id', sa.Integer, sa.ForeignKey('stock.id', onupdate='cascade'), nullable=False),
+        sa.Column('date', sa.Date, nullable=False),
+        sa.Column('price_type', sa.Enum('open', 'close', 'low', 'high', name='pricetype'), nullable=False),
+        sa.Column('price', sa.Float, nullable=False),
+        sa.Column('daily_return', sa.Float, nullable=True),
+        sa.Column('rolling_mean', sa.Float, nullable=False),
+        sa.Column('rolling_std', sa.Float, nullable=True),
+        sa.Column('running_max', sa.Float, nullable=False),
+        sa.Column('running_min', sa.Float, nullable=False),
+        sa.Column('max_drawdown', sa.Float, nullable=False),
+        sa.Column('max_abs_return', sa.Float, nullable=True),
+        sa.UniqueConstraint('stock_id', 'date', 'price_type'),
+    )
+
+
+def downgrade():
+    op.drop_table('quote_stats')
+    sa.Enum(name='pricetype').drop(op.get_bind())
@@ -0,0 +1,39 @@
+"""
+Quote price series materialized view.
+
+Keeps the quote prices in the long format (stock_id, date, price_type, price) the SQL analytics backend
+self-joins so the series is not rebuilt from the whole quote table on every request. The view is refreshed
+by the data fetcher after the ingestion, the unique index allows concurrent refreshes.
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2019-05-06 12:00:00
+"""
+
+from alembic import op
+
+
+revision = '0007'
+down_revision = '0006'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute('''
+        CREATE MATERIALIZED VIEW quote_price AS
+        SELECT stock_id, date, 'open'::text AS price_type, open_price AS price FROM quote
+        UNION ALL
+        SELECT stock_id, date, 'close'::text AS price_type, close_price AS price FROM quote
+        UNION ALL
+        SELECT stock_id, date, 'high'::text AS price_type, high_price AS price FROM quote
+        UNION ALL
+        SELECT stock_id, date, 'low'::text AS price_type, low_price AS price FROM quote
+    ''')
+    op.create_index(
+        'ix_quote_price_stock_id_price_type_date', 'quote_price', ['stock_id', 'price_type', 'date'], unique=True
+    )
+
+
+def downgrade():
+    op.execute('DROP MATERIALIZED VIEW quote_price')
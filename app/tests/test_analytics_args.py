@@ -0,0 +1,39 @@
+"""
+Analytics request parameters validation. The out of range parameters are rejected before the stock is resolved
+so the tests don't need the database:
+
+    python -m unittest discover tests
+"""
+
+import unittest
+
+from app import analytics
+from app import app
+
+
+class AnalyticsArgsTestCase(unittest.TestCase):
+    """
+    Analytics request parameters range checks.
+    """
+
+    URL = '/api/AAPL/analytics?date_from=2019-01-01&date_to=2019-04-01'
+
+    def setUp(self):
+        self.client = app.test_client()
+
+    def assert_rejected(self, query):
+        response = self.client.get(f'{self.URL}&{query}')
+        self.assertEqual(response.status_code, 422, query)
+
+    def test_top_out_of_range(self):
+        self.assert_rejected('top=0')
+        self.assert_rejected(f"top={app.config['ANALYTICS_MAX_TOP'] + 1}")
+
+    def test_max_span_days_out_of_range(self):
+        self.assert_rejected('max_span_days=0')
+        self.assert_rejected(f'max_span_days={analytics.MAX_SPAN_DAYS + 1}')
+        self.assert_rejected(f'max_span_days={10 ** 19}')
+
+
+if __name__ == '__main__':
+    unittest.main()